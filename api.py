@@ -0,0 +1,329 @@
+"""Headless HTTP/JSON API over the NL→SQL pipeline, served by several worker processes.
+
+    python api.py --port 8000 --workers 4
+    curl -s localhost:8000/query -d '{"question": "How many students are there?"}'
+
+Endpoints (JSON in, JSON out):
+
+* ``POST /query`` {"question", "db"?, "limit"?, "approximate"?, "context"?}: the same
+  steps as the app (NL cache, template fast path, prompt with retrieved
+  examples, generation, guarded execution, repair) returning the SQL, where
+  it came from, the first page of rows and ``next``, the body to POST to
+  /rows for the following page (absent on the last page). ``context`` is
+  the previous answer's {"question", "sql"}: follow-ups such as "sorted by
+  GPA" are then resolved against it, as in the app (conversation.py).
+* ``POST /rows`` {"sql", "db"?, "offset", "limit"?, "approximate"?}: one page
+  of a query, run through the same guard as generated SQL.
+* ``GET /health`` and ``GET /stats`` (this worker's caches, quota, latencies).
+
+The server keeps no per-client state, so any worker can answer any request.
+The parent process binds the socket and forks ``--workers`` processes that
+all accept on it, each with its own pools and caches; pandas/SQLite work
+then uses as many cores as there are workers. What must be shared lives in
+local files: the NL cache and few-shot store (SQLite, already shared) and
+the LLM quota (``NL2SQL_RATE_LIMIT_DB``, default rate_limit.db next to this
+file). Without ``os.fork`` (Windows) a single process serves.
+
+Load-test it with loadtest.py.
+"""
+import argparse
+import json
+import math
+import os
+import signal
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import approximate
+import nl_cache
+from conversation import Turn, follow_up_text, is_follow_up, resolve
+from backends import available_databases, backend_for, dialect_hint
+from fast_path import get_matcher, match_question
+from few_shot import get_example_store
+from llm_client import get_client
+from nl2sql import get_genai_response
+from prompt_builder import PROMPT_TEMPLATE, build_prompt, build_refinement_prompt
+from result_cache import get_result_cache
+from results import RESULT_PAGE_SIZE, RESULT_ROW_CAP, read_sql_page
+from schema_catalog import get_catalog
+from sql_repair import repair
+from telemetry import get_telemetry, span
+
+DEFAULT_RATE_LIMIT_DB = Path(__file__).parent / "rate_limit.db"
+# Longer than this for an LLM token and the request is answered 429 instead of queued
+MAX_LLM_WAIT_SECONDS = float(os.getenv("NL2SQL_API_MAX_LLM_WAIT", "8"))
+MAX_BODY_BYTES = 64 * 1024
+
+
+class APIError(Exception):
+    """A request that gets an error status instead of a result"""
+
+    def __init__(self, status, message, **extra):
+        super().__init__(message)
+        self.status = status
+        self.payload = {'error': message, **extra}
+
+
+def _database(db):
+    """The requested database, if it is one the server offers (clients cannot open arbitrary files)"""
+    databases = available_databases() or ["student.db"]
+    if db is None:
+        return databases[0]
+    if db not in databases:
+        raise APIError(400, f"Unknown database {db!r}.", databases=databases)
+    return db
+
+
+def _limit(value):
+    try:
+        limit = int(value) if value is not None else RESULT_PAGE_SIZE
+    except (TypeError, ValueError):
+        raise APIError(400, "limit must be an integer.")
+    return max(1, min(limit, RESULT_ROW_CAP))
+
+
+def run_page(sql, db, offset, limit, approximate_mode=False):
+    """(page, ApproximateQuery or None) for rows [offset, offset + limit) of ``sql``"""
+    approx = approximate.rewrite(sql, db) if approximate_mode else None
+    page = read_sql_page(approx.sql if approx else sql, db, offset=offset, limit=limit)
+    if approx and not page.error:
+        return approximate.finish(approx, page), approx
+    return page, None
+
+
+def _page_payload(sql, db, page, approx, offset, limit, approximate_mode):
+    payload = {
+        'columns': page.columns,
+        'rows': page.rows,
+        'has_more': page.has_more,
+        'error': page.error,
+    }
+    if approx:
+        payload['approximate'] = {'sample_table': approx.sample_table, 'table': approx.table,
+                                  'rate': approx.rate, 'sample_sql': approx.sql}
+    if page.has_more and offset + len(page.rows) < RESULT_ROW_CAP:
+        payload['next'] = {'sql': sql, 'db': db, 'offset': offset + len(page.rows), 'limit': limit,
+                           'approximate': approximate_mode}
+    return payload
+
+
+def _turn(context, db):
+    """The previous answer a follow-up refines, from the request's ``context``"""
+    if context is None:
+        return None
+    if not isinstance(context, dict) or not all(isinstance(context.get(k), str) for k in ("question", "sql")):
+        raise APIError(400, 'context must be {"question": ..., "sql": ...} from an earlier answer.')
+    return Turn(context['question'], context['sql'], db)
+
+
+def answer_question(question, db=None, limit=None, approximate_mode=False, context=None):
+    """Translate and run one question; returns the /query response body"""
+    db, limit = _database(db), _limit(limit)
+    turn = _turn(context, db)
+    follow_up = follow_up_text(question) if turn and is_follow_up(question) else None
+    asked = resolve(turn, question) if follow_up else question
+    telemetry = get_telemetry()
+    with telemetry.trace():
+        catalog = get_catalog(db)
+        table_structure = catalog.table_structure()
+        cache_key = nl_cache.fingerprint(PROMPT_TEMPLATE + dialect_hint(db), table_structure)
+        query_cache = nl_cache.get_cache()
+        with span("cache") as attributes:
+            cached = query_cache.get(asked, cache_key)
+            attributes['outcome'] = cached[1] if cached else 'miss'
+        fast = None if cached else match_question(asked, db)
+        prompt = None
+        if cached:
+            sql, source = cached[0], f"cache_{cached[1]}"
+        elif fast:
+            sql, source = fast.sql, "fast_path"
+        else:
+            wait = get_client().limiter.wait_time()
+            if wait > MAX_LLM_WAIT_SECONDS:
+                retry_after = math.ceil(wait)
+                raise APIError(429, f"LLM quota exhausted; retry in {retry_after}s.", retry_after=retry_after)
+            with span("prompt"):
+                if follow_up:
+                    prompt = build_refinement_prompt(turn.question, turn.sql, follow_up, table_structure,
+                                                     catalog.relationships(), dialect=backend_for(db))
+                else:
+                    examples = get_example_store(db).search(question)
+                    prompt = build_prompt(question, table_structure, catalog.relationships(), examples,
+                                          dialect=backend_for(db))
+            sql, source = get_genai_response(follow_up or question, prompt), "llm"
+            if sql.startswith("❌"):
+                raise APIError(502, sql.lstrip("❌ "))
+
+        page, approx = run_page(sql, db, 0, limit, approximate_mode)
+        repairs = []
+        if page.error and source == "llm":
+            # Local fixes first; the model only sees the error if they all fail
+            sql, page, repairs = repair(asked, sql, page, db, prompt=prompt)
+        if source == "llm" and not page.error:
+            query_cache.put(asked, cache_key, sql)
+            get_example_store(db).add(asked, sql)
+
+    payload = {'question': asked, 'follow_up': follow_up, 'db': db, 'sql': sql, 'source': source,
+               'repairs': repairs}
+    payload.update(_page_payload(sql, db, page, approx, 0, limit, approximate_mode))
+    return payload
+
+
+def read_rows(sql, db=None, offset=0, limit=None, approximate_mode=False):
+    """One page of ``sql``; returns the /rows response body"""
+    db, limit = _database(db), _limit(limit)
+    try:
+        offset = max(int(offset or 0), 0)
+    except (TypeError, ValueError):
+        raise APIError(400, "offset must be an integer.")
+    page, approx = run_page(sql, db, offset, limit, approximate_mode)
+    payload = {'sql': sql, 'db': db, 'offset': offset}
+    payload.update(_page_payload(sql, db, page, approx, offset, limit, approximate_mode))
+    return payload
+
+
+def worker_stats():
+    """This worker's view of the shared quota and its own caches and latencies"""
+    histograms = get_telemetry().histograms()
+    matcher_hits = {db: get_matcher(db).stats for db in available_databases()}
+    return {
+        'pid': os.getpid(),
+        'quota_available': round(get_client().limiter.available(), 2),
+        'llm': dict(get_client().stats),
+        'nl_cache': dict(nl_cache.get_cache().stats),
+        'fast_path': matcher_hits,
+        'result_cache': get_result_cache().summary(),
+        'latency_ms': {
+            stage: {'count': histogram.count, 'mean': round(histogram.sum / histogram.count, 3),
+                    'p95_le': histogram.quantile(0.95)}
+            for stage, histogram in sorted(histograms.items())
+        },
+    }
+
+
+class APIHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so a client's requests do not each pay for a new connection
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status, payload, headers=()):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise APIError(413, "Request body too large.")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise APIError(400, "Request body must be JSON.")
+        if not isinstance(body, dict):
+            raise APIError(400, "Request body must be a JSON object.")
+        return body
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, {'status': 'ok', 'pid': os.getpid()})
+        elif self.path == "/stats":
+            self._send(200, worker_stats())
+        else:
+            self._send(404, {'error': f"No route {self.path}"})
+
+    def do_POST(self):
+        try:
+            body = self._body()
+            if self.path == "/query":
+                question = str(body.get("question") or "").strip()
+                if not question:
+                    raise APIError(400, "question is required.")
+                payload = answer_question(question, body.get("db"), body.get("limit"),
+                                          bool(body.get("approximate")), body.get("context"))
+            elif self.path == "/rows":
+                if not body.get("sql"):
+                    raise APIError(400, "sql is required.")
+                payload = read_rows(str(body["sql"]), body.get("db"), body.get("offset"), body.get("limit"),
+                                    bool(body.get("approximate")))
+            else:
+                raise APIError(404, f"No route {self.path}")
+        except APIError as e:
+            headers = [("Retry-After", str(e.payload['retry_after']))] if 'retry_after' in e.payload else []
+            self._send(e.status, e.payload, headers)
+            return
+        except Exception as e:
+            self._send(500, {'error': f"{type(e).__name__}: {e}"})
+            return
+        payload['worker'] = os.getpid()
+        self._send(200, payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host="127.0.0.1", port=8000, workers=os.cpu_count() or 1):
+    """Bind ``host:port`` and serve it from ``workers`` forked processes (blocks)"""
+    os.environ.setdefault("NL2SQL_RATE_LIMIT_DB", str(DEFAULT_RATE_LIMIT_DB))
+    server = ThreadingHTTPServer((host, port), APIHandler)
+    # Nothing process-wide (pools, clients, caches) exists yet, so every child starts clean
+    if workers <= 1 or not hasattr(os, "fork"):
+        print(f"Serving on http://{host}:{server.server_address[1]} (1 process)", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os._exit(0)
+        children.append(pid)
+    print(f"Serving on http://{host}:{server.server_address[1]} ({workers} worker processes)", flush=True)
+
+    def stop(signum, frame):
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for child in children:
+            os.waitpid(child, 0)
+    except KeyboardInterrupt:
+        stop(None, None)
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the NL→SQL pipeline as an HTTP/JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (default: cores)")
+    args = parser.parse_args(argv)
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent / ".env")
+    serve(args.host, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,28 +2,43 @@
 import streamlit as st
 st.set_page_config(page_title="NL2SQL with Generative AI", layout="wide")
 
-# ✅ Other imports
+# ✅ Other imports (google.generativeai and pandas are imported on first use, not at startup)
 from dotenv import load_dotenv
 from pathlib import Path
 import os
-import sqlite3
-import google.generativeai as genai
 import time
-import pandas as pd
 from datetime import datetime, timedelta
-
-# ✅ Load .env
-dotenv_path = Path(__file__).parent / ".env"
-load_dotenv(dotenv_path, override=True)
+import nl_cache
+import approximate
+from backends import available_databases, backend_for, dialect_hint
+from schema_catalog import get_catalog
+from prompt_builder import PROMPT_TEMPLATE, build_prompt, build_refinement_prompt
+from llm_client import REQUESTS_PER_MINUTE, get_client
+from nl2sql import stream_genai_response
+from results import (RESULT_PAGE_SIZE, RESULT_ROW_CAP, as_arrow_page, concat_arrow, read_sql_arrow, read_sql_page,
+                     export_csv, export_parquet)
+from result_cache import get_result_cache
+from index_advisor import advise
+from fast_path import get_matcher, match_question
+from few_shot import get_example_store
+from sql_repair import RepairRequest, repair_stats
+from query_jobs import get_job_queue
+from telemetry import LATENCY_BUCKETS_MS, approx_tokens, get_telemetry, span
+from conversation import RECENT_FOLLOW_UPS, Turn, follow_up_text, get_prefetcher, is_follow_up, resolve
+
+# ✅ Load .env (once per process; the Gemini client reads GOOGLE_API_KEY when it is first created)
+@st.cache_resource
+def load_environment():
+    load_dotenv(Path(__file__).parent / ".env", override=True)
+
+load_environment()
 
 # ✅ Load API key
 API_KEY = os.getenv("GOOGLE_API_KEY")
-if not API_KEY:
+if not API_KEY and not os.getenv("NL2SQL_LLM_URL"):
     st.error("API key not found. Please add it to your .env file as GOOGLE_API_KEY.")
     st.stop()
 
-genai.configure(api_key=API_KEY)
-
 # ✅ Initialize session state for rate limiting
 if 'last_request_time' not in st.session_state:
     st.session_state.last_request_time = None
@@ -31,200 +46,283 @@ if 'request_count' not in st.session_state:
     st.session_state.request_count = 0
 if 'request_history' not in st.session_state:
     st.session_state.request_history = []
+if 'active_result' not in st.session_state:
+    st.session_state.active_result = None
+if 'pending_query' not in st.session_state:
+    st.session_state.pending_query = None
+# Last answered question and SQL, which follow-up questions refine
+if 'conversation' not in st.session_state:
+    st.session_state.conversation = None
+if 'follow_ups' not in st.session_state:
+    st.session_state.follow_ups = []
+
+# ✅ Database selection (SQLite or DuckDB file; each has its own pool, catalog and prompt dialect)
+def cancel_pending_query():
+    """Interrupt this session's running query job, if any"""
+    pending = st.session_state.pending_query
+    if pending:
+        pending['job'].cancel()
+
+def on_database_change():
+    cancel_pending_query()
+    st.session_state.active_result = None
+
+def reset_conversation():
+    """Treat the next question as a new one, not a follow-up"""
+    st.session_state.conversation = None
+
+DATABASES = available_databases() or ["student.db"]
+DB_PATH = st.sidebar.selectbox(
+    "🗄️ Database", DATABASES, key="database", on_change=on_database_change,
+    format_func=lambda name: f"{name} ({backend_for(name)})"
+)
+DB_BACKEND = backend_for(DB_PATH)
 
 # ✅ Database functions
 def get_table_structure(db_path="student.db"):
     """Get information about table structure only - no actual data"""
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
     try:
-        # Get all table names
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = [table[0] for table in cursor.fetchall()]
-        
-        table_structure = {}
-        for table in tables:
-            # Get column information with types and constraints
-            cursor.execute(f"PRAGMA table_info({table});")
-            columns = cursor.fetchall()
-            
-            # Get foreign key information
-            cursor.execute(f"PRAGMA foreign_key_list({table});")
-            foreign_keys = cursor.fetchall()
-            
-            # Get index information (to identify additional keys)
-            cursor.execute(f"PRAGMA index_list({table});")
-            indexes = cursor.fetchall()
-            
-            # Get row count only (no actual data)
-            cursor.execute(f"SELECT COUNT(*) FROM {table};")
-            row_count = cursor.fetchone()[0]
-            
-            table_structure[table] = {
-                'columns': columns,
-                'foreign_keys': foreign_keys,
-                'indexes': indexes,
-                'row_count': row_count
-            }
-        
-        conn.close()
-        return table_structure
+        # Served from the process-wide catalog; re-introspected only when SQLite reports a change
+        with span("schema") as attributes:
+            table_structure = get_catalog(db_path).table_structure()
+            attributes['tables'] = len(table_structure)
+            return table_structure
     except Exception as e:
-        conn.close()
         return {}
 
 def get_table_relationships(db_path="student.db"):
     """Get foreign key relationships between tables"""
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    relationships = []
-    
     try:
-        # Get all table names
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = [table[0] for table in cursor.fetchall()]
-        
-        for table in tables:
-            # Get foreign key information
-            cursor.execute(f"PRAGMA foreign_key_list({table});")
-            foreign_keys = cursor.fetchall()
-            
-            for fk in foreign_keys:
-                relationships.append({
-                    'from_table': table,
-                    'from_column': fk[3],  # from column
-                    'to_table': fk[2],     # to table
-                    'to_column': fk[4]     # to column
-                })
-    
+        return get_catalog(db_path).relationships()
     except Exception as e:
-        pass
-    
-    conn.close()
-    return relationships
+        return []
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def get_schema_view(db_path, version):
+    """Arrow tables shown in the structure tab, built once per database and catalog version"""
+    import pyarrow as pa
+
+    table_structure = get_table_structure(db_path)
+    overview = pa.Table.from_pylist([
+        {
+            "Table": table_name.upper(),
+            "Columns": len(info['columns']),
+            "Records": info['row_count'],  # Just count, no actual data
+            "Primary Keys": len([col for col in info['columns'] if col[5]]),
+            "Foreign Keys": len(info['foreign_keys'])
+        }
+        for table_name, info in table_structure.items()
+    ])
+    relationships = pa.Table.from_pylist([
+        {
+            "From Table": rel['from_table'].upper(),
+            "From Column": rel['from_column'],
+            "To Table": rel['to_table'].upper(),
+            "To Column": rel['to_column'],
+            "Relationship": f"{rel['from_table']}.{rel['from_column']} → {rel['to_table']}.{rel['to_column']}"
+        }
+        for rel in get_table_relationships(db_path)
+    ])
+    tables = {}
+    for table_name, info in table_structure.items():
+        columns = pa.Table.from_pylist([
+            {
+                "Column Name": col[1],
+                "Data Type": col[2],
+                "Primary Key": "✅ Yes" if col[5] else "❌ No",
+                "Not Null": "✅ Yes" if col[3] else "❌ No",
+                "Default Value": str(col[4]) if col[4] else "None"
+            }
+            for col in info['columns']
+        ])
+        foreign_keys = pa.Table.from_pylist([
+            {
+                "Column": fk[3],
+                "References Table": fk[2],
+                "References Column": fk[4],
+                "Relationship": f"{fk[3]} → {fk[2]}.{fk[4]}"
+            }
+            for fk in info['foreign_keys']
+        ])
+        tables[table_name] = (columns, foreign_keys)
+    return overview, relationships, tables
 
 # ✅ Rate limiting function
+# Short waits for a shared-quota token are absorbed by the LLM client; longer ones are reported
+MAX_QUEUE_WAIT_SECONDS = 8
+
 def check_rate_limit():
-    """Check if we can make a request based on rate limits"""
-    now = datetime.now()
-    
-    # Clean old requests (older than 1 minute)
-    st.session_state.request_history = [
-        req_time for req_time in st.session_state.request_history 
-        if now - req_time < timedelta(minutes=1)
-    ]
-    
-    # Check if we've exceeded 15 requests per minute (free tier limit)
-    if len(st.session_state.request_history) >= 15:
-        return False, "Rate limit exceeded. Please wait a minute before making another request."
-    
-    # Check if we need to wait between requests (minimum 4 seconds)
-    if st.session_state.last_request_time:
-        time_since_last = now - st.session_state.last_request_time
-        if time_since_last < timedelta(seconds=4):
-            wait_time = 4 - time_since_last.total_seconds()
-            return False, f"Please wait {wait_time:.1f} seconds before making another request."
-    
+    """Check if we can make a request based on the shared (per API key) rate limit"""
+    wait_time = get_client().limiter.wait_time()
+    if wait_time > MAX_QUEUE_WAIT_SECONDS:
+        return False, f"Rate limit exceeded. Please wait {wait_time:.0f} seconds before making another request."
     return True, "OK"
 
 # ✅ Functions
-def get_genai_response(question, prompt):
-    try:
-        
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        response = model.generate_content(prompt + "\n\nQuestion: " + question)
-        
-        # Update rate limiting tracking
-        now = datetime.now()
-        st.session_state.request_history.append(now)
-        st.session_state.last_request_time = now
-        
-        return response.text.strip()
-    except Exception as e:
-        error_msg = str(e)
-        if "429" in error_msg or "quota" in error_msg.lower():
-            return "❌ Rate limit exceeded. Please wait a minute and try again."
-        elif "403" in error_msg:
-            return "❌ API key invalid or billing not enabled. Please check your Google Cloud project."
-        else:
-            return f"❌ Error: {error_msg}"
-
-def read_sql_query(sql, db):
-    conn = sqlite3.connect(db)
-    cur = conn.cursor()
-    try:
-        cur.execute(sql)
-        rows = cur.fetchall()
-        conn.commit()
-    except Exception as e:
-        rows = [("Error", str(e))]
-    conn.close()
-    return rows
-
-prompt = """
-You are an expert NL2SQL model. Your task is to accurately convert English questions into valid SQL queries.
-
-Understand the intent behind natural language questions.
-
-Identify relevant tables, columns, conditions, and relationships.
-
-Use appropriate SQL syntax (e.g., SELECT, JOIN, WHERE, GROUP BY, ORDER BY, etc.).
-
-Ensure the output SQL query is syntactically correct and logically matches the meaning of the input question.
-
-Handle edge cases, such as missing conditions, ambiguous phrasing, or multi-table joins.
-
-Prefer readability and accuracy. Comment the query when appropriate.
-The database has the following tables and relationships:
-
-STUDENT: STUDENT_ID, NAME, EMAIL, PHONE, ADDRESS, DATE_OF_BIRTH, ADMISSION_DATE, CLASS, SECTION, SEMESTER, GPA, DEPT_ID, STATUS
-
-DEPARTMENTS: DEPT_ID, DEPT_NAME, DEPT_HEAD, BUILDING, BUDGET
-
-INSTRUCTORS: INSTRUCTOR_ID, INSTRUCTOR_NAME, DEPT_ID, EMAIL, PHONE, HIRE_DATE, SALARY
-
-COURSES: COURSE_ID, COURSE_NAME, COURSE_CODE, CREDITS, DEPT_ID, INSTRUCTOR_ID, SEMESTER, YEAR, MAX_STUDENTS
-
-ENROLLMENTS: ENROLLMENT_ID, STUDENT_ID, COURSE_ID, ENROLLMENT_DATE, GRADE, MARKS, ATTENDANCE_PERCENTAGE, STATUS
-
-Examples:
-Q: How many students are there?
-A: SELECT COUNT(*) FROM STUDENT;
-
-Q: Show all students in Data Science department
-A: SELECT s.* FROM STUDENT s JOIN DEPARTMENTS d ON s.DEPT_ID = d.DEPT_ID WHERE d.DEPT_NAME = "Data Science";
-
-Q: What courses is Krish Naik taking?
-A: SELECT c.COURSE_NAME FROM STUDENT s JOIN ENROLLMENTS e ON s.STUDENT_ID = e.STUDENT_ID JOIN COURSES c ON e.COURSE_ID = c.COURSE_ID WHERE s.NAME = "Krish Naik";
-
-Q: Show students with GPA greater than 3.5
-A: SELECT NAME, GPA FROM STUDENT WHERE GPA > 3.5;
-
-Q: Average marks by department
-A: SELECT d.DEPT_NAME, AVG(e.MARKS) FROM DEPARTMENTS d JOIN STUDENT s ON d.DEPT_ID = s.DEPT_ID JOIN ENROLLMENTS e ON s.STUDENT_ID = e.STUDENT_ID GROUP BY d.DEPT_NAME;
-
-Q: Which instructor teaches the most courses?
-A: SELECT i.INSTRUCTOR_NAME, COUNT(c.COURSE_ID) as course_count FROM INSTRUCTORS i JOIN COURSES c ON i.INSTRUCTOR_ID = c.INSTRUCTOR_ID GROUP BY i.INSTRUCTOR_NAME ORDER BY course_count DESC LIMIT 1;
-
-Important: Return only the SQL query without any markdown formatting, explanations, or the word 'SQL'.
-"""
+def load_more_results():
+    """Fetch the next page of the active result (capped at RESULT_ROW_CAP rows) straight into Arrow columns"""
+    active = st.session_state.active_result
+    shown = active['table'].num_rows
+    limit = min(RESULT_PAGE_SIZE, RESULT_ROW_CAP - shown)
+    approx = active.get('approximate')
+    if approx:
+        page = as_arrow_page(approximate.finish(approx, read_sql_page(approx.sql, active['db'], offset=shown,
+                                                                      limit=limit)))
+    else:
+        page = read_sql_arrow(active['sql'], active['db'], offset=shown, limit=limit)
+    if not page.error:
+        active['table'] = concat_arrow([active['table'], page.table])
+    active['has_more'] = page.has_more
+    active['error'] = page.error
+
+def deferred_export(export, active):
+    """Download callable for ``export``; a failure is noted on the result (shown on the next rerun), not raised
+
+    Streamlit only reports "Failed to generate file for download" for an
+    exception, so the file carries the error text instead.
+    """
+    sql_query, result_db = active['sql'], active['db']
+
+    def generate():
+        try:
+            return export(sql_query, result_db)
+        except Exception as e:
+            active['download_error'] = f"{export.__name__}: {e}"
+            return f"Export failed: {e}\n".encode("utf-8")
+    return generate
+
+# Seconds between progress updates while a query job runs
+JOB_POLL_SECONDS = 0.25
+
+def finish_pending_query():
+    """Turn the finished query job (repaired by the job itself on error) into the active result"""
+    pending = st.session_state.pending_query
+    st.session_state.pending_query = None
+    job = pending['job']
+    sql_query, page, repairs = pending['sql'], job.page, []
+    if job.repair_result:
+        sql_query, repairs = job.repair_result.sql, job.repair_result.fixes
+    approx = pending.get('approximate')
+    if approx and not page.error and not repairs:
+        # Sample queries run as row pages: the estimates and intervals are computed per row
+        page = approximate.finish(approx, page)
+    else:
+        approx = None  # a failed sample query is repaired (and rerun) as the exact query
+    st.session_state.active_result = {
+        'sql': sql_query,
+        'question': pending['question'],
+        'db': pending['db'],
+        'cache_tier': pending['cache_tier'],
+        'fast_path': pending['fast_path'],
+        'follow_up': pending['follow_up'],
+        'shared': pending['shared'],
+        'suggestion': pending.get('suggestion'),
+        'approximate': approx,
+        'repairs': repairs,
+        'table': as_arrow_page(page).table,
+        'has_more': page.has_more,
+        'error': page.error
+    }
+    # Only cache queries that actually ran
+    if pending['generated'] and not page.error:
+        query_cache.put(pending['question'], pending['cache_key'], sql_query)
+        get_example_store(pending['db']).add(pending['question'], sql_query)
+    if not page.error:
+        turn = Turn(pending['question'], sql_query, pending['db'])
+        st.session_state.conversation = turn
+        if pending['follow_up']:
+            st.session_state.follow_ups = ([pending['follow_up']] + [
+                text for text in st.session_state.follow_ups if text != pending['follow_up']
+            ])[:RECENT_FOLLOW_UPS]
+        # Likely refinements are generated in the background while the shared quota has tokens to spare
+        get_prefetcher().schedule(turn, pending['cache_key'], st.session_state.follow_ups)
+
+# ✅ Shared NL→SQL cache (persists across sessions and restarts)
+query_cache = nl_cache.get_cache()
+
+# ✅ Verified examples for the prompt, indexed in the background so startup is not delayed
+get_example_store(DB_PATH).preload()
+
+# ✅ Process-wide timing spans and metrics (Prometheus endpoint when NL2SQL_METRICS_PORT is set)
+telemetry = get_telemetry()
 
 # ✅ Sidebar with rate limiting info
 with st.sidebar:
     st.markdown("### 🔐 Debug Info")
     st.markdown("### 📊 Rate Limiting")
+    # Per-session history is display-only; the shared token bucket enforces the quota
+    now = datetime.now()
+    st.session_state.request_history = [
+        req_time for req_time in st.session_state.request_history
+        if now - req_time < timedelta(minutes=1)
+    ]
     st.write(f"Requests in last minute: {len(st.session_state.request_history)}/15")
+    st.write(f"Shared quota available: {get_client().limiter.available():.0f}/{REQUESTS_PER_MINUTE}")
     if st.session_state.last_request_time:
         time_since_last = datetime.now() - st.session_state.last_request_time
         st.write(f"Time since last request: {time_since_last.total_seconds():.1f}s")
+    cache_stats = query_cache.stats
+    st.write(
+        f"Query cache: {cache_stats['exact_hits']} exact / {cache_stats['similar_hits']} similar hits, "
+        f"{cache_stats['misses']} misses, {cache_stats['rejected']} paraphrases refused ({query_cache.size()} entries)"
+    )
+    fast_path = get_matcher(DB_PATH)
+    st.write(
+        f"Template fast path: {fast_path.stats['hits']} hits / {fast_path.stats['misses']} misses "
+        f"({fast_path.hit_rate():.0%} hit rate)"
+    )
+    prefetch_stats = get_prefetcher().stats
+    st.write(
+        f"Follow-up prefetch: {prefetch_stats['prefetched']} cached, {prefetch_stats['hits']} used, "
+        f"{prefetch_stats['skipped']} skipped for quota, {prefetch_stats['shared']} shared generations"
+    )
+    job_stats = get_job_queue().stats()
+    st.write(f"Query jobs: {job_stats['running']} running / {job_stats['queued']} queued "
+             f"({job_stats['heavy']} heavy)")
+    repairs = repair_stats()
+    if repairs:
+        st.write("Auto-repair: " + ", ".join(
+            f"{fix} {entry['fixed']}/{entry['attempts']}" for fix, entry in sorted(repairs.items())))
+    result_stats = get_result_cache().summary()
+    st.write(
+        f"Result cache: {result_stats['hits']} hits / {result_stats['misses']} misses, "
+        f"{result_stats['memory_bytes'] / 1048576:.1f} MB in memory, {result_stats['disk_bytes'] / 1048576:.1f} MB spilled"
+    )
+
+    st.markdown("### ⏱️ Stage Latency")
+    histograms = telemetry.histograms()
+    if histograms:
+        bucket_labels = [f"≤{bound:g}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]:g}ms"]
+        # Only the bucket range that has data, so the bars stay readable
+        filled = [i for i in range(len(bucket_labels)) if any(h.counts[i] for h in histograms.values())]
+        shown_labels = bucket_labels[filled[0]:filled[-1] + 1]
+        # A plain Vega-Lite spec: st.bar_chart validates an Altair chart on every rerun
+        st.vega_lite_chart({
+            "data": {"values": [
+                {"bucket": label, "stage": stage, "calls": histogram.counts[filled[0] + i]}
+                for stage, histogram in sorted(histograms.items())
+                for i, label in enumerate(shown_labels)
+            ]},
+            "mark": "bar",
+            "encoding": {
+                "x": {"field": "bucket", "type": "ordinal", "sort": shown_labels, "title": None},
+                "y": {"field": "calls", "type": "quantitative", "title": None},
+                "color": {"field": "stage", "type": "nominal"},
+            },
+        }, use_container_width=True)
+        for stage, histogram in sorted(histograms.items()):
+            st.write(f"{stage}: {histogram.count} calls, mean {histogram.sum / histogram.count:.1f} ms, "
+                     f"p95 ≤ {histogram.quantile(0.95):g} ms")
+        st.download_button("📥 Download trace (JSONL)", data=telemetry.export_jsonl,
+                           file_name="nl2sql_trace.jsonl", mime="application/x-ndjson")
+    else:
+        st.write("No requests timed yet.")
 
 # ✅ Main UI
 st.title("🧠 Natural Language to SQL")
 
-# Create tabs
-tab1, tab2 = st.tabs(["🔍 Query Database", "🏗️ Database Structure"])
+# Create tabs (only the open tab's content runs; the structure tab is skipped while the user queries)
+tab1, tab2 = st.tabs(["🔍 Query Database", "🏗️ Database Structure"], key="main_tab", on_change="rerun")
 
 with tab1:
     st.write("Enter your question in plain English and get SQL results from the STUDENT database.")
@@ -233,124 +331,277 @@ with tab1:
     st.info("⚠️ Free tier limit: 15 requests/minute. Please wait 4 seconds between requests.")
     
     question = st.text_input("🔍 Your Question in English:")
+    turn = st.session_state.conversation
+    if turn and turn.db == DB_PATH:
+        context_col, reset_col = st.columns([4, 1])
+        context_col.caption(f"↪ Follow-ups such as \"…sorted by GPA\" refine the last question: {turn.question}")
+        reset_col.button("🆕 New question", on_click=reset_conversation)
+    approximate_mode = st.toggle(
+        "≈ Fast approximate answers", key="approximate_mode",
+        help="COUNT / SUM / AVG questions over large tables run on a maintained random sample "
+             "and show 95% confidence intervals (build the samples with `python approximate.py`)")
     submit = st.button("Submit")
     
     if submit:
         if not question:
             st.warning("Please enter a question.")
         else:
-            # Check rate limits
-            can_proceed, message = check_rate_limit()
+            # One trace id ties this question's schema, cache, prompt, generate and execute spans together
+            with telemetry.trace():
+                # A follow-up ("…sorted by GPA") stands for the previous question plus the refinement
+                follow_up = follow_up_text(question) if turn and turn.db == DB_PATH and is_follow_up(question) else None
+                asked = resolve(turn, question) if follow_up else question
+
+                # Cached answers skip both the rate limiter and the Gemini call
+                table_structure = get_table_structure(DB_PATH)
+                cache_key = nl_cache.fingerprint(PROMPT_TEMPLATE + dialect_hint(DB_PATH), table_structure)
+                with span("cache") as attributes:
+                    cached = query_cache.get(asked, cache_key)
+                    attributes['outcome'] = cached[1] if cached else 'miss'
+                if cached:
+                    get_prefetcher().note_hit(asked, cache_key)
             
-            if not can_proceed:
-                st.error(message)
-            else:
-                with st.spinner("Generating SQL query..."):
-                    sql_query = get_genai_response(question, prompt)
+                # Common question shapes are answered from templates, also without a Gemini call
+                fast = None if cached else match_question(asked, DB_PATH)
+                # A close paraphrase that differs in a number or a less/not/or word is only shown, never run
+                suggestion = None if cached or fast else query_cache.suggest(asked, cache_key)
+                prompt = None
+                shared, owner = None, False
+                if cached:
+                    sql_query, cache_tier = cached
+                    can_proceed, message = True, "OK"
+                elif fast:
+                    sql_query = fast.sql
+                    can_proceed, message = True, "OK"
+                else:
+                    # The same question already being generated (a prefetch, another session) is waited for
+                    in_flight, owner = get_prefetcher().claim(asked, cache_key)
+                    if not owner:
+                        with st.spinner("The same question is already being generated, waiting for it..."):
+                            shared = get_prefetcher().wait(in_flight)
+                    if shared:
+                        sql_query = shared
+                        can_proceed, message = True, "OK"
+                    else:
+                        # Check rate limits
+                        can_proceed, message = check_rate_limit()
+            
+                if not can_proceed:
+                    if owner:
+                        get_prefetcher().release(asked, cache_key, None)
+                    st.error(message)
+                else:
+                    if not cached and not fast and not shared:
+                        with st.spinner("Generating SQL query..."):
+                            # Schema section is built from the live catalog, pruned to this question
+                            with span("prompt") as attributes:
+                                if follow_up:
+                                    # Only the change goes to the model: the previous SQL and the refinement
+                                    prompt = build_refinement_prompt(turn.question, turn.sql, follow_up,
+                                                                     table_structure, get_table_relationships(DB_PATH),
+                                                                     dialect=DB_BACKEND)
+                                else:
+                                    # Nearest verified examples instead of the fixed few-shot list
+                                    examples = get_example_store(DB_PATH).search(question)
+                                    prompt = build_prompt(question, table_structure, get_table_relationships(DB_PATH),
+                                                          examples, dialect=DB_BACKEND)
+                                attributes['prompt_tokens'] = approx_tokens(prompt)
+                        # The SQL is shown as it streams in; reading stops at the end of the statement
+                        streaming_sql = st.empty()
+                        streaming_sql.caption("⏳ Waiting for the model...")
+                        sql_query = None
+                        try:
+                            sql_query = stream_genai_response(follow_up or question, prompt,
+                                                              on_update=streaming_sql.code)
+                        finally:
+                            if owner:
+                                # Hands the SQL to anyone who asked the same question meanwhile
+                                get_prefetcher().release(asked, cache_key, sql_query)
+                        streaming_sql.empty()
                     
-                st.subheader("🧾 Generated SQL")
-                st.code(sql_query)
+                        # Update per-session tracking shown in the sidebar
+                        if not sql_query.startswith("❌"):
+                            now = datetime.now()
+                            st.session_state.request_history.append(now)
+                            st.session_state.last_request_time = now
                 
-                # Only execute SQL if generation was successful
-                if not sql_query.startswith("❌"):
-                    st.subheader("📊 SQL Result")
-                    result = read_sql_query(sql_query, "student.db")
-                    for row in result:
-                        st.write(row)
+                    # Only execute SQL if generation was successful
+                    if not sql_query.startswith("❌"):
+                        # Runs on the job queue; the session keeps the handle, so reruns poll it instead
+                        # of starting the query again, and a new question cancels the previous one
+                        cancel_pending_query()
+                        st.session_state.active_result = None
+                        # Aggregates over sampled tables read the sample instead, in bounded time
+                        approx = approximate.rewrite(sql_query, DB_PATH) if approximate_mode else None
+                        # Generated SQL that fails is repaired by the job too: local fixes first, the
+                        # model only sees the error if they all fail
+                        repair_request = RepairRequest(asked, sql_query, prompt) if not cached and not fast else None
+                        st.session_state.pending_query = {
+                            'job': get_job_queue().submit(approx.sql if approx else sql_query, DB_PATH,
+                                                          columnar=not approx, repair=repair_request),
+                            'question': asked,
+                            'sql': sql_query,
+                            'db': DB_PATH,
+                            'cache_tier': cache_tier if cached else None,
+                            'fast_path': fast.intent if fast else None,
+                            'follow_up': follow_up,
+                            'shared': bool(shared),
+                            'suggestion': suggestion,
+                            'approximate': approx,
+                            'generated': not cached and not fast,
+                            'cache_key': cache_key
+                        }
+                    else:
+                        st.session_state.active_result = None
+                        st.subheader("🧾 Generated SQL")
+                        st.code(sql_query)
+                        st.error("SQL generation failed. Please try again later.")
+    
+    # A query job of this session is still running: show its progress with a cancel button
+    pending = st.session_state.pending_query
+    if pending:
+        pending_box = st.empty()
+        with pending_box.container():
+            st.subheader("🧾 Generated SQL")
+            st.code(pending['sql'])
+            st.button("⏹️ Cancel query", on_click=cancel_pending_query)
+            status = st.empty()
+        job = pending['job']
+        while not job.wait(JOB_POLL_SECONDS):
+            progress = job.progress()
+            if progress['state'] == "queued":
+                status.caption(f"⏳ Queued behind other heavy queries ({progress['waited_s']:.0f}s)")
+            elif progress['state'] == "repairing":
+                status.caption(f"🔧 Query failed, trying to repair it ({progress['elapsed_s']:.1f}s)")
+            else:
+                steps = f", {progress['steps']:,} VM steps" if progress['steps'] else ""
+                status.caption(f"⏳ Running for {progress['elapsed_s']:.1f}s{steps}")
+        pending_box.empty()
+        finish_pending_query()
+
+    # Results live in session state so "Load more" reruns keep them
+    active = st.session_state.active_result
+    if active:
+        st.subheader("🧾 Generated SQL")
+        st.code(active['sql'])
+        if active['cache_tier']:
+            st.caption(f"⚡ Served from query cache ({active['cache_tier']} match)")
+        if active.get('repairs'):
+            st.caption(f"🔧 Repaired automatically ({' → '.join(active['repairs'])})")
+        if active.get('fast_path'):
+            st.caption(f"⚡ Answered by the template fast path ({active['fast_path']}), no LLM call")
+        if active.get('shared'):
+            st.caption("⚡ Shared the generation of the same question already in flight")
+        if active.get('suggestion'):
+            similar_question, similar_sql = active['suggestion']
+            with st.expander(f"💡 Cached query for a similar question, not reused: \"{similar_question}\""):
+                st.caption("It differs in a number or a comparison/negation word, so it may answer something else.")
+                st.code(similar_sql)
+        if active.get('follow_up'):
+            st.caption(f"↪ Refinement \"{active['follow_up']}\", answered as: {active['question']}")
+        approx = active.get('approximate')
+        if approx:
+            st.caption(f"≈ Approximate: ran on {approx.sample_table}, a {approx.rate:.1%} random sample of "
+                       f"{approx.table}. The ±95% columns are confidence intervals and "
+                       f"{approximate.SAMPLE_ROWS_COLUMN} the sampled rows behind each row.")
+            with st.expander("Sample query"):
+                st.code(approx.sql)
+        elif approximate_mode:
+            st.caption("≈ Ran exactly: only COUNT / SUM / AVG queries over sampled tables are approximated.")
+        
+        st.subheader("📊 SQL Result")
+        if active['error']:
+            st.error(f"Error: {active['error']}")
+        else:
+            # The Arrow table goes to the grid as is, without a pandas copy
+            with span("render", rows=active['table'].num_rows, bytes=active['table'].nbytes):
+                st.dataframe(active['table'], use_container_width=True)
+            shown = active['table'].num_rows
+            st.caption(f"Showing {shown} rows" + (" (more available)" if active['has_more'] else ""))
+            if active['has_more']:
+                if shown < RESULT_ROW_CAP:
+                    st.button("⬇️ Load more", on_click=load_more_results)
                 else:
-                    st.error("SQL generation failed. Please try again later.")
+                    st.info(f"Viewer row cap ({RESULT_ROW_CAP}) reached. Download the full result below.")
+            
+            # Downloads are generated on click, streaming straight from the cursor
+            if active.get('download_error'):
+                st.warning(f"The last download failed ({active.pop('download_error')}).")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button("📥 Download full result (CSV)", data=deferred_export(export_csv, active),
+                                   file_name="result.csv", mime="text/csv")
+            with col2:
+                st.download_button("📥 Download full result (Parquet)", data=deferred_export(export_parquet, active),
+                                   file_name="result.parquet", mime="application/octet-stream")
 
 with tab2:
-    st.write("🔒 **Privacy-Safe Database Structure View** - Only table schemas are shown, no actual data is exposed.")
+    if tab2.open:
+        st.write("🔒 **Privacy-Safe Database Structure View** - Only table schemas are shown, no actual data is exposed.")
     
-    try:
-        table_structure = get_table_structure()
+        try:
+            table_structure = get_table_structure(DB_PATH)
         
-        if not table_structure:
-            st.error("No database found. Please make sure 'student.db' exists in the same directory.")
-        else:
-            st.success(f"🗃️ Found {len(table_structure)} tables in the database")
-            
-            # Display database overview (structure only)
-            st.subheader("📊 Database Overview")
-            overview_data = []
-            for table_name, info in table_structure.items():
-                overview_data.append({
-                    "Table": table_name.upper(),
-                    "Columns": len(info['columns']),
-                    "Records": info['row_count'],  # Just count, no actual data
-                    "Primary Keys": len([col for col in info['columns'] if col[5]]),
-                    "Foreign Keys": len(info['foreign_keys'])
-                })
-            
-            overview_df = pd.DataFrame(overview_data)
-            st.dataframe(overview_df, use_container_width=True)
-            
-            # Show table relationships
-            st.subheader("🔗 Table Relationships")
-            relationships = get_table_relationships()
-            if relationships:
-                rel_data = []
-                for rel in relationships:
-                    rel_data.append({
-                        "From Table": rel['from_table'].upper(),
-                        "From Column": rel['from_column'],
-                        "To Table": rel['to_table'].upper(),
-                        "To Column": rel['to_column'],
-                        "Relationship": f"{rel['from_table']}.{rel['from_column']} → {rel['to_table']}.{rel['to_column']}"
-                    })
-                
-                rel_df = pd.DataFrame(rel_data)
-                st.dataframe(rel_df, use_container_width=True)
+            if not table_structure:
+                st.error(f"No database found. Please make sure '{DB_PATH}' exists in the same directory.")
             else:
-                st.info("No foreign key relationships found in the database.")
-            
-            # Create expandable sections for each table (structure only)
-            st.subheader("🏗️ Table Structures")
-            for table_name, info in table_structure.items():
-                with st.expander(f"📋 {table_name.upper()} Table Structure", expanded=False):
-                    
-                    # Show column information with enhanced details
-                    st.markdown("**📝 Column Information:**")
-                    column_data = []
-                    for col in info['columns']:
-                        column_data.append({
-                            "Column Name": col[1],
-                            "Data Type": col[2],
-                            "Primary Key": "✅ Yes" if col[5] else "❌ No",
-                            "Not Null": "✅ Yes" if col[3] else "❌ No",
-                            "Default Value": col[4] if col[4] else "None"
-                        })
-                    
-                    column_df = pd.DataFrame(column_data)
-                    st.dataframe(column_df, use_container_width=True)
-                    
-                    # Show foreign key relationships for this table
-                    if info['foreign_keys']:
-                        st.markdown("**🔗 Foreign Key Relationships:**")
-                        fk_data = []
-                        for fk in info['foreign_keys']:
-                            fk_data.append({
-                                "Column": fk[3],
-                                "References Table": fk[2],
-                                "References Column": fk[4],
-                                "Relationship": f"{fk[3]} → {fk[2]}.{fk[4]}"
-                            })
-                        
-                        fk_df = pd.DataFrame(fk_data)
-                        st.dataframe(fk_df, use_container_width=True)
-                    else:
-                        st.info("No foreign key relationships for this table.")
+                st.success(f"🗃️ Found {len(table_structure)} tables in {DB_PATH} ({DB_BACKEND})")
+                # Built once per schema/data version instead of on every rerun
+                overview_table, relationship_table, structure_tables = get_schema_view(
+                    DB_PATH, get_catalog(DB_PATH).version)
+
+                # Display database overview (structure only)
+                st.subheader("📊 Database Overview")
+                st.dataframe(overview_table, use_container_width=True)
+
+                # Show table relationships
+                st.subheader("🔗 Table Relationships")
+                if relationship_table.num_rows:
+                    st.dataframe(relationship_table, use_container_width=True)
+                else:
+                    st.info("No foreign key relationships found in the database.")
+
+                # Create expandable sections for each table (structure only)
+                st.subheader("🏗️ Table Structures")
+                for table_name, info in table_structure.items():
+                    column_table, fk_table = structure_tables[table_name]
+                    with st.expander(f"📋 {table_name.upper()} Table Structure", expanded=False):
+
+                        # Show column information with enhanced details
+                        st.markdown("**📝 Column Information:**")
+                        st.dataframe(column_table, use_container_width=True)
+
+                        # Show foreign key relationships for this table
+                        if fk_table.num_rows:
+                            st.markdown("**🔗 Foreign Key Relationships:**")
+                            st.dataframe(fk_table, use_container_width=True)
+                        else:
+                            st.info("No foreign key relationships for this table.")
                     
-                    # Show record count and basic stats (no actual data)
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.metric("Total Records", info['row_count'])
-                    with col2:
-                        st.metric("Total Columns", len(info['columns']))
-    
-    except Exception as e:
-        st.error(f"Error loading database structure: {str(e)}")
+                        # Show record count and basic stats (no actual data)
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            st.metric("Total Records", info['row_count'])
+                        with col2:
+                            st.metric("Total Columns", len(info['columns']))
+
+                # Index proposals from the logged workload (apply them with `python index_advisor.py --apply`)
+                # Only SQLite queries are logged; DuckDB scans columns instead of using the advisor's indexes
+                if DB_BACKEND == "sqlite":
+                    with st.expander("🧭 Index Advisor", expanded=False):
+                        st.caption("Suggests indexes for the predicates and joins used by the queries executed so far.")
+                        if st.button("Analyze query workload"):
+                            proposals = advise(DB_PATH)
+                            if proposals:
+                                import pandas as pd
+
+                                st.dataframe(pd.DataFrame(proposals), use_container_width=True)
+                                st.code("\n".join(p['statement'] for p in proposals), language="sql")
+                            else:
+                                st.info("No index proposals: the logged workload is already covered (or nothing has run yet).")
+
+        except Exception as e:
+            st.error(f"Error loading database structure: {str(e)}")
 
 # ✅ Additional troubleshooting info
 with st.expander("🔧 Troubleshooting"):
@@ -0,0 +1,371 @@
+"""Approximate answers to aggregate questions from maintained random samples.
+
+    python approximate.py --db big.db                  # (re)build samples of the large tables
+    python approximate.py --db big.db --rows 50000     # smaller samples, faster and wider intervals
+    python approximate.py --db big.db --drop           # remove them
+
+Every table with more than ``NL2SQL_SAMPLE_ROWS`` rows gets a ``<TABLE>_SAMPLE``
+table with the same columns, holding each row independently with
+probability ``rate`` (a Bernoulli sample). Triggers keep it current: a new
+row joins the sample with the same probability, and updates and deletes
+are mirrored. ``SAMPLE_INFO`` records each table's sample and rate.
+
+With "fast approximate" on, ``rewrite`` turns a query whose select list is
+plain COUNT / SUM / TOTAL / AVG calls (plus GROUP BY keys) into one that
+reads the sample of its largest sampled table. Joined dimension tables
+stay whole, so a join through the sample is still a sample of the join.
+Counts and sums are scaled by 1 / rate, and ``finish`` turns
+the helper columns into 95% confidence intervals and the number of
+sampled rows behind each result row. Anything else (subqueries, DISTINCT,
+MIN/MAX, HAVING on counts) runs exactly.
+"""
+import argparse
+import math
+import os
+import re
+import sqlite3
+import time
+from collections import namedtuple
+
+from db_engine import get_engine
+from schema_catalog import get_catalog
+from sql_guard import QueryRejected, check_statement
+
+SAMPLE_ROWS = int(os.getenv("NL2SQL_SAMPLE_ROWS", "100000"))
+SAMPLE_SUFFIX = "_SAMPLE"
+SAMPLE_INFO = "SAMPLE_INFO"
+# random() % RATE_SCALE < threshold keeps a row; the stored rate is threshold / RATE_SCALE
+RATE_SCALE = 1_000_000
+CONFIDENCE_Z = 1.96  # 95% two-sided
+SAMPLE_ROWS_COLUMN = "SAMPLE_ROWS"
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_AGGREGATE_RE = re.compile(r"\b(COUNT|SUM|TOTAL|AVG|MIN|MAX|GROUP_CONCAT|STRING_AGG)\s*\(", re.IGNORECASE)
+_BARE_AGGREGATE_RE = re.compile(
+    r'^\s*(COUNT|SUM|TOTAL|AVG)\s*\((.*)\)\s*(?:(?:AS\s+)?([A-Za-z_]\w*|"[^"]+"))?\s*$',
+    re.IGNORECASE | re.DOTALL,
+)
+_UNSUPPORTED_RE = re.compile(r"\(\s*SELECT\b|\bDISTINCT\b|\bOVER\b|\bUNION\b|\bINTERSECT\b|\bEXCEPT\b",
+                             re.IGNORECASE)
+_SCALED_RE = re.compile(r"\b(COUNT|SUM|TOTAL)\s*\(", re.IGNORECASE)
+# Words after a table name that are not its alias (same list as the guard's)
+_CLAUSE_WORDS = (
+    "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "NATURAL", "OUTER", "ON", "USING", "WHERE",
+    "GROUP", "ORDER", "HAVING", "LIMIT", "WINDOW", "INDEXED", "NOT",
+)
+
+# layout entries: ('column', label, position) or (function, label, [helper positions])
+ApproximateQuery = namedtuple("ApproximateQuery", ["sql", "table", "sample_table", "rate", "layout"])
+
+
+def is_sample_table(name):
+    """True for the sample tables and their metadata, which the prompt and fast path leave out"""
+    return name.upper() == SAMPLE_INFO or name.upper().endswith(SAMPLE_SUFFIX)
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+# Sample maintenance
+
+def _sampled_tables(conn, rows):
+    """[(table, row count, key column)] of the base tables larger than ``rows``"""
+    tables = []
+    for (table,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name;"
+    ).fetchall():
+        if is_sample_table(table):
+            continue
+        count = conn.execute(f"SELECT COUNT(*) FROM {_quote(table)};").fetchone()[0]
+        keys = [col[1] for col in conn.execute(f"PRAGMA table_info({_quote(table)});") if col[5]]
+        # Triggers find the sampled copy of a row by its single-column key
+        if count > rows and len(keys) == 1:
+            tables.append((table, count, keys[0]))
+    return tables
+
+
+def _sample_triggers(table, sample_table, key, columns, threshold):
+    names = ", ".join(_quote(col) for col in columns)
+    new_values = ", ".join(f"NEW.{_quote(col)}" for col in columns)
+    assignments = ", ".join(f"{_quote(col)} = NEW.{_quote(col)}" for col in columns)
+    prefix = f"sample_{table.lower()}"
+    return [
+        f"CREATE TRIGGER {prefix}_insert AFTER INSERT ON {_quote(table)} "
+        f"WHEN abs(random() % {RATE_SCALE}) < {threshold}\n"
+        f"BEGIN\n    INSERT INTO {_quote(sample_table)} ({names}) VALUES ({new_values});\nEND;",
+        f"CREATE TRIGGER {prefix}_delete AFTER DELETE ON {_quote(table)}\n"
+        f"BEGIN\n    DELETE FROM {_quote(sample_table)} WHERE {_quote(key)} = OLD.{_quote(key)};\nEND;",
+        f"CREATE TRIGGER {prefix}_update AFTER UPDATE ON {_quote(table)}\n"
+        f"BEGIN\n    UPDATE {_quote(sample_table)} SET {assignments} WHERE {_quote(key)} = OLD.{_quote(key)};\nEND;",
+    ]
+
+
+def drop(conn):
+    """Remove the sample tables, their triggers and SAMPLE_INFO (inside the caller's transaction)"""
+    for (trigger,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'sample\\_%' ESCAPE '\\';"
+    ).fetchall():
+        conn.execute(f'DROP TRIGGER IF EXISTS "{trigger}";')
+    for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table';").fetchall():
+        if is_sample_table(table):
+            conn.execute(f"DROP TABLE IF EXISTS {_quote(table)};")
+
+
+def build(db_path, rows=SAMPLE_ROWS):
+    """(Re)build a sample of about ``rows`` rows for every larger table; returns {table: (sample rows, rate)}"""
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    built = {}
+    try:
+        conn.execute("BEGIN IMMEDIATE;")
+        try:
+            drop(conn)
+            tables = _sampled_tables(conn, rows)
+            if tables:
+                conn.execute(f"CREATE TABLE {SAMPLE_INFO} (TABLE_NAME TEXT PRIMARY KEY, "
+                             "SAMPLE_TABLE TEXT NOT NULL, RATE REAL NOT NULL, BUILT_AT REAL NOT NULL);")
+            for table, count, key in tables:
+                sample_table = table + SAMPLE_SUFFIX
+                info = conn.execute(f"PRAGMA table_info({_quote(table)});").fetchall()
+                columns = [col[1] for col in info]
+                definitions = [f"{_quote(col[1])} {col[2]}" + (" PRIMARY KEY" if col[1] == key else "")
+                               for col in info]
+                conn.execute(f"CREATE TABLE {_quote(sample_table)} ({', '.join(definitions)});")
+                threshold = max(1, round(RATE_SCALE * rows / count))
+                conn.execute(f"INSERT INTO {_quote(sample_table)} SELECT {', '.join(_quote(c) for c in columns)} "
+                             f"FROM {_quote(table)} WHERE abs(random() % {RATE_SCALE}) < {threshold};")
+                for trigger in _sample_triggers(table, sample_table, key, columns, threshold):
+                    conn.execute(trigger)
+                rate = threshold / RATE_SCALE
+                conn.execute(f"INSERT INTO {SAMPLE_INFO} VALUES (?, ?, ?, ?);", (table, sample_table, rate, time.time()))
+                sampled = conn.execute(f"SELECT COUNT(*) FROM {_quote(sample_table)};").fetchone()[0]
+                built[table] = (sampled, rate)
+            conn.execute("COMMIT;")
+        except BaseException:
+            conn.execute("ROLLBACK;")
+            raise
+        conn.execute("ANALYZE;")
+    finally:
+        conn.close()
+    return built
+
+
+def sample_rates(db):
+    """{table: (sample table, rate)} of the samples in ``db`` ({} if none were built)"""
+    if SAMPLE_INFO not in get_catalog(db).table_structure():
+        return {}
+    rows = get_engine(db).execute(f"SELECT TABLE_NAME, SAMPLE_TABLE, RATE FROM {SAMPLE_INFO};")
+    return {table: (sample_table, rate) for table, sample_table, rate in rows}
+
+
+# Query rewriting
+
+def _mask(sql):
+    """``sql`` with string literal contents blanked out, same length, so positions line up"""
+    return _LITERAL_RE.sub(lambda m: "'" + "_" * (len(m.group()) - 2) + "'", sql)
+
+
+def _split_top_level(sql, masked, start, end):
+    """[(start, end)] spans of the comma-separated items of sql[start:end] outside parentheses"""
+    spans, depth, item_start = [], 0, start
+    for i in range(start, end):
+        ch = masked[i]
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            spans.append((item_start, i))
+            item_start = i + 1
+    spans.append((item_start, end))
+    return spans
+
+
+def _top_level_keyword(masked, keyword, start=0):
+    """Position of the first ``keyword`` at parenthesis depth 0 from ``start``, or -1"""
+    depth = 0
+    pattern = re.compile(r"\b" + keyword + r"\b", re.IGNORECASE)
+    for i in range(start, len(masked)):
+        ch = masked[i]
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif depth == 0 and pattern.match(masked, i) and (i == 0 or not (masked[i - 1].isalnum() or masked[i - 1] == "_")):
+            return i
+    return -1
+
+
+def _balanced_argument(argument):
+    """True if ``argument`` is a complete parenthesized expression (COUNT(a) + SUM(b) is not one call)"""
+    depth = 0
+    for ch in argument:
+        depth += ch == "("
+        depth -= ch == ")"
+        if depth < 0:
+            return False
+    return depth == 0
+
+
+def _table_reference_re(table):
+    name = r'(?:"' + re.escape(table) + r'"|\b' + re.escape(table) + r'\b)'
+    return re.compile(
+        r'(\bFROM|\bJOIN|,)(\s*)' + name +
+        r'(\s+(?:AS\s+)?(?!(?:' + "|".join(_CLAUSE_WORDS) + r')\b)[A-Za-z_]\w*)?',
+        re.IGNORECASE,
+    )
+
+
+def rewrite(sql, db):
+    """ApproximateQuery reading a sample instead of the full table, or None if ``sql`` must run exactly"""
+    samples = sample_rates(db)
+    if not samples:
+        return None
+    try:
+        sql = check_statement(sql)
+    except QueryRejected:
+        return None  # the exact run reports why
+    masked = _mask(sql)
+    # Drop comments (their text could hold anything) and the closing semicolon
+    for match in reversed(list(_COMMENT_RE.finditer(masked))):
+        sql = sql[:match.start()] + " " + sql[match.end():]
+        masked = masked[:match.start()] + " " + masked[match.end():]
+    sql, masked = sql.rstrip().rstrip(";"), masked.rstrip().rstrip(";")
+    if not re.match(r"\s*SELECT\b", masked, re.IGNORECASE) or _UNSUPPORTED_RE.search(masked):
+        return None
+
+    select_end = re.match(r"\s*SELECT\b", masked, re.IGNORECASE).end()
+    from_start = _top_level_keyword(masked, "FROM", select_end)
+    if from_start < 0:
+        return None
+    tail, masked_tail = sql[from_start:], masked[from_start:]
+
+    # Sample the largest sampled table the query reads; it must appear once
+    referenced = [(rate, table) for table, (_, rate) in samples.items()
+                  if len(_table_reference_re(table).findall(masked_tail)) == 1]
+    if not referenced or any(len(_table_reference_re(table).findall(masked_tail)) > 1 for table in samples):
+        return None
+    rate, table = min(referenced)
+    sample_table = samples[table][0]
+    # Counts in HAVING would compare sample counts with full-size thresholds
+    having = _top_level_keyword(masked_tail, "HAVING")
+    if having >= 0 and _SCALED_RE.search(masked_tail[having:]):
+        return None
+
+    columns, layout, has_aggregate = [], [], False
+    for start, end in _split_top_level(sql, masked, select_end, from_start):
+        item, masked_item = sql[start:end].strip(), masked[start:end].strip()
+        if not _AGGREGATE_RE.search(masked_item):
+            if item == "*" or item.endswith(".*"):
+                return None
+            layout.append(('column', None, len(columns)))
+            columns.append(item)
+            continue
+        match = _BARE_AGGREGATE_RE.match(item)
+        if not match or not _balanced_argument(match.group(2)) or _AGGREGATE_RE.search(_mask(match.group(2))):
+            return None
+        has_aggregate = True
+        function, argument, alias = match.group(1).upper(), match.group(2).strip(), match.group(3)
+        label = alias.strip('"') if alias else item
+        squared = "1" if argument == "*" else f"({argument}) * ({argument})"
+        first = len(columns)
+        # The first helper keeps the item's alias, so ORDER BY <alias> still sorts by it
+        value = f"{function}({argument})" + (f" AS {alias}" if alias else "")
+        if function == "COUNT":
+            columns.append(value)
+        elif function == "AVG":
+            columns += [value, f"COUNT({argument})", f"AVG({squared})"]
+        else:
+            columns += [value, f"SUM({squared})"]
+        layout.append((function, label, list(range(first, len(columns)))))
+    if not has_aggregate:
+        return None
+    layout.append(('sample_rows', SAMPLE_ROWS_COLUMN, len(columns)))
+    columns.append("COUNT(*)")
+
+    reference = _table_reference_re(table)
+
+    def use_sample(match):
+        # Without an alias, the sample takes the table's name so qualified columns still resolve
+        alias = match.group(3) or f" AS {_quote(table)}"
+        return f"{match.group(1)}{match.group(2) or ' '}{_quote(sample_table)}{alias}"
+
+    position = reference.search(masked_tail)
+    tail = tail[:position.start()] + use_sample(reference.match(tail, position.start())) + tail[position.end():]
+    rewritten = f"{sql[:select_end]} {', '.join(columns)} {tail};"
+    return ApproximateQuery(rewritten, table, sample_table, rate, layout)
+
+
+def _interval(function, values, rate):
+    """(estimate, half-width of the 95% interval) from one aggregate's helper values"""
+    scale, keep = 1.0 / rate, 1.0 - rate
+    if function == "COUNT":
+        (count,) = values
+        # Horvitz-Thompson: each sampled row stands for 1 / rate rows
+        return round(count * scale), CONFIDENCE_Z * scale * math.sqrt(keep * count)
+    if function in ("SUM", "TOTAL"):
+        total, squares = values
+        if total is None:
+            return None, None
+        return total * scale, CONFIDENCE_Z * scale * math.sqrt(keep * (squares or 0))
+    mean, count, mean_square = values
+    if mean is None:
+        return None, None
+    if count < 2:
+        return mean, None
+    variance = max(mean_square - mean * mean, 0.0) * count / (count - 1)
+    return mean, CONFIDENCE_Z * math.sqrt(variance / count * keep)
+
+
+def finish(query, page):
+    """ResultPage of estimates, their ± 95% half-widths and SAMPLE_ROWS from a page of ``query.sql``"""
+    if page.error:
+        return page
+    columns = []
+    for kind, label, positions in query.layout:
+        if kind == 'column':
+            columns.append(page.columns[positions])
+        elif kind == 'sample_rows':
+            columns.append(label)
+        else:
+            columns += [label, f"{label} ±95%"]
+    rows = []
+    for row in page.rows:
+        out = []
+        for kind, label, positions in query.layout:
+            if kind in ('column', 'sample_rows'):
+                out.append(row[positions])
+            else:
+                out += _interval(kind, [row[p] for p in positions], query.rate)
+        rows.append(tuple(out))
+    return page._replace(columns=columns, rows=rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the random samples used for approximate answers")
+    parser.add_argument("--db", default="student.db")
+    parser.add_argument("--rows", type=int, default=SAMPLE_ROWS, help="target rows per sample")
+    parser.add_argument("--drop", action="store_true", help="remove the samples and their triggers instead")
+    args = parser.parse_args(argv)
+    if args.drop:
+        conn = sqlite3.connect(args.db, isolation_level=None, timeout=30)
+        try:
+            conn.execute("BEGIN IMMEDIATE;")
+            drop(conn)
+            conn.execute("COMMIT;")
+        finally:
+            conn.close()
+        print(f"Removed samples from {args.db}")
+        return
+    started = time.perf_counter()
+    built = build(args.db, args.rows)
+    if not built:
+        print(f"No table in {args.db} has more than {args.rows:,} rows; nothing to sample")
+    for table, (sampled, rate) in built.items():
+        print(f"{table}: {sampled:,} sampled rows ({rate:.2%})")
+    print(f"Done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Database backends the NL interface can run against.
+
+The backend follows from the database file's extension: ``.duckdb`` /
+``.ddb`` files are opened with DuckDB (duckdb_backend.py), everything else
+with SQLite (db_engine.py, schema_catalog.py). Each backend has a dialect
+hint that goes into the prompt, so the model writes SQL the engine accepts.
+"""
+import os
+from pathlib import Path
+
+DUCKDB_SUFFIXES = (".duckdb", ".ddb")
+
+DIALECT_HINTS = {
+    "sqlite": (
+        "The database engine is SQLite. Use strftime() for date parts, || to concatenate strings, "
+        "and LIMIT for top-N queries."
+    ),
+    "duckdb": (
+        "The database engine is DuckDB. Use date_part() or strftime() for date parts, || to concatenate "
+        "strings, LIMIT for top-N queries, and QUALIFY to filter window functions. Quote string values "
+        "with single quotes; double quotes name columns."
+    ),
+}
+
+DEFAULT_DATABASES = "student.db,student.duckdb"
+
+
+def backend_for(db_path):
+    """'duckdb' or 'sqlite' for a database file"""
+    return "duckdb" if Path(str(db_path)).suffix.lower() in DUCKDB_SUFFIXES else "sqlite"
+
+
+def dialect_hint(db_path):
+    return DIALECT_HINTS[backend_for(db_path)]
+
+
+def available_databases(base_dir=None):
+    """Existing files from NL2SQL_DATABASES (comma-separated), relative to ``base_dir``"""
+    base_dir = Path(base_dir or ".")
+    names = [name.strip() for name in os.getenv("NL2SQL_DATABASES", DEFAULT_DATABASES).split(",")]
+    return [name for name in names if name and (base_dir / name).exists()]
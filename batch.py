@@ -0,0 +1,198 @@
+"""Headless batch mode: translate and execute a file of questions.
+
+    python batch.py questions.jsonl --out results.jsonl
+    python batch.py questions.csv --db student.db --pack 5 --workers 8
+
+Input is JSONL ({"question": ..., "id": ...}) or CSV with a ``question``
+column (``id`` optional; the line number is used otherwise). Several
+questions are packed into each LLM call, and the generated SQL runs on a
+worker pool while the next pack is being generated. Questions the
+template fast path can answer skip the LLM entirely, and SQL that fails
+goes through sql_repair before its error is recorded. Every finished
+question is appended to the output JSONL right away, so rerunning the
+same command after an interruption skips what is already there.
+Questions that failed for a reason other than their SQL (a generation
+error such as a rate limit, or an exception while executing) are written
+with ``"retry": true`` and run again on the next run; the last line for
+an id is its current result.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from backends import backend_for
+from fast_path import match_question
+from few_shot import get_example_store
+from nl2sql import get_genai_batch_response
+from prompt_builder import build_prompt
+from results import read_sql_page
+from schema_catalog import get_catalog
+from sql_repair import repair
+
+DEFAULT_PACK_SIZE = 5
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_ROWS = 100
+
+
+def load_questions(path):
+    """Read (id, question) pairs from a JSONL or CSV file"""
+    path = Path(path)
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.suffix.lower() == ".csv":
+            records = list(csv.DictReader(f))
+        else:
+            records = [json.loads(line) for line in f if line.strip()]
+    questions = []
+    for line_no, record in enumerate(records, 1):
+        question = (record.get("question") or "").strip()
+        if question:
+            questions.append((str(record.get("id") or line_no), question))
+    return questions
+
+
+def completed_ids(out_path):
+    """IDs already written to the output file (the checkpoint)"""
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                qid = str(record["id"])
+            except (ValueError, KeyError, TypeError):
+                # A line cut short by an interruption; that question is redone
+                continue
+            if record.get("retry"):
+                done.discard(qid)
+            else:
+                done.add(qid)
+    return done
+
+
+class ResultWriter:
+    """Appends one JSON line per finished question and flushes it to disk"""
+
+    def __init__(self, out_path):
+        self._file = open(out_path, "a+", encoding="utf-8")
+        # Terminate a line left half-written by an interrupted run
+        if self._file.tell() > 0:
+            self._file.seek(self._file.tell() - 1)
+            if self._file.read(1) != "\n":
+                self._file.write("\n")
+        self._lock = threading.Lock()
+        self.written = 0
+
+    def write(self, record):
+        line = json.dumps(record, default=str, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.written += 1
+
+    def close(self):
+        self._file.close()
+
+
+def execute(record, db, max_rows, writer, prompt=None):
+    started = time.perf_counter()
+    page = read_sql_page(record["sql"], db, limit=max_rows)
+    if page.error and not record.get("fast_path"):
+        record["sql"], page, record["repairs"] = repair(record["question"], record["sql"], page, db,
+                                                        prompt=prompt, limit=max_rows)
+    record["execute_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    record["columns"] = page.columns
+    record["rows"] = [list(row) for row in page.rows]
+    record["truncated"] = page.has_more
+    record["error"] = page.error
+    if not page.error and not record.get("fast_path"):
+        get_example_store(db).add(record["question"], record["sql"])
+    writer.write(record)
+
+
+def _failed(record, error):
+    """``record`` finished with an error that is not its SQL's, to be retried on the next run"""
+    return dict(record, execute_ms=None, columns=[], rows=[], truncated=False, error=error, retry=True)
+
+
+def run_batch(in_path, out_path, db="student.db", pack_size=DEFAULT_PACK_SIZE,
+              workers=DEFAULT_WORKERS, max_rows=DEFAULT_MAX_ROWS):
+    """Process every question not yet in ``out_path``; returns (processed, skipped, answered by the fast path)"""
+    questions = load_questions(in_path)
+    done = completed_ids(out_path)
+    pending = [(qid, question) for qid, question in questions if qid not in done]
+
+    catalog = get_catalog(db)
+    table_structure = catalog.table_structure()
+    relationships = catalog.relationships()
+
+    writer = ResultWriter(out_path)
+    futures = []  # (future, record) of every submitted execution
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-sql") as pool:
+            to_generate = []
+            for qid, question in pending:
+                fast = match_question(question, db)
+                if fast:
+                    record = {"id": qid, "question": question, "sql": fast.sql,
+                              "pack_size": 0, "generate_ms": 0.0, "fast_path": fast.intent}
+                    futures.append((pool.submit(execute, record, db, max_rows, writer), record))
+                else:
+                    to_generate.append((qid, question))
+            for start in range(0, len(to_generate), pack_size):
+                pack = to_generate[start:start + pack_size]
+                texts = [question for _, question in pack]
+                # One prompt whose schema section covers every question in the pack
+                examples = list(dict.fromkeys(
+                    example for text in texts for example in get_example_store(db).search(text)))
+                prompt = build_prompt(" ".join(texts), table_structure, relationships, examples, dialect=backend_for(db))
+                started = time.perf_counter()
+                sqls = get_genai_batch_response(texts, prompt)
+                generate_ms = round((time.perf_counter() - started) * 1000, 2)
+                for (qid, question), sql in zip(pack, sqls):
+                    record = {"id": qid, "question": question, "sql": sql,
+                              "pack_size": len(pack), "generate_ms": generate_ms}
+                    if sql.startswith("❌"):
+                        writer.write(_failed(record, sql))
+                    else:
+                        futures.append((pool.submit(execute, record, db, max_rows, writer, prompt), record))
+        # An exception in execute (repair, the example store...) would otherwise drop the question silently
+        for future, record in futures:
+            error = future.exception()
+            if error is not None:
+                writer.write(_failed(record, f"❌ Error: {type(error).__name__}: {error}"))
+    finally:
+        writer.close()
+    return len(pending), len(questions) - len(pending), len(pending) - len(to_generate)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Translate and execute a file of questions")
+    parser.add_argument("questions", help="JSONL or CSV file with a 'question' field")
+    parser.add_argument("--out", default="batch_results.jsonl", help="output JSONL (also the resume checkpoint)")
+    parser.add_argument("--db", default="student.db")
+    parser.add_argument("--pack", type=int, default=DEFAULT_PACK_SIZE, help="questions per LLM call")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="concurrent SQL executions")
+    parser.add_argument("--max-rows", type=int, default=DEFAULT_MAX_ROWS, help="rows kept per result")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    processed, skipped, fast = run_batch(args.questions, args.out, args.db, max(1, args.pack),
+                                   max(1, args.workers), args.max_rows)
+    elapsed = time.perf_counter() - started
+    print(f"Processed {processed} questions ({skipped} already done, {fast} by the template fast path) "
+          f"in {elapsed:.1f}s -> {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent / ".env", override=True)  # llm_client reads GOOGLE_API_KEY on first use
+    main()
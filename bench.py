@@ -0,0 +1,433 @@
+"""End-to-end benchmark of the NL→SQL pipeline.
+
+    python bench.py                                        # fake model, default scales
+    python bench.py --scales 15,200000,2500000:20000 --latency 0.3 --out bench_results.json
+    python bench.py --compare baseline.json                # exit 1 on a p95 regression
+    python bench.py --transport 1000000 --db big.db        # row tuples vs Arrow columns, 1M rows
+
+A fixed question corpus goes through the same stages as the app:
+catalog lookup, prompt construction, generation, execution of the first
+result page, and rendering (the page as an Arrow table serialized to Arrow
+IPC, which is what ``st.dataframe`` ships to the browser). Generation uses the
+deterministic fake model from fake_llm.py by default, so no network access
+is needed. Databases are built with sql.py at each requested scale
+(``students`` or ``students:courses``) and reused across runs. The result
+cache is off unless --result-cache is given, so "execute" measures SQLite.
+
+--transport ROWS instead reads ROWS rows of ENROLLMENTS both ways: as row
+tuples turned into a pandas DataFrame (the viewer's former path) and
+straight into Arrow columns (results.read_sql_arrow). Each path runs in a
+fresh process, so its peak RSS and Arrow pool high-water mark are its own.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+import sql as datagen
+from backends import backend_for
+from fake_llm import FakeModel
+from llm_client import HTTPModel, LLMClient, TokenBucket, get_client, set_client
+from nl2sql import get_genai_response
+from prompt_builder import build_prompt
+from result_cache import ResultCache, set_result_cache
+from results import read_sql_arrow, read_sql_page
+from schema_catalog import get_catalog
+
+BENCH_DATA_DIR = Path(__file__).parent / "bench_data"
+DEFAULT_SCALES = "15,20000,200000"
+DEFAULT_SEED = 7
+STAGES = ("schema", "prompt", "generate", "execute", "render", "total")
+PERCENTILES = (50, 95, 99)
+NOISE_FLOOR_MS = 1.0  # p95 differences below this are not reported as regressions
+TRANSPORT_SQL = "SELECT * FROM ENROLLMENTS"
+TRANSPORTS = ("rows", "columnar")
+
+QUESTIONS = [
+    "How many students are there?",
+    "How many courses are offered?",
+    "How many enrollments are there?",
+    "Show students with GPA greater than 3.5",
+    "What is the average mark per department?",
+    "Which instructor teaches the most courses?",
+    "List all enrollments",
+    "List every course and its credits",
+    "Show each instructor and their salary",
+    "Show the budget of every department",
+    "List the names of all students",
+    "What courses is Krish Naik taking?",
+    "Show all students in Data Science department",
+    "Which students have the highest GPA?",
+    "Show the enrollment records for course CS101",
+    "How many students are in each department?",
+]
+
+
+def parse_scale(spec):
+    """'200000' or '200000:2000' -> (students, courses); courses default to students / 100"""
+    students, _, courses = spec.partition(":")
+    students = int(students)
+    return students, int(courses) if courses else max(len(datagen.courses_data), students // 100)
+
+
+def ensure_database(students, courses, seed=DEFAULT_SEED, data_dir=BENCH_DATA_DIR):
+    """Path of a generated database at this scale, building it with sql.py on first use"""
+    data_dir.mkdir(parents=True, exist_ok=True)
+    path = data_dir / f"students_{students}_courses_{courses}_seed{seed}.db"
+    if not path.exists():
+        partial = path.with_suffix(".partial")
+        datagen.build_database(str(partial), students=students, courses=courses, seed=seed)
+        partial.rename(path)
+    return path
+
+
+def make_client(backend, latency=0.0, url=None):
+    """LLM client for the benchmark; the fake backend is not rate limited"""
+    if backend == "fake":
+        return LLMClient(FakeModel(latency), limiter=TokenBucket(rate_per_minute=10 ** 9))
+    if backend == "http":
+        return LLMClient(HTTPModel(url))
+    return get_client()
+
+
+def ipc_size(table):
+    """Serialize ``table`` to Arrow IPC, as st.dataframe does before sending it; returns the bytes"""
+    import pyarrow as pa
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().size
+
+
+def render(page):
+    """What the app does with a result page (an ArrowPage): serialize its table"""
+    return ipc_size(page.table)
+
+
+def render_rows(page):
+    """The viewer's former path: a pandas DataFrame of the row tuples, converted to Arrow"""
+    import pandas as pd
+    import pyarrow as pa
+
+    return ipc_size(pa.Table.from_pandas(pd.DataFrame(page.rows, columns=page.columns)))
+
+
+def run_question(question, db):
+    """Time one question through every stage; returns ({stage: ms}, error or None)"""
+    timings = {}
+
+    started = time.perf_counter()
+    catalog = get_catalog(db)
+    table_structure = catalog.table_structure()
+    relationships = catalog.relationships()
+    timings["schema"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    prompt = build_prompt(question, table_structure, relationships, dialect=backend_for(db))
+    timings["prompt"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    sql = get_genai_response(question, prompt)
+    timings["generate"] = (time.perf_counter() - started) * 1000
+    if sql.startswith("❌"):
+        return timings, sql
+
+    started = time.perf_counter()
+    page = read_sql_arrow(sql, db)
+    timings["execute"] = (time.perf_counter() - started) * 1000
+    if page.error:
+        return timings, page.error
+
+    started = time.perf_counter()
+    render(page)
+    timings["render"] = (time.perf_counter() - started) * 1000
+    timings["total"] = sum(timings.values())
+    return timings, None
+
+
+def summarize(samples):
+    """{p50, p95, p99, mean, count} in milliseconds"""
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples)
+    summary = {f"p{p}": round(float(np.percentile(values, p)), 3) for p in PERCENTILES}
+    summary.update(mean=round(float(values.mean()), 3), count=len(samples))
+    return summary
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def bench_scale(db, questions, repeat=3, warmup=1, concurrency=1):
+    """Run the corpus ``repeat`` times against one database and summarize each stage"""
+    for _ in range(warmup):
+        for question in questions:
+            run_question(question, db)
+
+    samples = {stage: [] for stage in STAGES}
+    errors = []
+    work = [question for _ in range(repeat) for question in questions]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as pool:
+        for question, (timings, error) in zip(work, pool.map(lambda q: run_question(q, db), work)):
+            for stage, ms in timings.items():
+                samples[stage].append(ms)
+            if error:
+                errors.append({"question": question, "error": error})
+    elapsed = time.perf_counter() - started
+
+    # Separate pass for allocations: tracemalloc slows everything down, so it is kept out of the timings
+    tracemalloc.start()
+    for question in questions:
+        run_question(question, db)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "stages": {stage: summarize(values) for stage, values in samples.items()},
+        "questions": len(work),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_qps": round(len(work) / elapsed, 2) if elapsed else None,
+        "errors": errors[:20],
+        "error_count": len(errors),
+        "peak_python_mb": round(traced_peak / (1024 * 1024), 2),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _transport_pass(transport, db, rows):
+    timings = {}
+    started = time.perf_counter()
+    if transport == "rows":
+        page = read_sql_page(TRANSPORT_SQL, db, limit=rows)
+    else:
+        page = read_sql_arrow(TRANSPORT_SQL, db, limit=rows)
+    timings["execute"] = (time.perf_counter() - started) * 1000
+    if page.error:
+        raise RuntimeError(page.error)
+    started = time.perf_counter()
+    size = render_rows(page) if transport == "rows" else ipc_size(page.table)
+    timings["render"] = (time.perf_counter() - started) * 1000
+    timings["total"] = timings["execute"] + timings["render"]
+    return timings, (len(page.rows) if transport == "rows" else page.table.num_rows), size
+
+
+def bench_transport_process(transport, db, rows, repeat=3):
+    """One transport in this (fresh) process: stage timings, then memory high-water marks"""
+    import pyarrow as pa
+
+    set_result_cache(ResultCache(memory_budget=0))
+    rss_before = peak_rss_mb()
+    samples = {"execute": [], "render": [], "total": []}
+    for _ in range(repeat):
+        timings, fetched, size = _transport_pass(transport, db, rows)
+        for stage, ms in timings.items():
+            samples[stage].append(ms)
+    rss_after = peak_rss_mb()
+    arrow_peak = pa.default_memory_pool().max_memory()
+
+    # Separate pass for allocations, as in bench_scale
+    tracemalloc.start()
+    _transport_pass(transport, db, rows)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "transport": transport,
+        "rows": fetched,
+        "ipc_mb": round(size / (1024 * 1024), 2),
+        "stages": {stage: summarize(values) for stage, values in samples.items()},
+        "peak_python_mb": round(traced_peak / (1024 * 1024), 2),
+        "peak_arrow_mb": round(arrow_peak / (1024 * 1024), 2),
+        "peak_rss_mb": rss_after,
+        "rss_growth_mb": round(rss_after - rss_before, 1) if rss_after is not None else None,
+    }
+
+
+def bench_transport(db, rows, repeat=3):
+    """Compare the row and columnar result paths on ``rows`` rows, each in its own process"""
+    # Million-row reads take export-sized time (more under tracemalloc); set before the children import sql_guard
+    os.environ.setdefault("NL2SQL_QUERY_TIMEOUT", os.getenv("NL2SQL_EXPORT_TIMEOUT", "120"))
+    results = []
+    for transport in TRANSPORTS:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results.append(pool.submit(bench_transport_process, transport, str(db), rows, repeat).result())
+    return results
+
+
+def table_sizes(db):
+    conn = sqlite3.connect(f"file:{Path(db).resolve().as_posix()}?mode=ro", uri=True)
+    try:
+        return {table: conn.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()[0] or 0
+                for table in ("STUDENT", "COURSES", "ENROLLMENTS")}
+    finally:
+        conn.close()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmark(scales, questions=QUESTIONS, backend="fake", latency=0.0, url=None, repeat=3,
+                  warmup=1, concurrency=1, seed=DEFAULT_SEED, result_cache=False):
+    """Benchmark every scale and return the JSON-serializable report"""
+    previous = set_client(make_client(backend, latency, url))
+    cache = ResultCache() if result_cache else ResultCache(memory_budget=0)
+    previous_cache = set_result_cache(cache)
+    try:
+        results = []
+        for spec in scales:
+            students, courses = parse_scale(spec)
+            db = ensure_database(students, courses, seed)
+            result = bench_scale(str(db), questions, repeat, warmup, concurrency)
+            results.append({"scale": spec, "db": db.name, "rows": table_sizes(db), **result})
+    finally:
+        set_client(previous)
+        set_result_cache(previous_cache)
+        cache.clear()
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "backend": backend,
+            "latency_s": latency,
+            "repeat": repeat,
+            "concurrency": concurrency,
+            "seed": seed,
+            "result_cache": result_cache,
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline, threshold=0.2):
+    """[(scale, stage, old p95, new p95)] where p95 grew by more than ``threshold`` (and the noise floor)"""
+    regressions = []
+    old_results = {r["scale"]: r for r in baseline.get("results", [])}
+    for result in report["results"]:
+        old = old_results.get(result["scale"])
+        if not old:
+            continue
+        for stage, summary in result["stages"].items():
+            old_p95 = old["stages"].get(stage, {}).get("p95")
+            new_p95 = summary.get("p95")
+            if old_p95 is None or new_p95 is None:
+                continue
+            if new_p95 > old_p95 * (1 + threshold) and new_p95 - old_p95 > NOISE_FLOOR_MS:
+                regressions.append((result["scale"], stage, old_p95, new_p95))
+    return regressions
+
+
+def print_report(report):
+    for result in report["results"]:
+        rows = result["rows"]
+        print(f"\n== scale {result['scale']} ({rows['STUDENT']:,} students, {rows['ENROLLMENTS']:,} enrollments) ==")
+        print(f"{'stage':<10}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}{'mean ms':>12}")
+        for stage, summary in result["stages"].items():
+            if summary["count"]:
+                print(f"{stage:<10}{summary['p50']:>12.2f}{summary['p95']:>12.2f}"
+                      f"{summary['p99']:>12.2f}{summary['mean']:>12.2f}")
+        print(f"throughput {result['throughput_qps']} q/s, errors {result['error_count']}, "
+              f"peak python {result['peak_python_mb']} MB, peak rss {result['peak_rss_mb']} MB")
+
+
+def print_transport(results):
+    print(f"{'transport':<12}{'rows':>10}{'execute ms':>12}{'render ms':>12}{'total ms':>12}"
+          f"{'python MB':>11}{'arrow MB':>10}{'rss +MB':>9}")
+    for result in results:
+        stages = result["stages"]
+        print(f"{result['transport']:<12}{result['rows']:>10,}{stages['execute']['p50']:>12.1f}"
+              f"{stages['render']['p50']:>12.1f}{stages['total']['p50']:>12.1f}{result['peak_python_mb']:>11.1f}"
+              f"{result['peak_arrow_mb']:>10.1f}{result['rss_growth_mb'] or 0:>9.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the NL→SQL pipeline stage by stage")
+    parser.add_argument("--scales", default=DEFAULT_SCALES,
+                        help="comma-separated students[:courses] database sizes (built with sql.py)")
+    parser.add_argument("--questions", help="JSONL/CSV question file (default: built-in corpus)")
+    parser.add_argument("--backend", choices=("fake", "http", "gemini"), default="fake")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake model seconds per call")
+    parser.add_argument("--url", help="model server URL for --backend http")
+    parser.add_argument("--repeat", type=int, default=3, help="timed passes over the corpus")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed passes before measuring")
+    parser.add_argument("--concurrency", type=int, default=1, help="questions in flight at once")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--result-cache", action="store_true", help="serve repeated queries from the result cache")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results JSON; exit 1 if a stage's p95 regressed")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative p95 increase")
+    parser.add_argument("--transport", type=int, metavar="ROWS",
+                        help="compare row-tuple and Arrow result transport on ROWS rows instead of the corpus")
+    parser.add_argument("--db", help="--transport: database to read (default: built from the last --scales entry)")
+    args = parser.parse_args(argv)
+
+    if args.transport:
+        db = args.db or ensure_database(*parse_scale(args.scales.split(",")[-1].strip()), args.seed)
+        results = bench_transport(db, args.transport, max(1, args.repeat))
+        print_transport(results)
+        report = {"meta": {"commit": git_commit(), "python": platform.python_version(),
+                           "sqlite": sqlite3.sqlite_version, "platform": platform.platform(),
+                           "db": Path(db).name, "sql": TRANSPORT_SQL, "repeat": max(1, args.repeat)},
+                  "transport": results}
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.out}")
+        return
+
+    questions = QUESTIONS
+    if args.questions:
+        from batch import load_questions
+
+        questions = [question for _, question in load_questions(args.questions)]
+
+    report = run_benchmark([s.strip() for s in args.scales.split(",") if s.strip()], questions,
+                           args.backend, args.latency, args.url, max(1, args.repeat),
+                           max(0, args.warmup), max(1, args.concurrency), args.seed, args.result_cache)
+    print_report(report)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for key in ("backend", "latency_s", "concurrency", "seed", "result_cache"):
+            if baseline.get("meta", {}).get(key) != report["meta"][key]:
+                print(f"warning: baseline was run with {key}={baseline.get('meta', {}).get(key)!r}, "
+                      f"this run with {report['meta'][key]!r}")
+        regressions = compare(report, baseline, args.threshold)
+        for scale, stage, old, new in regressions:
+            print(f"REGRESSION scale {scale} {stage}: p95 {old:.2f} ms -> {new:.2f} ms")
+        if regressions:
+            sys.exit(1)
+        print(f"No p95 regressions against {args.compare}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Follow-up questions, question-level deduplication and prefetch of likely refinements.
+
+A session keeps its last answered question and SQL as a ``Turn``. A short
+question that starts like a refinement ("...with GPA > 3.5", "sorted by
+GPA") is a follow-up: it resolves to the previous question plus the
+refinement, which is what the NL cache is keyed on, and on a miss the model
+gets a refinement prompt (prompt_builder.build_refinement_prompt) with the
+previous SQL instead of the full prompt.
+
+After each answer the ``Prefetcher`` generates the likely next refinements
+in one batched call, but only while the shared token bucket holds more
+than ``NL2SQL_PREFETCH_RESERVE`` tokens, so speculative calls never make a
+real question wait. Prefetched SQL that runs is put in the NL cache (its
+first page lands in the result cache), so the follow-up is answered
+without a model call. The same in-flight table lets a question that is
+already being generated, by a prefetch or another session, wait for that
+call instead of making its own.
+"""
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import nl_cache
+from backends import backend_for
+from llm_client import get_client
+from nl2sql import get_genai_batch_response
+from prompt_builder import build_refinement_prompt, key_columns, sql_tables
+from results import read_sql_arrow
+from schema_catalog import get_catalog
+from telemetry import span
+
+# Tokens the prefetcher always leaves in the shared bucket for questions users actually ask
+PREFETCH_RESERVE = int(os.getenv("NL2SQL_PREFETCH_RESERVE", "5"))
+# Follow-ups generated after each answer (0 turns prefetching off)
+PREFETCH_MAX = int(os.getenv("NL2SQL_PREFETCH_MAX", "3"))
+# How long a question waits for an identical generation already in flight before making its own
+# (also when an unreleased claim is considered abandoned, e.g. after a Streamlit rerun)
+DEDUP_WAIT_SECONDS = 30
+MAX_FOLLOW_UP_WORDS = 8
+RECENT_FOLLOW_UPS = 5
+
+FOLLOW_UP_WORDS = {
+    "with", "without", "and", "but", "only", "just", "sorted", "sort", "order", "ordered",
+    "where", "whose", "excluding", "except", "also", "now", "limit", "filter", "filtered",
+}
+
+_ELLIPSIS_RE = re.compile(r"^\s*(?:…|\.{2,})\s*")
+_NUMERIC_TYPES = ("INT", "REAL", "FLOA", "DOUB", "NUM", "DEC")
+
+Turn = namedtuple("Turn", "question sql db")
+
+
+def is_follow_up(question):
+    """True if ``question`` reads as a refinement of the previous one rather than a new question"""
+    if _ELLIPSIS_RE.match(question):
+        return True
+    words = question.split()
+    return 0 < len(words) <= MAX_FOLLOW_UP_WORDS and words[0].lower().strip(",") in FOLLOW_UP_WORDS
+
+
+def follow_up_text(question):
+    """The refinement without a leading ellipsis"""
+    return _ELLIPSIS_RE.sub("", question).strip()
+
+
+def resolve(turn, question):
+    """The standalone question a follow-up stands for: the previous question plus the refinement"""
+    return f"{turn.question.strip().rstrip('?.')} {follow_up_text(question)}"
+
+
+def _is_numeric(declared_type):
+    declared_type = (declared_type or "").upper()
+    return any(name in declared_type for name in _NUMERIC_TYPES)
+
+
+def likely_follow_ups(turn, table_structure, recent=(), limit=PREFETCH_MAX):
+    """Refinements worth preparing: the session's own recent follow-ups, then sorts on numeric columns"""
+    asked = nl_cache.normalize_question(turn.question)
+    candidates = [follow_up_text(text) for text in recent]
+    by_upper = {name.upper(): name for name in table_structure}
+    for table in sql_tables(turn.sql):
+        info = table_structure.get(by_upper.get(table.upper()))
+        if not info:
+            continue
+        keys = key_columns(info)
+        candidates.extend(f"sorted by {col[1].lower().replace('_', ' ')}" for col in info['columns']
+                          if col[1] not in keys and _is_numeric(col[2]))
+    # Refinements the question already contains would resolve to a near-duplicate of it
+    candidates = [text for text in dict.fromkeys(candidates)
+                  if text and nl_cache.normalize_question(text) not in asked]
+    return candidates[:limit]
+
+
+class Prefetcher:
+    """Background generation of likely follow-ups, plus the table of questions being generated"""
+
+    def __init__(self, reserve=PREFETCH_RESERVE, max_questions=PREFETCH_MAX):
+        self.reserve = reserve
+        self.max_questions = max_questions
+        self.stats = {'scheduled': 0, 'prefetched': 0, 'skipped': 0, 'hits': 0, 'shared': 0}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._in_flight = {}  # (fingerprint, question key) -> (Future with the SQL or None, claimed at)
+        self._prefetched = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(question, fp):
+        return fp, nl_cache.normalize_question(question)
+
+    def claim(self, question, fp):
+        """(future, owner): the owner generates and must ``release``; everyone else waits on the future"""
+        key = self._key(question, fp)
+        now = time.monotonic()
+        with self._lock:
+            future, claimed_at = self._in_flight.get(key, (None, 0.0))
+            if future is not None and now - claimed_at < DEDUP_WAIT_SECONDS:
+                self.stats['shared'] += 1
+                return future, False
+            future = Future()
+            self._in_flight[key] = (future, now)
+            return future, True
+
+    def release(self, question, fp, sql):
+        """Hand ``sql`` (None or a "❌" message on failure) to the questions waiting on this one"""
+        with self._lock:
+            future, _ = self._in_flight.pop(self._key(question, fp), (None, 0.0))
+        if future is not None:
+            future.set_result(None if not sql or sql.startswith("❌") else sql)
+
+    def wait(self, future, timeout=DEDUP_WAIT_SECONDS):
+        """SQL from a generation claimed by someone else, or None if it failed or took too long"""
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            return None
+
+    def note_hit(self, question, fp):
+        """Count a cache hit that a prefetch provided"""
+        key = self._key(question, fp)
+        with self._lock:
+            if key in self._prefetched:
+                self._prefetched.discard(key)
+                self.stats['hits'] += 1
+
+    def schedule(self, turn, fp, recent=()):
+        """Queue a prefetch of the follow-ups of ``turn``; returns the Future (number of questions cached)"""
+        if self.max_questions <= 0:
+            return None
+        with self._lock:
+            self.stats['scheduled'] += 1
+        return self._executor.submit(self._prefetch, turn, fp, tuple(recent))
+
+    def _prefetch(self, turn, fp, recent):
+        # Spare quota only: below the reserve, the tokens belong to questions users are asking
+        if get_client().limiter.available() < self.reserve + 1:
+            with self._lock:
+                self.stats['skipped'] += 1
+            return 0
+        catalog = get_catalog(turn.db)
+        table_structure = catalog.table_structure()
+        query_cache = nl_cache.get_cache()
+        owned = []
+        for text in likely_follow_ups(turn, table_structure, recent, self.max_questions):
+            question = resolve(turn, text)
+            if query_cache.contains(question, fp):
+                continue
+            future, owner = self.claim(question, fp)
+            if owner:
+                owned.append(text)
+        if not owned:
+            return 0
+
+        answers = {}
+        try:
+            with span("prefetch", questions=len(owned)) as attributes:
+                prompt = build_refinement_prompt(turn.question, turn.sql, " ".join(owned), table_structure,
+                                                 catalog.relationships(), dialect=backend_for(turn.db))
+                for text, sql in zip(owned, get_genai_batch_response(owned, prompt)):
+                    if not sql or sql.startswith("❌"):
+                        continue
+                    # Cached only if it runs, as in the app; the first page also warms the result cache
+                    if read_sql_arrow(sql, turn.db).error:
+                        continue
+                    query_cache.put(resolve(turn, text), fp, sql)
+                    answers[text] = sql
+                attributes['cached'] = len(answers)
+        finally:
+            for text in owned:
+                self.release(resolve(turn, text), fp, answers.get(text))
+        with self._lock:
+            self.stats['prefetched'] += len(answers)
+            self._prefetched.update(self._key(resolve(turn, text), fp) for text in answers)
+        return len(answers)
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher():
+    """Process-wide prefetcher (module state survives Streamlit reruns)"""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher()
+        return _prefetcher
@@ -0,0 +1,203 @@
+"""Shared read-only SQLite execution engine.
+
+Every Streamlit session runs its queries through one engine per database
+file. The engine keeps a pool of read-only connections (``mode=ro`` URI)
+tuned for reads, so opening a connection and applying pragmas drops out of
+the per-query latency. Each connection keeps its own prepared-statement
+cache, which sqlite3 looks up by SQL text.
+
+The engine never writes to the file. ``NL2SQL_SQLITE_WAL=1`` lets it switch
+the database to WAL on first use (so readers never block on a writer); that
+setting persists in the file, so it is off by default.
+
+``get_engine`` hands out a DuckDB engine (duckdb_backend.py) instead for
+``.duckdb`` files; both share ConnectionPool and the execute/cursor API.
+"""
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from backends import backend_for
+from sql_guard import guarded_cursor
+from telemetry import span, value_bytes
+
+DEFAULT_POOL_SIZE = 8
+STATEMENT_CACHE_SIZE = 256
+
+READ_PRAGMAS = (
+    "PRAGMA mmap_size=268435456;",  # 256 MiB memory-mapped I/O
+    "PRAGMA cache_size=-65536;",    # 64 MiB page cache per connection
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA query_only=ON;",
+)
+
+ENABLE_WAL = os.getenv("NL2SQL_SQLITE_WAL", "0") == "1"
+
+
+def journal_mode(db_path):
+    """The database's journal mode, read without writing to it (None if it can't be opened)"""
+    if not Path(db_path).exists():
+        return None
+    try:
+        conn = sqlite3.connect(f"file:{Path(db_path).resolve().as_posix()}?mode=ro", uri=True)
+        try:
+            return conn.execute("PRAGMA journal_mode;").fetchone()[0].lower()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+
+
+def enable_wal(db_path):
+    """Switch the database to WAL so readers never block on a writer (persists in the file)"""
+    if not Path(db_path).exists():
+        return False
+    try:
+        conn = sqlite3.connect(db_path, timeout=5)
+        try:
+            mode = conn.execute("PRAGMA journal_mode=WAL;").fetchone()[0]
+        finally:
+            conn.close()
+        return mode.lower() == "wal"
+    except sqlite3.Error:
+        # Read-only filesystem or locked database: keep the current journal mode
+        return False
+
+
+class ConnectionPool:
+    """Thread-safe pool of read-only connections to one SQLite file
+
+    ``connect`` replaces the SQLite connection factory (the DuckDB engine
+    pools cursors of its own database handle).
+    """
+
+    def __init__(self, db_path, size=DEFAULT_POOL_SIZE, cached_statements=STATEMENT_CACHE_SIZE, connect=None):
+        self.db_path = str(db_path)
+        self.size = size
+        self.cached_statements = cached_statements
+        self._factory = connect
+        self._uri = f"file:{Path(self.db_path).resolve().as_posix()}?mode=ro"
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._all = []
+
+    def _connect(self):
+        if self._factory is not None:
+            conn = self._factory()
+        else:
+            conn = sqlite3.connect(
+                self._uri,
+                uri=True,
+                check_same_thread=False,
+                cached_statements=self.cached_statements,
+            )
+            for pragma in READ_PRAGMAS:
+                conn.execute(pragma)
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            if conn in self._all:
+                self._all.remove(conn)
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; blocks while all ``size`` connections are in use"""
+        self._slots.acquire()
+        conn = None
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            yield conn
+        finally:
+            if conn is not None:
+                try:
+                    if getattr(conn, "in_transaction", False):
+                        conn.rollback()
+                    self._idle.put(conn)
+                except sqlite3.Error:
+                    # Don't recycle a connection that can no longer roll back
+                    self._discard(conn)
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            conns, self._all = self._all, []
+        for conn in conns:
+            conn.close()
+        self._idle = queue.LifoQueue()
+
+
+class ExecutionEngine:
+    """Runs read-only statements against one database through a connection pool"""
+
+    backend = "sqlite"
+
+    def __init__(self, db_path, pool_size=DEFAULT_POOL_SIZE):
+        self.db_path = str(db_path)
+        self.wal_enabled = enable_wal(self.db_path) if ENABLE_WAL else journal_mode(self.db_path) == "wal"
+        self.pool = ConnectionPool(self.db_path, size=pool_size)
+
+    def execute(self, sql, params=()):
+        """Run a statement and return all rows"""
+        with self.pool.connection() as conn:
+            cur = conn.execute(sql, params)
+            try:
+                return cur.fetchall()
+            finally:
+                cur.close()
+
+    @contextmanager
+    def cursor(self, sql, params=()):
+        """Yield an open cursor so callers can consume rows incrementally"""
+        with self.pool.connection() as conn:
+            cur = conn.execute(sql, params)
+            try:
+                yield cur
+            finally:
+                cur.close()
+
+    def close(self):
+        self.pool.close()
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(db_path="student.db"):
+    """Process-wide engine for ``db_path`` (module state survives Streamlit reruns)"""
+    key = str(Path(db_path).resolve())
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            if backend_for(db_path) == "duckdb":
+                # Imported here so duckdb stays optional for SQLite-only installs
+                from duckdb_backend import DuckDBEngine
+
+                engine = _engines[key] = DuckDBEngine(db_path)
+            else:
+                engine = _engines[key] = ExecutionEngine(db_path)
+        return engine
+
+
+def read_sql_query(sql, db):
+    """Run generated SQL read-only; errors come back as a single ("Error", message) row"""
+    with span("execute") as attributes:
+        try:
+            with guarded_cursor(get_engine(db), sql) as cur:
+                rows = cur.fetchall()
+        except Exception as e:
+            attributes['error'] = str(e)
+            return [("Error", str(e))]
+        attributes.update(rows=len(rows), bytes=value_bytes(rows))
+        return rows
@@ -0,0 +1,293 @@
+"""DuckDB backend: pooled read-only engine, guard and catalog for ``.duckdb`` files.
+
+DuckDB stores tables column by column and runs aggregates vectorized and
+in parallel, so analytical questions (GROUP BY over ENROLLMENTS) run much
+faster than on SQLite. The engine opens the file once, read-only and with
+file system access disabled (no read_csv('/etc/passwd') from generated
+SQL), and pools cursors of that handle. The guard reuses sql_guard's
+statement check and scan/join limits, the latter applied to DuckDB's own
+JSON plan (table sizes from the catalog, join sizes from the optimizer's
+cardinality estimates). DuckDB has no authorizer or VM-step hook, so the
+run-time budget is a timer that interrupts the query.
+
+Build a DuckDB copy of a SQLite database with
+
+    python sql.py --duckdb student.duckdb
+"""
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from db_engine import DEFAULT_POOL_SIZE, ConnectionPool
+from schema_catalog import get_catalog
+from sql_guard import QUERY_TIMEOUT_SECONDS, QueryCancelled, check_costs, check_statement
+
+COPY_BATCH_SIZE = 100_000
+# Operators that may pair every row of one input with every row of the other (range joins included)
+NESTED_LOOP_OPERATORS = {"CROSS_PRODUCT", "NESTED_LOOP_JOIN", "BLOCKWISE_NL_JOIN", "PIECEWISE_MERGE_JOIN", "IE_JOIN"}
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _extra_info(node):
+    info = node.get("extra_info")
+    return info if isinstance(info, dict) else {}
+
+
+def _estimated_rows(node):
+    """The optimizer's row estimate for a plan node (its nearest estimated descendant's if it has none)"""
+    rows = str(_extra_info(node).get("Estimated Cardinality", "")).lstrip("~")
+    if rows.isdigit():
+        return int(rows)
+    return max((_estimated_rows(child) for child in node.get("children", [])), default=1)
+
+
+def estimate_plan(conn, sql, table_structure):
+    """sql_guard.estimate_plan for DuckDB: (plan, largest full scan, largest nested-loop product)"""
+    plan = json.loads(conn.execute("EXPLAIN (FORMAT JSON) " + sql).fetchall()[0][1])
+    by_upper = {name.upper(): name for name in table_structure}
+    largest_scan = largest_product = 0
+    nodes = list(plan)
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.get("children", []))
+        if node.get("name") in ("SEQ_SCAN", "TABLE_SCAN"):
+            # "Table" is catalog.schema.name; filters don't shrink what a full scan reads
+            table = by_upper.get(str(_extra_info(node).get("Table", "")).rsplit(".", 1)[-1].upper())
+            rows = table_structure[table]['row_count'] if table else _estimated_rows(node)
+            largest_scan = max(largest_scan, rows)
+        elif node.get("name") in NESTED_LOOP_OPERATORS:
+            product = 1
+            for child in node.get("children", []):
+                product *= max(_estimated_rows(child), 1)
+            largest_product = max(largest_product, product)
+    return plan, largest_scan, largest_product
+
+
+class DuckDBEngine:
+    """Runs read-only statements against one DuckDB file through a pool of cursors"""
+
+    backend = "duckdb"
+
+    def __init__(self, db_path, pool_size=DEFAULT_POOL_SIZE):
+        import duckdb
+
+        self.db_path = str(db_path)
+        self.wal_enabled = False
+        self._database = duckdb.connect(
+            self.db_path, read_only=True,
+            config={"enable_external_access": False, "lock_configuration": True},
+        )
+        self.pool = ConnectionPool(self.db_path, size=pool_size, connect=self._database.cursor)
+
+    def execute(self, sql, params=()):
+        """Run a statement and return all rows"""
+        with self.pool.connection() as conn:
+            return conn.execute(sql, list(params)).fetchall()
+
+    @contextmanager
+    def cursor(self, sql, params=()):
+        """Yield an executed cursor so callers can consume rows incrementally"""
+        with self.pool.connection() as conn:
+            yield conn.execute(sql, list(params))
+
+    @contextmanager
+    def guarded_cursor(self, sql, timeout=QUERY_TIMEOUT_SECONDS, max_steps=None, monitor=None):
+        """Validate ``sql`` and yield a cursor running it, interrupted after ``timeout`` seconds
+
+        Statements whose plan scans or joins more rows than sql_guard allows
+        are rejected before they run. ``monitor`` is attached to the cursor
+        so it can interrupt it (there is no step count to report).
+        """
+        import duckdb
+
+        sql = check_statement(sql)
+        table_structure = get_catalog(self.db_path).table_structure()
+        with self.pool.connection() as conn:
+            _, largest_scan, largest_product = estimate_plan(conn, sql, table_structure)
+            check_costs(largest_scan, largest_product)
+            timer = threading.Timer(timeout, conn.interrupt) if timeout else None
+            if timer:
+                timer.daemon = True
+                timer.start()
+            if monitor is not None:
+                monitor.attach(conn)
+            try:
+                yield conn.execute(sql)
+            except duckdb.InterruptException as e:
+                raise QueryCancelled(f"Query exceeded its budget ({timeout:g}s) and was cancelled.") from e
+            finally:
+                if monitor is not None:
+                    monitor.detach()
+                if timer:
+                    timer.cancel()
+
+    def close(self):
+        self.pool.close()
+        self._database.close()
+
+
+class DuckDBCatalog:
+    """Cached metadata for one DuckDB file, shaped like SchemaCatalog's
+
+    DuckDB has no schema/data version pragmas; the file's and its WAL's
+    size and mtime stand in for them.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._tables = {}
+        self._relationships = []
+
+    def _file_stamp(self):
+        path = Path(self.db_path)
+        wal = path.with_name(path.name + ".wal")
+        stat = path.stat()
+        wal_stamp = (wal.stat().st_size, wal.stat().st_mtime_ns) if wal.exists() else None
+        return (stat.st_size, stat.st_mtime_ns), wal_stamp
+
+    def _load(self):
+        from db_engine import get_engine
+
+        engine = get_engine(self.db_path)
+        tables = [row[0] for row in engine.execute(
+            "SELECT table_name FROM duckdb_tables() WHERE schema_name = 'main' ORDER BY table_name;")]
+        structure = {}
+        relationships = []
+        for table in tables:
+            # Same tuple layout as SQLite's PRAGMA table_info / foreign_key_list / index_list
+            columns = [tuple(row) for row in engine.execute(f"PRAGMA table_info({_quote(table)});")]
+            foreign_keys = []
+            for n, (ref_table, from_columns, to_columns) in enumerate(engine.execute(
+                    "SELECT referenced_table, constraint_column_names, referenced_column_names "
+                    "FROM duckdb_constraints() WHERE table_name = ? AND constraint_type = 'FOREIGN KEY';",
+                    (table,))):
+                for seq, (from_column, to_column) in enumerate(zip(from_columns, to_columns)):
+                    foreign_keys.append((n, seq, ref_table, from_column, to_column, "NO ACTION", "NO ACTION", "NONE"))
+                    relationships.append({
+                        'from_table': table,
+                        'from_column': from_column,
+                        'to_table': ref_table,
+                        'to_column': to_column
+                    })
+            indexes = [(seq, name, int(unique), "c", 0) for seq, (name, unique) in enumerate(engine.execute(
+                "SELECT index_name, is_unique FROM duckdb_indexes() WHERE table_name = ?;", (table,)))]
+            structure[table] = {
+                'columns': columns,
+                'foreign_keys': foreign_keys,
+                'indexes': indexes,
+                # COUNT(*) is answered from row group metadata, so exact counts are cheap
+                'row_count': engine.execute(f"SELECT COUNT(*) FROM {_quote(table)};")[0][0],
+                'row_count_exact': True
+            }
+        self._tables = structure
+        self._relationships = relationships
+
+    def refresh(self):
+        """Re-introspect if the file changed; returns its (file, WAL) stamps"""
+        with self._lock:
+            stamp = self._file_stamp()
+            if stamp != self._stamp:
+                self._load()
+                self._stamp = stamp
+            return stamp
+
+    def table_structure(self):
+        self.refresh()
+        return self._tables
+
+    def relationships(self):
+        self.refresh()
+        return self._relationships
+
+    @property
+    def version(self):
+        return self._stamp
+
+
+def _duckdb_type(declared_type):
+    declared_type = (declared_type or "").strip().upper()
+    if not declared_type:
+        return "VARCHAR"
+    # SQLite INTEGER and REAL are 64-bit
+    if declared_type in ("INT", "INTEGER"):
+        return "BIGINT"
+    return "DOUBLE" if declared_type in ("REAL", "FLOAT") else declared_type
+
+
+def _load_order(table_structure):
+    """Tables with every referenced table before its children"""
+    ordered, visiting = [], set()
+
+    def visit(table):
+        if table in ordered or table in visiting:
+            return
+        visiting.add(table)
+        for fk in table_structure[table]['foreign_keys']:
+            if fk[2] in table_structure:
+                visit(fk[2])
+        ordered.append(table)
+
+    for table in sorted(table_structure):
+        visit(table)
+    return ordered
+
+
+def copy_from_sqlite(sqlite_path, duckdb_path, batch_size=COPY_BATCH_SIZE):
+    """Create ``duckdb_path`` with the tables, keys and rows of a SQLite database; returns row counts"""
+    import duckdb
+    import pyarrow as pa
+
+    from schema_catalog import SchemaCatalog
+
+    catalog = SchemaCatalog(sqlite_path)
+    table_structure = {name: info for name, info in catalog.table_structure().items()
+                       if not name.startswith("sqlite_")}
+    for leftover in (duckdb_path, str(duckdb_path) + ".wal"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    source = sqlite3.connect(f"file:{Path(sqlite_path).resolve().as_posix()}?mode=ro", uri=True)
+    target = duckdb.connect(str(duckdb_path))
+    counts = {}
+    try:
+        for table in _load_order(table_structure):
+            info = table_structure[table]
+            definitions = [f"{_quote(col[1])} {_duckdb_type(col[2])}" for col in info['columns']]
+            keys = [col[1] for col in sorted(info['columns'], key=lambda col: col[5]) if col[5]]
+            if keys:
+                definitions.append(f"PRIMARY KEY ({', '.join(_quote(key) for key in keys)})")
+            for fk in info['foreign_keys']:
+                definitions.append(f"FOREIGN KEY ({_quote(fk[3])}) REFERENCES {_quote(fk[2])} ({_quote(fk[4])})")
+            target.execute(f"CREATE TABLE {_quote(table)} ({', '.join(definitions)});")
+
+            names = [col[1] for col in info['columns']]
+            cursor = source.execute(f"SELECT {', '.join(_quote(name) for name in names)} FROM {_quote(table)};")
+            counts[table] = 0
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                # SQLite columns can mix types (95 and 95.5 under NUMERIC); the insert casts to the column type
+                arrays = []
+                for values in zip(*rows):
+                    try:
+                        arrays.append(pa.array(values))
+                    except (pa.ArrowInvalid, pa.ArrowTypeError):
+                        arrays.append(pa.array([None if v is None else str(v) for v in values]))
+                batch = pa.Table.from_arrays(arrays, names=names)
+                target.register("sqlite_batch", batch)
+                target.execute(f"INSERT INTO {_quote(table)} SELECT * FROM sqlite_batch;")
+                target.unregister("sqlite_batch")
+                counts[table] += len(rows)
+        target.execute("CHECKPOINT;")
+    finally:
+        target.close()
+        source.close()
+    return counts
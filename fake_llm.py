@@ -0,0 +1,203 @@
+"""Deterministic stand-in for Gemini, for tests and benchmarks without network access.
+
+``FakeModel`` maps the question at the end of a prompt to SQL with a few
+keyword rules. ``stream`` sends the answer a few characters at a time,
+optionally fenced and followed by commentary the way Gemini often
+answers, so early statement detection can be measured. Refinement prompts
+(a "Previous SQL:" line) get that SQL with the follow-up's filter, sort or
+limit applied. ``serve`` exposes it over HTTP with the protocol that
+llm_client.HTTPModel speaks, optionally answering 429 above a request
+rate (or to the first few requests) so retry behaviour can be exercised;
+``make_server`` returns the server unstarted, for tests:
+
+    python fake_llm.py --port 8765 --latency 0.5 --rpm 15
+    NL2SQL_LLM_URL=http://127.0.0.1:8765/ streamlit run app.py
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RULES = [
+    (("average", "mark", "department"),
+     "SELECT d.DEPT_NAME, AVG(e.MARKS) FROM DEPARTMENTS d JOIN STUDENT s ON d.DEPT_ID = s.DEPT_ID "
+     "JOIN ENROLLMENTS e ON s.STUDENT_ID = e.STUDENT_ID GROUP BY d.DEPT_NAME;"),
+    (("instructor", "most"),
+     "SELECT i.INSTRUCTOR_NAME, COUNT(c.COURSE_ID) as course_count FROM INSTRUCTORS i "
+     "JOIN COURSES c ON i.INSTRUCTOR_ID = c.INSTRUCTOR_ID GROUP BY i.INSTRUCTOR_NAME "
+     "ORDER BY course_count DESC LIMIT 1;"),
+    (("gpa",), "SELECT NAME, GPA FROM STUDENT WHERE GPA > 3.5;"),
+    (("how many", "enrollment"), "SELECT COUNT(*) FROM ENROLLMENTS;"),
+    (("how many", "course"), "SELECT COUNT(*) FROM COURSES;"),
+    (("how many", "student"), "SELECT COUNT(*) FROM STUDENT;"),
+    (("enrollment",), "SELECT * FROM ENROLLMENTS;"),
+    (("course",), "SELECT COURSE_NAME, CREDITS FROM COURSES;"),
+    (("instructor",), "SELECT INSTRUCTOR_NAME, SALARY FROM INSTRUCTORS;"),
+    (("department",), "SELECT DEPT_NAME, BUDGET FROM DEPARTMENTS;"),
+]
+DEFAULT_SQL = "SELECT NAME FROM STUDENT;"
+
+_PREVIOUS_SQL_RE = re.compile(r"^Previous SQL: (.+)$", re.MULTILINE)
+_FILTER_RE = re.compile(r"\b(?:with|where|and) ([a-z_ ]+?) *(>=|<=|>|<|=) *(\d+(?:\.\d+)?)")
+_ORDER_RE = re.compile(r"\b(?:sort|sorted|order|ordered) by ([a-z_ ]+?)(?: (asc|ascending|desc|descending))?(?:$|[,;.])")
+_LIMIT_RE = re.compile(r"\b(?:top|first|limit) (\d+)")
+_WHERE_RE = re.compile(r"\bWHERE\b", re.IGNORECASE)
+_TAIL_RE = re.compile(r"\s+(GROUP BY|ORDER BY|LIMIT)\b", re.IGNORECASE)
+
+
+def question_from_prompt(prompt):
+    return prompt.rsplit("Question:", 1)[-1].strip()
+
+
+def _column(words):
+    return words.strip().replace(" ", "_").upper()
+
+
+def refine(previous_sql, follow_up):
+    """Apply a follow-up's "with <column> > <n>", "sorted by <column>" and "top <n>" to the previous SQL"""
+    sql = previous_sql.strip().rstrip(";")
+    text = follow_up.lower()
+    filter_match = _FILTER_RE.search(text)
+    if filter_match:
+        column, operator, value = filter_match.groups()
+        condition = f"{_column(column)} {operator} {value}"
+        tail = _TAIL_RE.search(sql)
+        head, tail = (sql[:tail.start()], sql[tail.start():]) if tail else (sql, "")
+        keyword = "AND" if _WHERE_RE.search(head) else "WHERE"
+        sql = f"{head} {keyword} {condition}{tail}"
+    order_match = _ORDER_RE.search(text)
+    if order_match:
+        column, direction = order_match.groups()
+        sql = re.split(r"\s+ORDER BY\b", sql, flags=re.IGNORECASE)[0]
+        sql += f" ORDER BY {_column(column)}{' ASC' if direction and direction.startswith('asc') else ' DESC'}"
+    limit_match = _LIMIT_RE.search(text)
+    if limit_match:
+        sql = re.split(r"\s+LIMIT\b", sql, flags=re.IGNORECASE)[0] + f" LIMIT {limit_match.group(1)}"
+    return sql + ";"
+
+
+class FakeModel:
+    """Keyword-rule model with a fixed per-call latency"""
+
+    def __init__(self, latency=0.0, rules=RULES, chunk_chars=8, commentary=""):
+        self.latency = latency
+        self.rules = rules
+        self.chunk_chars = chunk_chars
+        self.commentary = commentary
+        self.calls = 0
+
+    def answer(self, question):
+        question = question.lower()
+        for keywords, sql in self.rules:
+            if all(keyword in question for keyword in keywords):
+                return sql
+        return DEFAULT_SQL
+
+    def respond(self, prompt, question):
+        previous = _PREVIOUS_SQL_RE.search(prompt)
+        return refine(previous.group(1), question) if previous else self.answer(question)
+
+    def generate(self, prompt):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if "\nQuestions:\n" in prompt:
+            # Packed prompt from nl2sql.get_genai_batch_response: "<n>: <question>" per line
+            numbered = prompt.rsplit("\nQuestions:\n", 1)[1].strip().splitlines()
+            answers = []
+            for line in numbered:
+                number, _, question = line.partition(":")
+                answers.append(f"{number.strip()}: {self.respond(prompt, question)}")
+            return "\n".join(answers)
+        return self.respond(prompt, question_from_prompt(prompt))
+
+    def stream(self, prompt):
+        """Yield the answer in small chunks, spreading ``latency`` evenly over them"""
+        text = self.respond(prompt, question_from_prompt(prompt))
+        if self.commentary:
+            text = f"```sql\n{text}\n```\n{self.commentary}"
+        self.calls += 1
+        chunks = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)]
+        for chunk in chunks:
+            if self.latency:
+                time.sleep(self.latency / len(chunks))
+            yield chunk
+
+
+def make_server(host="127.0.0.1", port=8765, latency=0.0, rpm=None, commentary="", fail_first=0):
+    """HTTP server for a FakeModel (``server.model``), not yet serving
+
+    Answers 429 above ``rpm`` requests/minute and to the first ``fail_first``
+    requests. ``server.requests`` counts every request, rejected ones included.
+    """
+    model = FakeModel(latency, commentary=commentary)
+    recent = deque()
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            with lock:
+                server.requests += 1
+                limited = server.requests <= fail_first
+                if rpm and not limited:
+                    now = time.monotonic()
+                    while recent and now - recent[0] > 60:
+                        recent.popleft()
+                    limited = len(recent) >= rpm
+                    if not limited:
+                        recent.append(now)
+            if limited:
+                self.send_response(429)
+                self.end_headers()
+                return
+            if payload.get("stream"):
+                # One JSON object per line, flushed as produced; the client may hang up early
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                try:
+                    for chunk in model.stream(payload.get("prompt", "")):
+                        self.wfile.write(json.dumps({"text": chunk}).encode("utf-8") + b"\n")
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                return
+            body = json.dumps({"text": model.generate(payload.get("prompt", ""))}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.model = model
+    server.requests = 0
+    return server
+
+
+def serve(host="127.0.0.1", port=8765, latency=0.0, rpm=None, commentary=""):
+    """Run the fake model as an HTTP server (blocks); returns 429 above ``rpm`` requests/minute"""
+    server = make_server(host, port, latency, rpm, commentary)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a deterministic fake NL2SQL model over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per generation")
+    parser.add_argument("--rpm", type=int, default=None, help="answer 429 above this many requests/minute")
+    parser.add_argument("--commentary", default="", help="text streamed after the fenced SQL")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.latency, args.rpm, args.commentary)
@@ -0,0 +1,343 @@
+"""Template fast path: answer common question shapes without the LLM.
+
+A small intent/slot matcher runs before generation. It recognizes
+
+* counts            "How many students are there?"
+* numeric filters   "Show students with GPA greater than 3.5" (or "GPA > 3.5")
+* value lookups     "Show all students in Data Science department"
+                    (values come from dictionaries of the name/code columns,
+                    joined through a direct foreign key when needed)
+* plain listings    "List all courses"
+
+and fills the matching SQL template. A question is only answered here when
+every content word in it is explained by the template (table nouns, column
+nouns, comparators, numbers, known values); anything else goes to Gemini.
+Several values of one column are only accepted joined by "or" (``IN``):
+"in Data Science and Web Development" has no single-row reading, so it goes
+to Gemini too, as does an "or" between different columns.
+Literals are validated (numbers) or escaped (strings) before they are
+placed in the SQL text, since the rest of the pipeline passes SQL around
+as text.
+"""
+import os
+import re
+import threading
+from collections import namedtuple
+
+from approximate import is_sample_table
+from db_engine import get_engine
+from nl_cache import STOPWORDS
+from prompt_builder import key_columns, stem
+from schema_catalog import get_catalog
+from telemetry import span
+
+MIN_CONFIDENCE = float(os.getenv("NL2SQL_FAST_PATH_MIN_CONFIDENCE", "1.0"))
+MAX_DICTIONARY_VALUES = 100_000  # per column; larger columns are not used for lookups
+MAX_VALUE_WORDS = 6
+
+NUMERIC_TYPES = ("INT", "REAL", "FLOA", "DOUB", "DEC", "NUM")
+COUNT_PHRASES = (("how", "many"), ("number", "of"), ("count", "of"), ("count",), ("total", "number", "of"))
+COMPARATORS = (
+    (("greater", "than", "or", "equal", "to"), ">="),
+    (("less", "than", "or", "equal", "to"), "<="),
+    (("at", "least"), ">="),
+    (("no", "less", "than"), ">="),
+    (("at", "most"), "<="),
+    (("no", "more", "than"), "<="),
+    (("greater", "than"), ">"),
+    (("more", "than"), ">"),
+    (("higher", "than"), ">"),
+    (("above",), ">"),
+    (("over",), ">"),
+    (("exceeding",), ">"),
+    (("less", "than"), "<"),
+    (("lower", "than"), "<"),
+    (("fewer", "than"), "<"),
+    (("below",), "<"),
+    (("under",), "<"),
+    (("equal", "to"), "="),
+    (("equals",), "="),
+    (("exactly",), "="),
+    ((">=",), ">="),
+    (("<=",), "<="),
+    (("!=",), "!="),
+    (("<>",), "!="),
+    ((">",), ">"),
+    (("<",), "<"),
+    (("=",), "="),
+)
+CONJUNCTIONS = ("and", "or", "nor")
+# Words a template absorbs without changing its meaning
+FILLER = {
+    "with", "whose", "having", "have", "has", "where", "in", "of", "is", "are", "detail", "details",
+    "record", "records", "info", "information", "every", "each", "their", "its", "at", "a", "an",
+    "value", "than", "total", "number", "many", "how", "count",
+}
+
+FastPathMatch = namedtuple("FastPathMatch", ["sql", "intent", "confidence", "slots"])
+
+# Comparison symbols and a minus sign are tokens of their own; a "-" that starts a number is its sign
+_TOKEN_RE = re.compile(r"[<>!]=|<>|[<>=]|(?<![a-z0-9.])-\d+(?:\.\d+)?|[a-z0-9]+(?:\.[0-9]+)?|-")
+_NUMBER_RE = re.compile(r"^-?\d+(?:\.\d+)?$")
+_IDENTIFIER_RE = re.compile(r"^[A-Za-z_]\w*$")
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _ident(name):
+    return name if _IDENTIFIER_RE.match(name) else '"' + name.replace('"', '""') + '"'
+
+
+def _string_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _is_numeric(declared_type):
+    declared_type = (declared_type or "").upper()
+    return any(marker in declared_type for marker in NUMERIC_TYPES)
+
+
+def _is_dictionary_column(name, declared_type):
+    upper = name.upper()
+    return (upper == "NAME" or upper.endswith("_NAME") or upper.endswith("_CODE")) and not _is_numeric(declared_type)
+
+
+class FastPathMatcher:
+    """Intent/slot matcher for one database, with value dictionaries rebuilt when the data changes"""
+
+    def __init__(self, db_path, min_confidence=MIN_CONFIDENCE):
+        self.db_path = str(db_path)
+        self.min_confidence = min_confidence
+        self.stats = {'hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+        self._version = None
+        self._values = {}  # "data science" -> [(table, column, stored value)]
+        self._value_words = 1
+
+    def _refresh(self, table_structure):
+        version = get_catalog(self.db_path).version
+        if version == self._version:
+            return
+        engine = get_engine(self.db_path)
+        values = {}
+        longest = 1
+        for table, info in table_structure.items():
+            if table.startswith("sqlite_") or is_sample_table(table):
+                continue
+            for col in info['columns']:
+                if not _is_dictionary_column(col[1], col[2]):
+                    continue
+                rows = engine.execute(
+                    f"SELECT DISTINCT {_ident(col[1])} FROM {_ident(table)} "
+                    f"WHERE {_ident(col[1])} IS NOT NULL LIMIT {MAX_DICTIONARY_VALUES + 1};"
+                )
+                if len(rows) > MAX_DICTIONARY_VALUES:
+                    continue
+                for (value,) in rows:
+                    words = tokenize(str(value))
+                    if not words or len(words) > MAX_VALUE_WORDS or all(w in STOPWORDS for w in words):
+                        continue
+                    values.setdefault(" ".join(words), []).append((table, col[1], value))
+                    longest = max(longest, len(words))
+        self._values, self._value_words, self._version = values, longest, version
+
+    def match(self, question, table_structure, relationships):
+        """FastPathMatch for a high-confidence question, else None"""
+        with span("fast_path") as attributes:
+            with self._lock:
+                self._refresh(table_structure)
+                result = self._match(tokenize(question), table_structure, relationships)
+                hit = result is not None and result.confidence >= self.min_confidence
+                self.stats['hits' if hit else 'misses'] += 1
+            attributes['outcome'] = 'hit' if hit else 'miss'
+            if result is not None:
+                attributes.update(intent=result.intent, confidence=round(result.confidence, 3))
+            return result if hit else None
+
+    def hit_rate(self):
+        total = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / total if total else 0.0
+
+    def _match(self, words, table_structure, relationships):
+        if not words:
+            return None
+        tables = {name: info for name, info in table_structure.items()
+                  if not name.startswith("sqlite_") and not is_sample_table(name)}
+        noun_tables = {stem(name.replace("_", " ").split()[-1]): name for name in tables}
+        used = [False] * len(words)
+
+        # Known values first, longest phrase wins ("data science" before "data")
+        lookups = []
+        i = 0
+        while i < len(words):
+            for size in range(min(self._value_words, len(words) - i), 0, -1):
+                candidates = self._values.get(" ".join(words[i:i + size]))
+                if candidates:
+                    lookups.append(candidates)
+                    used[i:i + size] = [True] * size
+                    i += size
+                    break
+            else:
+                i += 1
+
+        nouns = set()
+        for i, word in enumerate(words):
+            if not used[i] and stem(word) in noun_tables:
+                nouns.add(noun_tables[stem(word)])
+                used[i] = True
+
+        count = False
+        for i in range(len(words)):
+            for phrase in COUNT_PHRASES:
+                if tuple(words[i:i + len(phrase)]) == phrase and not any(used[i:i + len(phrase)]):
+                    count = True
+                    used[i:i + len(phrase)] = [True] * len(phrase)
+                    break
+
+        value_tables = {table for candidates in lookups for table, _, _ in candidates}
+        targets = nouns - value_tables if len(nouns - value_tables) else nouns
+        if len(targets) != 1:
+            if nouns or len(value_tables) != 1:
+                return None
+            targets = value_tables  # "show Krish Naik" -> the table holding that name
+        target = next(iter(targets))
+
+        filters = self._numeric_filters(words, used, tables[target])
+        if filters is None:
+            return None
+        # A comparison symbol or minus sign outside a "<column> <comparator> <number>" phrase has no template
+        if any(not used[i] and not word[0].isalnum() for i, word in enumerate(words)):
+            return None
+        joins, conditions = self._lookups(target, lookups, relationships)
+        if joins is None:
+            return None
+        # "and"/"or" are stopwords, so they would otherwise be dropped and every condition ANDed
+        conjunctions = {word for i, word in enumerate(words) if not used[i] and word in CONJUNCTIONS}
+        groups = {}
+        for table, column, value in conditions:
+            groups.setdefault((table, column), []).append(value)
+        several = any(len(values) > 1 for values in groups.values())
+        # Several values of one column need "or" (and no "and"); an "or" anywhere else has no template
+        if "nor" in conjunctions or ("or" in conjunctions) != several or (several and "and" in conjunctions):
+            return None
+
+        content = [i for i, word in enumerate(words) if word not in STOPWORDS and word not in FILLER]
+        explained = [i for i in content if used[i]]
+        confidence = len(explained) / len(content) if content else 0.0
+
+        intent = "count" if count else "filter" if filters else "lookup" if conditions else "list"
+        sql = self._render(target, tables, joins, groups, filters, count)
+        slots = {'table': target, 'filters': filters,
+                 'values': [(table, column, value) for table, column, value in conditions]}
+        return FastPathMatch(sql, intent, confidence, slots)
+
+    def _numeric_filters(self, words, used, info):
+        """[(column, op, number)] for "<column> <comparator> <number>" phrases; None if one is unresolved"""
+        numeric = {}
+        for col in info['columns']:
+            if _is_numeric(col[2]) and col[1] not in key_columns(info):
+                parts = [stem(part) for part in col[1].lower().split("_")]
+                numeric.setdefault(" ".join(parts), col[1])
+                numeric.setdefault(parts[0], col[1])
+        filters = []
+        for i, word in enumerate(words):
+            if used[i] or not _NUMBER_RE.match(word):
+                continue
+            # Walk back from the number: comparator, optional filler, then the column noun
+            op, start = "=", i
+            for phrase, symbol in COMPARATORS:
+                if tuple(words[i - len(phrase):i]) == phrase and i - len(phrase) >= 0:
+                    op, start = symbol, i - len(phrase)
+                    break
+            j = start - 1
+            while j >= 0 and words[j] in ("of", "is", "a", "an", "that", "than"):
+                j -= 1
+            column = None
+            for size in (2, 1):
+                if j - size + 1 >= 0:
+                    key = " ".join(stem(w) for w in words[j - size + 1:j + 1])
+                    if key in numeric:
+                        column, j = numeric[key], j - size + 1
+                        break
+            if column is None:
+                return None
+            used[j:i + 1] = [True] * (i + 1 - j)
+            filters.append((column, op, word))
+        return filters
+
+    def _lookups(self, target, lookups, relationships):
+        """(join edges, equality conditions) for the matched values, or (None, None) if a value is unreachable"""
+        joins, conditions = [], []
+        for candidates in lookups:
+            own = [c for c in candidates if c[0] == target]
+            if own:
+                conditions.append(own[0])
+                continue
+            # A value in another table is usable through a direct foreign key from the target
+            reachable = [(c, rel) for c in candidates for rel in relationships
+                         if rel['from_table'] == target and rel['to_table'] == c[0]]
+            if len({c[0] for c, _ in reachable}) != 1:
+                return None, None
+            candidate, rel = reachable[0]
+            if rel not in joins:
+                joins.append(rel)
+            conditions.append(candidate)
+        return joins, conditions
+
+    @staticmethod
+    def _render(target, tables, joins, groups, filters, count):
+        aliases = {}
+        if joins:
+            for table in [target] + [rel['to_table'] for rel in joins]:
+                alias = table[0].lower()
+                while alias in aliases.values():
+                    alias += table[len(alias) % len(table)].lower()
+                aliases[table] = alias
+
+        def ref(table, column):
+            return f"{aliases[table]}.{_ident(column)}" if aliases else _ident(column)
+
+        if count:
+            select = "COUNT(*)"
+        elif filters:
+            names = [col[1] for col in tables[target]['columns']
+                     if col[1].upper() == "NAME" or col[1].upper().endswith("_NAME")]
+            shown = names[:1] + [column for column, _, _ in filters if column not in names[:1]]
+            select = ", ".join(ref(target, column) for column in shown) if names else (
+                f"{aliases[target]}.*" if aliases else "*")
+        else:
+            select = f"{aliases[target]}.*" if aliases else "*"
+
+        sql = f"SELECT {select} FROM {_ident(target)}" + (f" {aliases[target]}" if aliases else "")
+        for rel in joins:
+            other = rel['to_table']
+            sql += (f" JOIN {_ident(other)} {aliases[other]} ON {ref(target, rel['from_column'])} = "
+                    f"{ref(other, rel['to_column'])}")
+        predicates = [f"{ref(table, column)} = {_string_literal(values[0])}" if len(values) == 1 else
+                      f"{ref(table, column)} IN ({', '.join(_string_literal(value) for value in values)})"
+                      for (table, column), values in groups.items()]
+        predicates += [f"{ref(target, column)} {op} {number}" for column, op, number in filters]
+        if predicates:
+            sql += " WHERE " + " AND ".join(predicates)
+        return sql + ";"
+
+
+_matchers = {}
+_matchers_lock = threading.Lock()
+
+
+def get_matcher(db_path="student.db"):
+    """Process-wide matcher for ``db_path`` (module state survives Streamlit reruns)"""
+    with _matchers_lock:
+        matcher = _matchers.get(str(db_path))
+        if matcher is None:
+            matcher = _matchers[str(db_path)] = FastPathMatcher(db_path)
+        return matcher
+
+
+def match_question(question, db_path="student.db"):
+    """Template SQL for a high-confidence question, or None to fall back to the LLM"""
+    catalog = get_catalog(db_path)
+    return get_matcher(db_path).match(question, catalog.table_structure(), catalog.relationships())
@@ -0,0 +1,362 @@
+"""Dynamic few-shot examples retrieved from verified (question, SQL) pairs.
+
+Every generated query that executes without error is added to a small
+SQLite store next to the app. Each question is embedded locally with
+feature hashing (stemmed words, word bigrams and character trigrams,
+numbers folded into one token) into a fixed-size unit vector, so no
+model download or API call is needed. The nearest stored questions,
+plus the built-in examples from prompt_builder, become the examples in
+the prompt.
+
+Nothing is read at import; the app preloads the index on a background
+thread, and other callers load it on the first lookup. Vectors are kept
+in a FAISS HNSW index when faiss is installed and in a numpy matrix
+otherwise (exact search over only the dimensions a question touches, a
+few milliseconds at 50k examples). Rows added by other processes are
+picked up incrementally on the next lookup.
+
+Examples are keyed on the database's schema fingerprint (as in nl_cache),
+so SQL verified against an older schema is never offered. The store keeps
+at most NL2SQL_FEW_SHOT_MAX_EXAMPLES rows and evicts the least recently
+retrieved ones. Evictions, a schema change, or too many replaced
+questions left behind in the index make every process rebuild its index
+from the live rows.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from prompt_builder import FEW_SHOT_EXAMPLES, stem
+from nl_cache import QUESTION_KEY_VERSION, STOPWORDS, fingerprint, normalize_question
+from schema_catalog import get_catalog
+from telemetry import span
+
+DEFAULT_STORE_PATH = Path(__file__).parent / "few_shot.db"
+EMBEDDING_DIM = 512
+TOP_K = int(os.getenv("NL2SQL_FEW_SHOT_K", "3"))
+MIN_SIMILARITY = float(os.getenv("NL2SQL_FEW_SHOT_MIN_SIMILARITY", "0.25"))
+MAX_EXAMPLES = int(os.getenv("NL2SQL_FEW_SHOT_MAX_EXAMPLES", "50000"))
+EVICT_TO = 0.9  # evict down to this share of the cap, so evictions (and index rebuilds) come in batches
+MAX_STALE_POSITIONS = 32  # replaced questions left in the index before it is rebuilt
+
+# Feature weights: whole words dominate, bigrams keep word order, trigrams catch typos and inflections
+WORD_WEIGHT = 1.0
+BIGRAM_WEIGHT = 0.7
+TRIGRAM_WEIGHT = 0.25
+
+_NUMBER_RE = re.compile(r"^\d+(?:\.\d+)?$")
+
+
+def _features(question):
+    words = []
+    for word in normalize_question(question).split():
+        if word in STOPWORDS:
+            continue
+        words.append("<num>" if _NUMBER_RE.match(word) else stem(word))
+    features = [(f"w:{word}", WORD_WEIGHT) for word in words]
+    features += [(f"b:{a} {b}", BIGRAM_WEIGHT) for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"#{word}#"
+        features += [(f"t:{padded[i:i + 3]}", TRIGRAM_WEIGHT) for i in range(len(padded) - 2)]
+    return features
+
+
+def embed(question, dim=EMBEDDING_DIM):
+    """Unit-length float32 vector for a question (signed feature hashing)"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, weight in _features(question):
+        h = zlib.crc32(feature.encode("utf-8"))  # stable across processes, unlike hash()
+        vector[h % dim] += weight if h & 0x80000000 else -weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class _VectorIndex:
+    """Inner-product index over unit vectors: FAISS HNSW if available, else exact numpy search"""
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.size = 0
+        try:
+            import faiss
+
+            self._faiss = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+            self._faiss.hnsw.efSearch = 64
+        except ImportError:
+            self._faiss = None
+            # One row per dimension: a hashed question touches only a few dozen dimensions, and
+            # scoring reads just those rows instead of the whole matrix
+            self._by_dim = np.zeros((dim, 0), dtype=np.float32)
+
+    def add(self, vectors):
+        if not len(vectors):
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self._faiss is not None:
+            self._faiss.add(vectors)
+        else:
+            capacity = self._by_dim.shape[1]
+            if self.size + len(vectors) > capacity:
+                # Grow geometrically so incremental adds stay amortized O(1)
+                grown = np.zeros((self.dim, max(2 * capacity, self.size + len(vectors), 64)), dtype=np.float32)
+                grown[:, :self.size] = self._by_dim[:, :self.size]
+                self._by_dim = grown
+            self._by_dim[:, self.size:self.size + len(vectors)] = vectors.T
+        self.size += len(vectors)
+
+    def search(self, vector, k):
+        """[(position, similarity)] of the k nearest vectors, best first"""
+        k = min(k, self.size)
+        if k <= 0:
+            return []
+        if self._faiss is not None:
+            scores, positions = self._faiss.search(vector.reshape(1, -1), k)
+            return [(int(p), float(s)) for p, s in zip(positions[0], scores[0]) if p >= 0]
+        dims = np.flatnonzero(vector)
+        scores = vector[dims] @ self._by_dim[dims, :self.size]
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(p), float(scores[p])) for p in top]
+
+
+class ExampleStore:
+    """Persistent, incrementally updated nearest-neighbour store of verified examples for one database"""
+
+    def __init__(self, db_path="student.db", path=DEFAULT_STORE_PATH, seeds=FEW_SHOT_EXAMPLES,
+                 max_entries=MAX_EXAMPLES):
+        self.db_path = str(Path(db_path).resolve())
+        self.path = str(path)
+        self.seeds = list(seeds)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = None
+        self._index = None
+        self._loaded_for = None  # (schema fingerprint, eviction count) the index was built for
+        self._keys = []  # index position -> question key
+        self._positions = {}  # question key -> its current index position
+        self._latest = {}  # question key -> newest (question, sql)
+        self._stale = 0  # positions of replaced questions still in the index
+        self._last_id = 0
+        self._schema = None
+        self._schema_version = None
+        self._preloading = False
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self._conn.execute("PRAGMA journal_mode=WAL;")
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(examples);")}
+            if columns and "schema_fp" not in columns:
+                # Rows from before examples were keyed on the schema can't say which schema they ran on
+                self._conn.execute("DROP TABLE examples;")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS examples (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    db_path TEXT NOT NULL,
+                    schema_fp TEXT NOT NULL,
+                    question_key TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    sql TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    added_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL,
+                    UNIQUE (db_path, schema_fp, question_key)
+                );
+            """)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS store_state (name TEXT PRIMARY KEY, value INTEGER NOT NULL);")
+            if self._conn.execute("PRAGMA user_version;").fetchone()[0] < QUESTION_KEY_VERSION:
+                self._rekey()
+            self._conn.commit()
+        return self._conn
+
+    def _rekey(self):
+        """Re-key (and re-embed) rows whose question_key came from an older normalize_question
+
+        Older keys dropped comparison symbols, so "GPA < 3" replaced the example for "GPA > 3".
+        """
+        changed = []
+        for row_id, question, old_key in self._conn.execute("SELECT id, question, question_key FROM examples;"):
+            key = normalize_question(question)
+            if key != old_key:
+                changed.append((key, embed(question).tobytes(), row_id))
+        self._conn.executemany("UPDATE OR REPLACE examples SET question_key = ?, vector = ? WHERE id = ?;", changed)
+        self._conn.execute(f"PRAGMA user_version = {QUESTION_KEY_VERSION};")
+
+    def _schema_fingerprint(self):
+        """nl_cache.fingerprint of the database's schema, recomputed only when the catalog changes"""
+        catalog = get_catalog(self.db_path)
+        version = catalog.refresh()
+        if version != self._schema_version:
+            self._schema = fingerprint("", catalog.table_structure())
+            self._schema_version = version
+        return self._schema
+
+    def _evictions(self):
+        row = self._connection().execute("SELECT value FROM store_state WHERE name = 'evictions';").fetchone()
+        return row[0] if row else 0
+
+    def _reset(self, loaded_for):
+        self._index = _VectorIndex(EMBEDDING_DIM)
+        self._loaded_for = loaded_for
+        self._keys, self._positions, self._latest = [], {}, {}
+        self._stale = 0
+        self._last_id = 0
+        self._index.add(np.stack([embed(q) for q, _ in self.seeds]) if self.seeds else [])
+        for question, sql in self.seeds:
+            self._remember(question, sql)
+
+    def _load(self):
+        """Build the index on first use, then append rows written since the last call (by any process)"""
+        loaded_for = (self._schema_fingerprint(), self._evictions())
+        if self._index is None or loaded_for != self._loaded_for:
+            self._reset(loaded_for)
+        self._append_new_rows()
+        if self._stale > MAX_STALE_POSITIONS:
+            self._reset(loaded_for)
+            self._append_new_rows()
+
+    def _append_new_rows(self):
+        # A rowid range scan, so polling for new rows costs microseconds however large the store is
+        rows = self._connection().execute(
+            "SELECT id, db_path, schema_fp, question, sql, vector FROM examples WHERE id > ? ORDER BY id;",
+            (self._last_id,),
+        ).fetchall()
+        if not rows:
+            return
+        self._last_id = rows[-1][0]
+        vectors = []
+        for _, db_path, schema, question, sql, blob in rows:
+            if db_path != self.db_path or schema != self._loaded_for[0]:
+                continue
+            vector = np.frombuffer(blob, dtype=np.float32)
+            vectors.append(vector if len(vector) == EMBEDDING_DIM else embed(question))
+            self._remember(question, sql)
+        if vectors:
+            self._index.add(np.stack(vectors))
+
+    def _remember(self, question, sql):
+        key = normalize_question(question)
+        if key in self._positions:
+            self._stale += 1
+        self._positions[key] = len(self._keys)
+        self._keys.append(key)
+        self._latest[key] = (question, sql)
+
+    def add(self, question, sql):
+        """Record a verified pair; a rephrased SQL for a known question replaces the old one
+
+        Past ``max_entries`` rows, the least recently retrieved ones are evicted.
+        """
+        key = normalize_question(question)
+        if not key:
+            return
+        vector = embed(question)
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._connection()
+                # REPLACE gives the row a new id, so every process reloads it with the new SQL
+                conn.execute(
+                    "INSERT OR REPLACE INTO examples "
+                    "(db_path, schema_fp, question_key, question, sql, vector, added_at, last_used_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?);",
+                    (self.db_path, self._schema_fingerprint(), key, question, sql, vector.tobytes(), now, now),
+                )
+                count = conn.execute("SELECT COUNT(*) FROM examples;").fetchone()[0]
+                if count > self.max_entries:
+                    conn.execute(
+                        "DELETE FROM examples WHERE id IN ("
+                        "SELECT id FROM examples ORDER BY last_used_at, id LIMIT ?);",
+                        (count - int(self.max_entries * EVICT_TO),),
+                    )
+                    # Deleted rows can't be taken out of an index incrementally: tell every process to rebuild
+                    conn.execute(
+                        "INSERT INTO store_state (name, value) VALUES ('evictions', 1) "
+                        "ON CONFLICT (name) DO UPDATE SET value = value + 1;")
+                conn.commit()
+            except sqlite3.Error:
+                # The store only improves prompts; failing to write it must not fail the request
+                pass
+
+    def search(self, question, k=TOP_K, min_similarity=MIN_SIMILARITY):
+        """Up to k (question, sql) examples nearest to ``question``, best first"""
+        with span("few_shot") as attributes:
+            with self._lock:
+                try:
+                    self._load()
+                except sqlite3.Error:
+                    if self._index is None:
+                        return self.seeds[:k]
+                # Replaced questions leave their older positions behind until the next rebuild
+                hits = self._index.search(embed(question), k + self._stale)
+                examples, keys = [], []
+                for position, similarity in hits:
+                    key = self._keys[position]
+                    if self._positions[key] != position:
+                        continue
+                    # The best match is kept even when weak, so the prompt still shows the answer format
+                    if similarity >= min_similarity or not examples:
+                        examples.append(self._latest[key])
+                        keys.append(key)
+                    if len(examples) == k:
+                        break
+                self._touch(keys)
+            attributes.update(examples=len(examples), indexed=self._index.size)
+            return examples
+
+    def _touch(self, keys):
+        """Mark retrieved examples as recently used, for eviction"""
+        if not keys or self._loaded_for is None:
+            return
+        try:
+            conn = self._connection()
+            conn.executemany(
+                "UPDATE examples SET last_used_at = ? WHERE db_path = ? AND schema_fp = ? AND question_key = ?;",
+                [(time.time(), self.db_path, self._loaded_for[0], key) for key in keys],
+            )
+            conn.commit()
+        except sqlite3.Error:
+            pass
+
+    def preload(self):
+        """Load the index on a daemon thread so the first question does not wait for it; idempotent"""
+        with self._lock:
+            if self._index is not None or self._preloading:
+                return
+            self._preloading = True
+
+        def load():
+            with self._lock:
+                try:
+                    self._load()
+                except sqlite3.Error:
+                    pass
+
+        threading.Thread(target=load, name="few-shot-preload", daemon=True).start()
+
+    def size(self):
+        with self._lock:
+            return self._connection().execute(
+                "SELECT COUNT(*) FROM examples WHERE db_path = ?;", (self.db_path,)
+            ).fetchone()[0]
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_example_store(db_path="student.db"):
+    """Process-wide example store for ``db_path`` (module state survives Streamlit reruns)"""
+    with _stores_lock:
+        key = str(Path(db_path).resolve())
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = ExampleStore(db_path, path=DEFAULT_STORE_PATH)
+        return store
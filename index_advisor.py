@@ -0,0 +1,213 @@
+"""Index advisor driven by the logged generated-query workload.
+
+    python index_advisor.py --db student.db            # report only
+    python index_advisor.py --db student.db --apply    # create indexes, then ANALYZE
+
+Predicate and join columns are collected from every successful query shape
+in the workload log, each weighted by how often it was asked (result-cache
+hits included: a cached answer is recomputed after every data change).
+Each unindexed column becomes a candidate single-column index. Its benefit
+is estimated by re-planning the workload with ``EXPLAIN QUERY PLAN``
+against an in-memory copy of the schema (with the real row counts loaded
+as statistics), with and without the index, and the best candidates are
+picked one round at a time.
+"""
+import argparse
+import re
+import sqlite3
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from query_log import get_query_log
+from schema_catalog import get_catalog
+from sql_guard import scan_rows, table_aliases
+
+_REF = r'(?:([A-Za-z_]\w*|"[^"]+")\s*\.\s*)?([A-Za-z_]\w*|"[^"]+")'
+_OPERATOR = r"(?:=|==|<>|!=|<=|>=|<|>|\bIN\b|\bLIKE\b|\bGLOB\b|\bBETWEEN\b|\bIS\b)"
+_PREDICATE_RE = re.compile(_REF + r"\s*" + _OPERATOR, re.IGNORECASE)
+_JOIN_RHS_RE = re.compile(r"=\s*" + _REF, re.IGNORECASE)
+
+
+def _unquote(name):
+    return name.strip('"') if name else name
+
+
+def predicate_columns(sql, table_structure):
+    """{(table, column)} used in comparisons and join conditions of ``sql``"""
+    aliases = table_aliases(sql, table_structure)
+    tables_in_query = set(aliases.values())
+    columns_by_table = {
+        table: {col[1].upper(): col[1] for col in table_structure[table]['columns']}
+        for table in tables_in_query
+    }
+    found = set()
+    refs = [m.groups() for m in _PREDICATE_RE.finditer(sql)] + [m.groups() for m in _JOIN_RHS_RE.finditer(sql)]
+    for qualifier, column in refs:
+        qualifier, column = _unquote(qualifier), _unquote(column).upper()
+        if qualifier:
+            candidates = [aliases.get(qualifier.upper())]
+        else:
+            candidates = [table for table in tables_in_query if column in columns_by_table[table]]
+        for table in candidates:
+            if table and column in columns_by_table[table]:
+                found.add((table, columns_by_table[table][column]))
+    return found
+
+
+def clone_schema(db_path, table_structure):
+    """In-memory database with the same tables and indexes, and row-count statistics"""
+    source = sqlite3.connect(f"file:{Path(db_path).resolve().as_posix()}?mode=ro", uri=True)
+    try:
+        ddl = source.execute(
+            "SELECT sql FROM sqlite_master WHERE type IN ('table', 'index') "
+            "AND sql IS NOT NULL AND name NOT LIKE 'sqlite_%' ORDER BY type = 'index';"
+        ).fetchall()
+        has_stats = source.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1';"
+        ).fetchone()
+        stats = source.execute("SELECT tbl, idx, stat FROM sqlite_stat1;").fetchall() if has_stats else []
+    finally:
+        source.close()
+
+    clone = sqlite3.connect(":memory:")
+    for (statement,) in ddl:
+        clone.execute(statement)
+    clone.execute("ANALYZE;")
+    covered = {tbl for tbl, _, _ in stats}
+    stats += [(table, None, str(max(info['row_count'], 1)))
+              for table, info in table_structure.items()
+              if table not in covered and not table.startswith("sqlite_")]
+    clone.executemany("INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES (?, ?, ?);", stats)
+    clone.commit()
+    clone.execute("ANALYZE sqlite_schema;")  # reload the statistics into the planner
+    return clone
+
+
+def indexed_columns(conn):
+    """{(table, leading column)} already covered by an index or the rowid"""
+    covered = set()
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%';")]
+    for table in tables:
+        for col in conn.execute(f'PRAGMA table_info("{table}");'):
+            if col[5] == 1 and col[2].upper() == "INTEGER":
+                covered.add((table, col[1]))
+        for index in conn.execute(f'PRAGMA index_list("{table}");'):
+            first = conn.execute(f'PRAGMA index_info("{index[1]}");').fetchone()
+            if first:
+                covered.add((table, first[2]))
+    return covered
+
+
+def plan_cost(conn, sql, table_structure):
+    """Rows visited by full scans, multiplying nested scans (the guard's cost model)"""
+    try:
+        plan = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+    except sqlite3.Error:
+        return 0
+    loops = defaultdict(lambda: 1)
+    for parent, rows in scan_rows(plan, sql, table_structure):
+        loops[parent] *= max(rows, 1)
+    return sum(loops.values()) if loops else 0
+
+
+def index_name(table, column):
+    return f"idx_{table}_{column}".lower()
+
+
+def _run_ddl(conn, statement):
+    conn.execute(statement)
+    # DROP INDEX leaves the table's cached statistics stale; reload them for every plan
+    conn.execute("ANALYZE sqlite_schema;")
+
+
+def advise(db_path="student.db", since=0, max_indexes=10):
+    """Proposed indexes in selection order: [{table, column, statement, uses, queries, rows_saved}]
+
+    Selection is greedy: each round keeps the candidate that saves the most
+    scanned rows in the clone, so later proposals are costed on top of the
+    earlier ones and indexes that only help together are not double counted.
+    """
+    table_structure = get_catalog(db_path).table_structure()
+    workload = get_query_log().workload(db_path, since)
+    clone = clone_schema(db_path, table_structure)
+    try:
+        covered = indexed_columns(clone)
+        uses = Counter()
+        queries = defaultdict(list)
+        for entry in workload:
+            for key in predicate_columns(entry['sql'], table_structure) - covered:
+                uses[key] += entry['count']
+                queries[key].append(entry)
+
+        # Per-execution rows scanned, weighted by how often each shape ran
+        def workload_cost(entries):
+            return sum(plan_cost(clone, e['sql'], table_structure) * e['count'] for e in entries)
+
+        proposals = []
+        remaining = sorted(uses)
+        while remaining and len(proposals) < max_indexes:
+            best = None
+            for table, column in remaining:
+                entries = queries[(table, column)]
+                before = workload_cost(entries)
+                name = index_name(table, column)
+                _run_ddl(clone, f'CREATE INDEX "{name}" ON "{table}" ("{column}");')
+                try:
+                    saved = before - workload_cost(entries)
+                finally:
+                    _run_ddl(clone, f'DROP INDEX "{name}";')
+                if saved > 0 and (best is None or saved > best[0]):
+                    best = (saved, table, column)
+            if best is None:
+                break
+            saved, table, column = best
+            name = index_name(table, column)
+            _run_ddl(clone, f'CREATE INDEX "{name}" ON "{table}" ("{column}");')
+            remaining.remove((table, column))
+            proposals.append({
+                'table': table,
+                'column': column,
+                'statement': f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ("{column}");',
+                'uses': uses[(table, column)],
+                'queries': len(queries[(table, column)]),
+                'rows_saved': saved
+            })
+        return proposals
+    finally:
+        clone.close()
+
+
+def apply_indexes(db_path, statements):
+    """Create the given indexes on the real database and refresh planner statistics"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        for statement in statements:
+            conn.execute(statement)
+        conn.execute("ANALYZE;")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Suggest indexes for the logged generated-query workload")
+    parser.add_argument("--db", default="student.db")
+    parser.add_argument("--top", type=int, default=10, help="number of proposals to show/apply")
+    parser.add_argument("--apply", action="store_true", help="create the proposed indexes and run ANALYZE")
+    args = parser.parse_args(argv)
+
+    proposals = advise(args.db, max_indexes=args.top)
+    if not proposals:
+        print("No index proposals: the logged workload is already covered (or the log is empty).")
+        return
+    for p in proposals:
+        print(f"{p['statement']}  -- {p['uses']} uses in {p['queries']} query shapes, "
+              f"~{p['rows_saved']:,} scanned rows saved")
+    if args.apply:
+        apply_indexes(args.db, [p['statement'] for p in proposals])
+        print(f"Created {len(proposals)} indexes and ran ANALYZE on {args.db}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""Process-wide LLM client shared by every Streamlit session.
+
+The Gemini quota is per API key, not per browser tab, so all sessions
+draw from one token bucket. Requests are submitted to a small worker pool
+and return futures (``asyncio`` callers can await ``agenerate``).
+Identical prompts already in flight are coalesced onto one call, and 429
+responses are retried with jittered exponential backoff.
+
+``stream`` yields the answer chunk by chunk as the model produces it, so
+callers can show partial SQL and stop reading once the statement is
+complete (streams are not coalesced).
+
+Set ``NL2SQL_LLM_URL`` to point the client at a local HTTP model server
+(see fake_llm.py) instead of Gemini. Set ``NL2SQL_RATE_LIMIT_DB`` to a file
+path to keep the token bucket in SQLite, so several processes (API
+workers, Streamlit servers) share one quota.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+GEMINI_MODEL = 'gemini-2.0-flash'
+REQUESTS_PER_MINUTE = 15
+MAX_WORKERS = 4
+MAX_RETRIES = 4
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+
+
+class RateLimitError(Exception):
+    """The model rejected the request for quota reasons (HTTP 429)"""
+
+
+def is_rate_limit_error(error):
+    message = str(error)
+    return isinstance(error, RateLimitError) or "429" in message or "quota" in message.lower()
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``capacity`` burst, refilled at ``rate_per_minute``"""
+
+    def __init__(self, rate_per_minute=REQUESTS_PER_MINUTE, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity or rate_per_minute)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self):
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def wait_time(self):
+        """Seconds until one token is available (0 if one is available now)"""
+        with self._lock:
+            self._refill()
+            return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def try_acquire(self):
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self, timeout=None):
+        """Block until a token is taken; False if ``timeout`` seconds pass first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.try_acquire():
+                return True
+            wait = self.wait_time()
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(max(wait, 0.001))
+
+
+class SharedTokenBucket(TokenBucket):
+    """TokenBucket kept in a SQLite file, shared by every process that opens the same path
+
+    Each take is one IMMEDIATE transaction, so concurrent processes never
+    spend the same token. Wall-clock time is used, as monotonic clocks are
+    not comparable across processes.
+    """
+
+    def __init__(self, path, rate_per_minute=REQUESTS_PER_MINUTE, capacity=None, name="llm"):
+        super().__init__(rate_per_minute, capacity)
+        self.path = str(path)
+        self.name = name
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("CREATE TABLE IF NOT EXISTS token_buckets "
+                         "(name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL);")
+        return conn
+
+    def _stored_tokens(self, conn, now):
+        row = conn.execute("SELECT tokens, updated FROM token_buckets WHERE name = ?;", (self.name,)).fetchone()
+        if row is None:
+            return self.capacity
+        return min(self.capacity, row[0] + max(now - row[1], 0.0) * self.rate)
+
+    def available(self):
+        return self._stored_tokens(self._connection(), time.time())
+
+    def wait_time(self):
+        tokens = self.available()
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def try_acquire(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE;")
+        try:
+            now = time.time()
+            tokens = self._stored_tokens(conn, now)
+            taken = tokens >= 1
+            conn.execute("INSERT OR REPLACE INTO token_buckets (name, tokens, updated) VALUES (?, ?, ?);",
+                         (self.name, tokens - 1 if taken else tokens, now))
+            conn.execute("COMMIT;")
+        except BaseException:
+            conn.execute("ROLLBACK;")
+            raise
+        return taken
+
+
+class GeminiModel:
+    """Thin wrapper around one reusable google.generativeai model instance
+
+    The SDK is imported and configured on the first request, not when the
+    client is created, so the app starts (and shows the quota) without it.
+    """
+
+    def __init__(self, model_name=GEMINI_MODEL):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _generative_model(self):
+        with self._lock:
+            if self._model is None:
+                import google.generativeai as genai
+
+                if os.getenv("GOOGLE_API_KEY"):
+                    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+                self._model = genai.GenerativeModel(self.model_name)
+            return self._model
+
+    def generate(self, prompt):
+        return self._generative_model().generate_content(prompt).text
+
+    def stream(self, prompt):
+        for chunk in self._generative_model().generate_content(prompt, stream=True):
+            yield chunk.text
+
+
+class HTTPModel:
+    """Model served over HTTP: POST {"prompt": ...} -> {"text": ...}
+
+    With ``"stream": true`` the server answers with one {"text": chunk} JSON
+    object per line; a server that ignores the flag sends a single line.
+    """
+
+    def __init__(self, url, timeout=60):
+        self.url = url
+        self.timeout = timeout
+
+    def generate(self, prompt):
+        body = json.dumps({"prompt": prompt}).encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode("utf-8"))["text"]
+        except urllib.error.HTTPError as e:
+            if e.code == 429:
+                raise RateLimitError(f"429 from {self.url}") from e
+            raise
+
+    def stream(self, prompt):
+        body = json.dumps({"prompt": prompt, "stream": True}).encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 429:
+                raise RateLimitError(f"429 from {self.url}") from e
+            raise
+        # Closing the generator early closes the connection, so the server stops sending
+        with response:
+            for line in response:
+                if line.strip():
+                    yield json.loads(line.decode("utf-8"))["text"]
+
+
+class LLMClient:
+    """Rate-limited, coalescing, retrying front end to a model backend"""
+
+    def __init__(self, model, limiter=None, max_workers=MAX_WORKERS, max_retries=MAX_RETRIES,
+                 backoff_base=BACKOFF_BASE_SECONDS, backoff_max=BACKOFF_MAX_SECONDS):
+        self.model = model
+        self.limiter = limiter or TokenBucket()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = {'calls': 0, 'retries': 0, 'coalesced': 0}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _backoff(self, attempt):
+        # Full jitter keeps many sessions from retrying in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _call(self, prompt):
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                with self._lock:
+                    self.stats['calls'] += 1
+                return self.model.generate(prompt)
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    raise
+                if attempt == self.max_retries:
+                    raise RateLimitError(str(e)) from e
+                with self._lock:
+                    self.stats['retries'] += 1
+                time.sleep(self._backoff(attempt))
+
+    def submit(self, prompt):
+        """Queue a generation and return a Future; identical in-flight prompts share one"""
+        key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.stats['coalesced'] += 1
+                return future
+            future = self._executor.submit(self._call, prompt)
+            self._in_flight[key] = future
+        future.add_done_callback(lambda _: self._forget(key, future))
+        return future
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def generate(self, prompt, timeout=None):
+        """Blocking generation (waits on the shared worker pool)"""
+        return self.submit(prompt).result(timeout=timeout)
+
+    def stream(self, prompt):
+        """Yield text chunks as they arrive; a 429 before the first chunk is retried with backoff
+
+        Runs in the calling thread. Closing the generator stops reading the
+        model's output. Backends without ``stream`` yield one chunk.
+        """
+        model_stream = getattr(self.model, "stream", None)
+        if model_stream is None:
+            yield self.generate(prompt)
+            return
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            with self._lock:
+                self.stats['calls'] += 1
+            chunks = model_stream(prompt)
+            started = False
+            try:
+                for chunk in chunks:
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if started or not is_rate_limit_error(e):
+                    raise
+                if attempt == self.max_retries:
+                    raise RateLimitError(str(e)) from e
+                with self._lock:
+                    self.stats['retries'] += 1
+            finally:
+                chunks.close()
+            time.sleep(self._backoff(attempt))
+
+    async def agenerate(self, prompt):
+        return await asyncio.wrap_future(self.submit(prompt))
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide client (module state survives Streamlit reruns)"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            url = os.getenv("NL2SQL_LLM_URL")
+            shared = os.getenv("NL2SQL_RATE_LIMIT_DB")
+            _client = LLMClient(HTTPModel(url) if url else GeminiModel(),
+                                limiter=SharedTokenBucket(shared) if shared else None)
+        return _client
+
+
+def set_client(client):
+    """Replace the process-wide client (benchmarks and tests plug in a fake model); returns the old one"""
+    global _client
+    with _client_lock:
+        previous, _client = _client, client
+        return previous
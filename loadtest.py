@@ -0,0 +1,186 @@
+"""Closed-loop load test for the HTTP API (api.py).
+
+    python loadtest.py --url http://127.0.0.1:8000 --concurrency 16 --duration 20
+    python loadtest.py --spawn 1,2,4 --db big.db --out loadtest.json
+
+Each client thread keeps one keep-alive connection and POSTs /query with
+questions from the benchmark corpus (or --questions), back to back, for
+--duration seconds. Reported: requests/second, latency percentiles, the
+status codes seen and how many distinct worker processes answered.
+
+--spawn starts a fake model server and then api.py once per worker count,
+runs the same load against each and prints the throughput relative to one
+worker. The result cache is off in the spawned servers, so every request
+runs its SQL; with the NL cache warm after the first pass, what is measured
+is the per-request CPU work that extra worker processes spread over cores.
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from bench import QUESTIONS, summarize
+
+API_SCRIPT = Path(__file__).parent / "api.py"
+FAKE_LLM_SCRIPT = Path(__file__).parent / "fake_llm.py"
+
+
+def client_loop(url, questions, db, deadline, offset, results):
+    """One client: send questions until ``deadline``, appending (status, ms, worker) to ``results``"""
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+    i = offset
+    while time.perf_counter() < deadline:
+        body = {"question": questions[i % len(questions)]}
+        if db:
+            body["db"] = db
+        i += 1
+        started = time.perf_counter()
+        try:
+            conn.request("POST", "/query", json.dumps(body), {"Content-Type": "application/json"})
+            response = conn.getresponse()
+            payload = json.loads(response.read() or b"{}")
+            status = response.status if not payload.get("error") else f"{response.status} (SQL error)"
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            conn.close()
+            status, payload = type(e).__name__, {}
+        results.append((status, (time.perf_counter() - started) * 1000, payload.get("worker")))
+    conn.close()
+
+
+def run_load(url, questions=QUESTIONS, db=None, concurrency=8, duration=10.0):
+    """Drive ``url`` with ``concurrency`` clients for ``duration`` seconds; returns a summary dict"""
+    results = []
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=client_loop, args=(url, questions, db, deadline, n, results), daemon=True)
+        for n in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    ok = [ms for status, ms, _ in results if status == 200]
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "throughput_rps": round(len(ok) / elapsed, 2),
+        "latency_ms": summarize(ok),
+        "statuses": {str(status): count for status, count in Counter(s for s, _, _ in results).items()},
+        "workers_seen": len({worker for _, _, worker in results if worker}),
+    }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(url, timeout=30.0):
+    parts = urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=1)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def _stop(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def spawn_and_compare(worker_counts, db, questions=QUESTIONS, concurrency=16, duration=10.0, warmup=3.0,
+                      latency=0.0):
+    """Load-test a freshly started api.py for each worker count; returns one summary per count"""
+    db = Path(db).resolve()
+    llm_port = _free_port()
+    fake_llm = subprocess.Popen([sys.executable, str(FAKE_LLM_SCRIPT), "--port", str(llm_port),
+                                 "--latency", str(latency)])
+    env = dict(os.environ,
+               NL2SQL_LLM_URL=f"http://127.0.0.1:{llm_port}/",
+               NL2SQL_DATABASES=db.name,
+               NL2SQL_RESULT_CACHE_MB="0",
+               NL2SQL_RATE_LIMIT_DB=str(db.parent / "loadtest_rate_limit.db"))
+    reports = []
+    try:
+        for workers in worker_counts:
+            port = _free_port()
+            url = f"http://127.0.0.1:{port}"
+            server = subprocess.Popen([sys.executable, str(API_SCRIPT), "--port", str(port),
+                                       "--workers", str(workers)], cwd=db.parent, env=env)
+            try:
+                _wait_for(url)
+                # Fills the NL cache, so the measured run does not wait on the model's quota
+                run_load(url, questions, db.name, concurrency=1, duration=warmup)
+                report = run_load(url, questions, db.name, concurrency, duration)
+            finally:
+                _stop(server)
+            report["workers"] = workers
+            reports.append(report)
+            print(f"{workers} worker(s): {report['throughput_rps']} req/s, "
+                  f"p50 {report['latency_ms'].get('p50')} ms, p95 {report['latency_ms'].get('p95')} ms, "
+                  f"statuses {report['statuses']}", flush=True)
+    finally:
+        _stop(fake_llm)
+    if reports and reports[0]["throughput_rps"]:
+        for report in reports:
+            report["speedup"] = round(report["throughput_rps"] / reports[0]["throughput_rps"], 2)
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the NL→SQL HTTP API")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="running api.py to test")
+    parser.add_argument("--spawn", help="comma-separated worker counts; start api.py for each instead of --url")
+    parser.add_argument("--db", help="database to query (required with --spawn)")
+    parser.add_argument("--questions", help="JSONL/CSV question file (default: built-in corpus)")
+    parser.add_argument("--concurrency", type=int, default=16, help="clients sending at once")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per measured run")
+    parser.add_argument("--warmup", type=float, default=3.0, help="--spawn: seconds of single-client warmup")
+    parser.add_argument("--latency", type=float, default=0.0, help="--spawn: fake model seconds per call")
+    parser.add_argument("--out", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    questions = QUESTIONS
+    if args.questions:
+        from batch import load_questions
+
+        questions = [question for _, question in load_questions(args.questions)]
+    if args.spawn:
+        if not args.db:
+            parser.error("--spawn needs --db")
+        counts = [int(n) for n in args.spawn.split(",")]
+        report = {"cpu_count": os.cpu_count(),
+                  "runs": spawn_and_compare(counts, args.db, questions, args.concurrency, args.duration,
+                                            args.warmup, args.latency)}
+        for run in report["runs"]:
+            print(f"{run['workers']} worker(s): x{run.get('speedup', '?')}")
+    else:
+        report = run_load(args.url, questions, args.db, args.concurrency, args.duration)
+        print(json.dumps(report, indent=2))
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
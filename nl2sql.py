@@ -0,0 +1,163 @@
+"""NL→SQL generation without Streamlit, shared by app.py and the batch CLI."""
+import re
+import sqlite3
+import time
+
+from llm_client import get_client, is_rate_limit_error
+from telemetry import approx_tokens, span
+
+BATCH_INSTRUCTIONS = """
+You will receive several numbered questions. Answer every question with one SQL query.
+Write each answer on a single line as "<number>: <SQL query>", in the same order, with nothing else.
+"""
+
+_ANSWER_RE = re.compile(r"^\s*(?:Q|A)?\s*(\d+)\s*[:.)]\s*(.+?)\s*$")
+# An opening fence and its language tag ("```sql SELECT ..." or "```\n"); "```SELECT 1```" has no tag
+_OPEN_FENCE_RE = re.compile(r"```(?:(?:[A-Za-z]*sql|sqlite|duckdb)(?=\s)|[A-Za-z]*(?=\n))?\s*", re.IGNORECASE)
+# Output that may still turn into an opening fence once more arrives
+_PARTIAL_FENCE_RE = re.compile(r"`{1,2}|```[A-Za-z]*")
+
+
+def _error_message(e):
+    error_msg = str(e)
+    if is_rate_limit_error(e):
+        return "❌ Rate limit exceeded. Please wait a minute and try again."
+    elif "403" in error_msg:
+        return "❌ API key invalid or billing not enabled. Please check your Google Cloud project."
+    else:
+        return f"❌ Error: {error_msg}"
+
+
+def get_genai_response(question, prompt):
+    """Generate SQL for one question; failures come back as a "❌ ..." message"""
+    full_prompt = prompt + "\n\nQuestion: " + question
+    with span("generate", prompt_tokens=approx_tokens(full_prompt)) as attributes:
+        try:
+            # Shared client: process-wide token bucket, coalescing and 429 retries with backoff
+            text = get_client().generate(full_prompt)
+        except Exception as e:
+            attributes['error'] = type(e).__name__
+            return _error_message(e)
+        attributes['response_tokens'] = approx_tokens(text)
+        return text.strip()
+
+
+class StatementStream:
+    """Collects streamed model output and notices when the first SQL statement is complete
+
+    A leading ``` fence (with its language tag) is dropped, on its own line
+    or inline, and so is the backtick of an inline `SELECT ...;` answer. The
+    statement ends at the first semicolon that closes a complete SQLite
+    statement (semicolons inside literals and comments do not count) or at
+    a closing fence.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.sql = None  # set once the statement is complete
+        self._checked = 0  # body offset up to which semicolons were already tried
+
+    def body(self, final=False):
+        """Output so far without the opening fence ("" while the start could still be one, unless final)"""
+        stripped = self.text.lstrip()
+        if not final and _PARTIAL_FENCE_RE.fullmatch(stripped):
+            return ""
+        if stripped.startswith("```"):
+            return stripped[_OPEN_FENCE_RE.match(stripped).end():]
+        if stripped.startswith("`"):
+            return stripped[1:]
+        return stripped
+
+    def feed(self, chunk):
+        """Add a chunk; True once the statement is complete"""
+        if self.sql is not None:
+            return True
+        self.text += chunk
+        body = self.body()
+        fence = body.find("```")
+        if fence >= 0:
+            self.sql = body[:fence].strip()
+            return True
+        position = body.find(";", self._checked)
+        while position >= 0:
+            if sqlite3.complete_statement(body[:position + 1]):
+                self.sql = body[:position + 1].strip()
+                return True
+            position = body.find(";", position + 1)
+        self._checked = len(body)
+        return False
+
+    def partial(self):
+        """The statement so far, for display while the stream is still running"""
+        return self.sql if self.sql is not None else self.body().strip()
+
+    def result(self):
+        """The statement, or everything received when the stream ended without a terminator"""
+        if self.sql is not None:
+            return self.sql
+        body = self.body(final=True).strip()
+        stripped = self.text.lstrip()
+        if stripped.startswith("`") and not stripped.startswith("```") and body.endswith("`"):
+            body = body[:-1].strip()  # the closing backtick of an inline answer
+        return body
+
+
+def stream_genai_response(question, prompt, on_update=None):
+    """Like get_genai_response, but streamed: ``on_update(partial_sql)`` is called as text arrives
+
+    Reading stops at the end of the first complete statement, so trailing
+    commentary is never waited for.
+    """
+    full_prompt = prompt + "\n\nQuestion: " + question
+    with span("generate", prompt_tokens=approx_tokens(full_prompt), streamed=True) as attributes:
+        started = time.perf_counter()
+        statement = StatementStream()
+        chunks = get_client().stream(full_prompt)
+        try:
+            for chunk in chunks:
+                if 'first_chunk_ms' not in attributes:
+                    attributes['first_chunk_ms'] = round((time.perf_counter() - started) * 1000, 3)
+                complete = statement.feed(chunk)
+                if on_update:
+                    on_update(statement.partial())
+                if complete:
+                    attributes['early_stop'] = True
+                    break
+        except Exception as e:
+            attributes['error'] = type(e).__name__
+            return _error_message(e)
+        finally:
+            chunks.close()
+        attributes['response_tokens'] = approx_tokens(statement.text)
+        return statement.result()
+
+
+def parse_batch_response(text, count):
+    """Split a numbered multi-answer response; missing answers are None"""
+    answers = [None] * count
+    for line in text.strip().strip("`").splitlines():
+        match = _ANSWER_RE.match(line)
+        if match:
+            index = int(match.group(1)) - 1
+            if 0 <= index < count and answers[index] is None:
+                answers[index] = match.group(2)
+    return answers
+
+
+def get_genai_batch_response(questions, prompt):
+    """Generate SQL for several questions in one call, falling back to single calls for gaps"""
+    if len(questions) == 1:
+        return [get_genai_response(questions[0], prompt)]
+    numbered = "\n".join(f"{i}: {question}" for i, question in enumerate(questions, 1))
+    full_prompt = prompt + BATCH_INSTRUCTIONS + "\nQuestions:\n" + numbered
+    with span("generate_batch", questions=len(questions), prompt_tokens=approx_tokens(full_prompt)) as attributes:
+        try:
+            text = get_client().generate(full_prompt)
+        except Exception as e:
+            attributes['error'] = type(e).__name__
+            return [_error_message(e)] * len(questions)
+        attributes['response_tokens'] = approx_tokens(text)
+        answers = parse_batch_response(text, len(questions))
+        attributes['parsed'] = sum(answer is not None for answer in answers)
+    return [answer if answer else get_genai_response(question, prompt)
+            for question, answer in zip(questions, answers)]
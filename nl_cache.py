@@ -0,0 +1,268 @@
+"""Persistent NL→SQL cache shared by every Streamlit session.
+
+Entries are keyed on the normalized question plus a fingerprint of the
+prompt and the live schema, so a change to either one invalidates them.
+Lookups go through two tiers: an exact match on the normalized question,
+then a TF-IDF cosine match that catches near-duplicate paraphrases.
+
+Comparison symbols and minus signs are kept in the normalized question as
+words (``>`` is "gt", ``-5`` is "neg 5"), so "GPA > 3.5" and "GPA < 3.5"
+never share a key.
+
+A paraphrase is only served when it agrees with the question on every
+number and on every word that flips the meaning (less/greater, not,
+and/or, gt/lt...), which TF-IDF scoring barely weighs. A close match that
+differs in one of them is offered by ``suggest`` but never run.
+"""
+import hashlib
+import json
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+DEFAULT_CACHE_PATH = Path(__file__).parent / "nl_cache.db"
+
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "of", "in", "on", "for",
+    "to", "and", "or", "with", "by", "me", "show", "list", "give", "get", "find",
+    "display", "please", "all", "what", "which", "who", "there", "do", "does",
+    "i", "you", "can", "tell", "return", "from", "that", "this", "those", "these",
+}
+
+# Comparison, negation and conjunction words: two questions that differ in one of these ask different things
+MEANING_WORDS = {
+    "less", "fewer", "lower", "lowest", "least", "below", "under", "smaller", "smallest", "minimum", "min",
+    "greater", "more", "higher", "highest", "most", "above", "over", "larger", "largest", "maximum", "max",
+    "top", "bottom", "before", "after", "between", "equal", "exactly",
+    "not", "no", "non", "without", "except", "excluding", "never", "nor", "and", "or",
+    "gt", "lt", "ge", "le", "ne", "eq", "neg",
+}
+
+# Words for the comparison symbols and for a minus sign that starts a number
+SYMBOL_WORDS = {">=": "ge", "<=": "le", "!=": "ne", "<>": "ne", ">": "gt", "<": "lt", "=": "eq", "-": "neg"}
+# Bumped whenever normalize_question changes, so stores keyed on it re-key their rows
+QUESTION_KEY_VERSION = 2
+
+_WORD_RE = re.compile(r"[<>!]=|<>|[<>=]|(?<![a-z0-9_.])-(?=\d)|[a-z0-9_]+(?:\.[0-9]+)?")
+
+
+def normalize_question(question):
+    """Lowercase, spell out comparison symbols and signs, strip other punctuation and collapse whitespace"""
+    return " ".join(SYMBOL_WORDS.get(word, word) for word in _WORD_RE.findall(question.lower()))
+
+
+def _tokens(normalized):
+    return [tok for tok in normalized.split() if tok not in STOPWORDS]
+
+
+def _numbers(normalized):
+    return {tok for tok in normalized.split() if any(ch.isdigit() for ch in tok)}
+
+
+def _meaning_words(normalized):
+    return {tok for tok in normalized.split() if tok in MEANING_WORDS}
+
+
+def same_meaning(question_key, other_key):
+    """True if two normalized questions agree on every literal number and every meaning-flipping word"""
+    return (_numbers(question_key) == _numbers(other_key)
+            and _meaning_words(question_key) == _meaning_words(other_key))
+
+
+def fingerprint(prompt, table_structure):
+    """Hash the prompt and the schema (row counts and SQLite internals excluded) into a cache namespace"""
+    schema = {
+        table: {key: value for key, value in info.items() if key not in ('row_count', 'row_count_exact')}
+        for table, info in table_structure.items()
+        if not table.startswith('sqlite_')
+    }
+    payload = prompt + "\n" + json.dumps(schema, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _TfidfIndex:
+    """Small in-memory TF-IDF index over the cached questions of one fingerprint"""
+
+    def __init__(self, rows):
+        self.rows = rows  # [(question_key, sql)]
+        docs = [Counter(_tokens(key)) for key, _ in rows]
+        df = Counter()
+        for doc in docs:
+            df.update(doc.keys())
+        n_docs = len(docs)
+        self.idf = {tok: math.log((1 + n_docs) / (1 + count)) + 1 for tok, count in df.items()}
+        self.vectors = [self._vectorize(doc) for doc in docs]
+
+    def _vectorize(self, counts):
+        vec = {tok: tf * self.idf.get(tok, 1.0) for tok, tf in counts.items()}
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {tok: v / norm for tok, v in vec.items()}
+
+    def best_match(self, question_key):
+        query = self._vectorize(Counter(_tokens(question_key)))
+        best_score, best_idx = 0.0, None
+        for idx, vec in enumerate(self.vectors):
+            score = sum(weight * vec.get(tok, 0.0) for tok, weight in query.items())
+            if score > best_score:
+                best_score, best_idx = score, idx
+        if best_idx is None:
+            return None, 0.0
+        return self.rows[best_idx], best_score
+
+
+class NLCache:
+    """Two-tier (exact + paraphrase) NL→SQL cache backed by a SQLite file"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=24 * 3600, max_entries=1000,
+                 similarity_threshold=0.85):
+        self.path = str(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.stats = {'exact_hits': 0, 'similar_hits': 0, 'misses': 0, 'rejected': 0}
+        self._lock = threading.Lock()
+        self._index = None
+        self._index_key = None
+        self._generation = 0
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS nl_cache (
+                fingerprint TEXT NOT NULL,
+                question_key TEXT NOT NULL,
+                question TEXT NOT NULL,
+                sql TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (fingerprint, question_key)
+            );
+        """)
+        if self._conn.execute("PRAGMA user_version;").fetchone()[0] < QUESTION_KEY_VERSION:
+            # Older keys dropped comparison symbols, so one entry could answer both "> 3.5" and "< 3.5"
+            stale = [(rowid,) for rowid, question, key in
+                     self._conn.execute("SELECT rowid, question, question_key FROM nl_cache;")
+                     if normalize_question(question) != key]
+            self._conn.executemany("DELETE FROM nl_cache WHERE rowid = ?;", stale)
+            self._conn.execute(f"PRAGMA user_version = {QUESTION_KEY_VERSION};")
+        self._conn.commit()
+
+    def _purge(self, now):
+        """Drop expired entries
+
+        Entries of other fingerprints are kept: with several databases (or
+        backends) in use, each one's entries stay valid for it.
+        """
+        cur = self._conn.execute(
+            "DELETE FROM nl_cache WHERE created_at < ?;",
+            (now - self.ttl_seconds,),
+        )
+        if cur.rowcount:
+            self._generation += 1
+
+    def _similar_index(self, fp):
+        data_version = self._conn.execute("PRAGMA data_version;").fetchone()[0]
+        key = (fp, data_version, self._generation)
+        if self._index_key != key:
+            rows = self._conn.execute(
+                "SELECT question_key, sql FROM nl_cache WHERE fingerprint = ?;", (fp,)
+            ).fetchall()
+            self._index = _TfidfIndex(rows)
+            self._index_key = key
+        return self._index
+
+    def get(self, question, fp):
+        """Return (sql, tier) for a cached question, or None on a miss"""
+        question_key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            row = self._conn.execute(
+                "SELECT sql FROM nl_cache WHERE fingerprint = ? AND question_key = ?;",
+                (fp, question_key),
+            ).fetchone()
+            tier = 'exact'
+            if row is None:
+                found, score = self._similar_index(fp).best_match(question_key)
+                if found is not None and score >= self.similarity_threshold:
+                    # "GPA > 3.5" vs "> 3.0", "less than" vs "greater than", "not in" vs "in"
+                    if same_meaning(found[0], question_key):
+                        question_key, row, tier = found[0], (found[1],), 'similar'
+                    else:
+                        self.stats['rejected'] += 1
+            if row is None:
+                self.stats['misses'] += 1
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE nl_cache SET last_used_at = ?, hits = hits + 1 "
+                "WHERE fingerprint = ? AND question_key = ?;",
+                (now, fp, question_key),
+            )
+            self._conn.commit()
+            self.stats[f'{tier}_hits'] += 1
+            return row[0], tier
+
+    def suggest(self, question, fp):
+        """(cached question, sql) of a close paraphrase that ``get`` refused to serve, or None
+
+        For display only: the cached SQL answers a question that differs in a
+        number or a comparison/negation/conjunction word.
+        """
+        question_key = normalize_question(question)
+        with self._lock:
+            found, score = self._similar_index(fp).best_match(question_key)
+            self._conn.commit()
+        if found is None or score < self.similarity_threshold or same_meaning(found[0], question_key):
+            return None
+        return found
+
+    def put(self, question, fp, sql):
+        """Store a generated query, evicting the least recently used entries when full"""
+        question_key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO nl_cache "
+                "(fingerprint, question_key, question, sql, created_at, last_used_at, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0);",
+                (fp, question_key, question, sql, now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM nl_cache WHERE rowid IN ("
+                "SELECT rowid FROM nl_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?);",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+            self._generation += 1
+
+    def contains(self, question, fp):
+        """True if the exact question is cached and unexpired (stats and recency are left alone)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM nl_cache WHERE fingerprint = ? AND question_key = ? AND created_at >= ?;",
+                (fp, normalize_question(question), time.time() - self.ttl_seconds),
+            ).fetchone()
+            self._conn.commit()
+            return row is not None
+
+    def size(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM nl_cache;").fetchone()[0]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache(path=DEFAULT_CACHE_PATH):
+    """Process-wide cache instance (module state survives Streamlit reruns)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = NLCache(path)
+        return _cache
@@ -0,0 +1,318 @@
+"""Schema-aware prompt construction.
+
+The schema section of the prompt is generated from the introspected
+catalog instead of being hardcoded, so it follows sql.py when the tables
+change. On small databases the whole schema is sent. On wide databases
+only the tables and columns that match the question are sent, plus the
+tables needed to join them along foreign keys. When the summary tables
+from summaries.py are part of the schema, they are described and the
+examples they answer are rewritten to read them.
+
+Follow-up questions ("...sorted by GPA") get a refinement prompt instead:
+the previous question and SQL plus only the tables they and the follow-up
+touch, without the examples, so just the change is sent to the model.
+"""
+import re
+from collections import deque
+
+from approximate import is_sample_table
+from backends import DIALECT_HINTS
+from nl_cache import STOPWORDS
+from summaries import SUMMARY_EXAMPLES, SUMMARY_TABLES
+
+INSTRUCTIONS = """
+You are an expert NL2SQL model. Your task is to accurately convert English questions into valid SQL queries.
+
+Understand the intent behind natural language questions.
+
+Identify relevant tables, columns, conditions, and relationships.
+
+Use appropriate SQL syntax (e.g., SELECT, JOIN, WHERE, GROUP BY, ORDER BY, etc.).
+
+Ensure the output SQL query is syntactically correct and logically matches the meaning of the input question.
+
+Handle edge cases, such as missing conditions, ambiguous phrasing, or multi-table joins.
+
+Prefer readability and accuracy. Comment the query when appropriate.
+The database has the following tables and relationships:
+"""
+
+FEW_SHOT_EXAMPLES = [
+    ("How many students are there?",
+     "SELECT COUNT(*) FROM STUDENT;"),
+    ("Show all students in Data Science department",
+     "SELECT s.* FROM STUDENT s JOIN DEPARTMENTS d ON s.DEPT_ID = d.DEPT_ID WHERE d.DEPT_NAME = 'Data Science';"),
+    ("What courses is Krish Naik taking?",
+     "SELECT c.COURSE_NAME FROM STUDENT s JOIN ENROLLMENTS e ON s.STUDENT_ID = e.STUDENT_ID "
+     "JOIN COURSES c ON e.COURSE_ID = c.COURSE_ID WHERE s.NAME = 'Krish Naik';"),
+    ("Show students with GPA greater than 3.5",
+     "SELECT NAME, GPA FROM STUDENT WHERE GPA > 3.5;"),
+    ("Average marks by department",
+     "SELECT d.DEPT_NAME, AVG(e.MARKS) FROM DEPARTMENTS d JOIN STUDENT s ON d.DEPT_ID = s.DEPT_ID "
+     "JOIN ENROLLMENTS e ON s.STUDENT_ID = e.STUDENT_ID GROUP BY d.DEPT_NAME;"),
+    ("Which instructor teaches the most courses?",
+     "SELECT i.INSTRUCTOR_NAME, COUNT(c.COURSE_ID) as course_count FROM INSTRUCTORS i "
+     "JOIN COURSES c ON i.INSTRUCTOR_ID = c.INSTRUCTOR_ID GROUP BY i.INSTRUCTOR_NAME "
+     "ORDER BY course_count DESC LIMIT 1;"),
+]
+
+SUMMARY_HINT = (
+    "Precomputed aggregates (kept current by triggers). Prefer them over aggregating ENROLLMENTS for "
+    "counts, totals and averages per department, course or instructor; aggregate ENROLLMENTS only when "
+    "the question filters enrollments (by date, grade, status, ...):"
+)
+
+REFINE_INSTRUCTIONS = """
+You are an expert NL2SQL model. The user is refining their previous question.
+Rewrite the previous SQL query so that it also satisfies the follow-up, keeping every condition the follow-up does not change.
+The relevant tables and relationships are:
+"""
+
+FOOTER = "Important: Return only the SQL query without any markdown formatting, explanations, or the word 'SQL'."
+
+# Below this size the whole schema is cheaper than the risk of pruning a needed table
+FULL_SCHEMA_MAX_TABLES = 12
+MAX_PROMPT_TABLES = 8
+MAX_COLUMNS_PER_TABLE = 40
+
+# Question words that refer to a schema term by another name
+SYNONYMS = {
+    "dept": "department",
+    "teach": "instructor",
+    "teacher": "instructor",
+    "professor": "instructor",
+    "faculty": "instructor",
+    "subject": "course",
+    "pupil": "student",
+    "score": "mark",
+    "enrol": "enroll",
+    "attend": "attendance",
+}
+
+_WORD_RE = re.compile(r"[A-Za-z]+")
+
+# Stable text of everything except the schema, for cache fingerprints
+PROMPT_TEMPLATE = "\n".join(
+    [INSTRUCTIONS] + [f"Q: {q}\nA: {a}" for q, a in FEW_SHOT_EXAMPLES] + [FOOTER]
+)
+
+
+def stem(word):
+    """Crude singular/base form of a word, with schema synonyms applied (students -> student)"""
+    word = word.lower()
+    for suffix, repl in (("ies", "y"), ("ches", "ch"), ("shes", "sh"), ("sses", "ss"), ("ing", ""), ("es", "e"), ("ed", "")):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[: len(word) - len(suffix)] + repl
+            break
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        word = word[:-1]
+    return SYNONYMS.get(word, word)
+
+
+def _terms(text):
+    return {stem(word) for word in _WORD_RE.findall(text) if len(word) > 1 and word.lower() not in STOPWORDS}
+
+
+def _matches(question_terms, identifier):
+    """True if any part of a SQL identifier (split on _) matches a question term"""
+    for part in _terms(identifier.replace("_", " ")):
+        for term in question_terms:
+            if len(term) >= 3 and len(part) >= 3 and (part.startswith(term) or term.startswith(part)):
+                return True
+    return False
+
+
+def _user_tables(table_structure):
+    # Sample tables are for approximate mode only; the model writes queries against the full tables
+    return {name: info for name, info in table_structure.items()
+            if not name.startswith("sqlite_") and not is_sample_table(name)}
+
+
+def key_columns(info):
+    """Primary-key and foreign-key column names of a table"""
+    fk_columns = {fk[3] for fk in info['foreign_keys']}
+    return {col[1] for col in info['columns'] if col[5] or col[1] in fk_columns}
+
+
+def _fk_graph(relationships, tables):
+    graph = {table: set() for table in tables}
+    for rel in relationships:
+        if rel['from_table'] in graph and rel['to_table'] in graph:
+            graph[rel['from_table']].add(rel['to_table'])
+            graph[rel['to_table']].add(rel['from_table'])
+    return graph
+
+
+def _join_path(graph, start, goal):
+    """Shortest chain of tables linking two tables along foreign keys"""
+    previous = {start: None}
+    queue = deque([start])
+    while queue:
+        node = queue.popleft()
+        if node == goal:
+            path = []
+            while node is not None:
+                path.append(node)
+                node = previous[node]
+            return path
+        for neighbour in sorted(graph[node]):
+            if neighbour not in previous:
+                previous[neighbour] = node
+                queue.append(neighbour)
+    return []
+
+
+def select_schema(question, table_structure, relationships):
+    """Pick {table: [column names]} to describe for this question"""
+    tables = _user_tables(table_structure)
+    if len(tables) <= FULL_SCHEMA_MAX_TABLES:
+        return {name: [col[1] for col in info['columns']] for name, info in tables.items()}
+
+    question_terms = _terms(question)
+    scores = {}
+    matched_columns = {}
+    for name, info in tables.items():
+        # Key columns (STUDENT_ID in every child table) say nothing about relevance
+        columns = [col[1] for col in info['columns']
+                   if col[1] not in key_columns(info) and _matches(question_terms, col[1])]
+        score = (3 if _matches(question_terms, name) else 0) + len(columns)
+        if score:
+            scores[name] = score
+            matched_columns[name] = columns
+    if not scores:
+        return {name: [col[1] for col in info['columns']] for name, info in tables.items()}
+
+    ranked = sorted(scores, key=lambda name: (-scores[name], name))[:MAX_PROMPT_TABLES]
+    # Add the tables needed to join every selected table to the best match
+    graph = _fk_graph(relationships, tables)
+    selected = list(ranked)
+    for table in ranked[1:]:
+        for hop in _join_path(graph, ranked[0], table):
+            if hop not in selected:
+                selected.append(hop)
+
+    schema = {}
+    for name in selected:
+        info = tables[name]
+        keys = [col[1] for col in info['columns'] if col[1] in key_columns(info)]
+        if name in ranked and _matches(question_terms, name):
+            # Directly mentioned tables keep their columns, keys and matches first
+            rest = [col[1] for col in info['columns'] if col[1] not in keys]
+            wanted = keys + matched_columns.get(name, []) + rest
+        else:
+            wanted = keys + matched_columns.get(name, [])
+        schema[name] = list(dict.fromkeys(wanted))[:MAX_COLUMNS_PER_TABLE]
+    return schema
+
+
+def sql_tables(sql):
+    """Table names after FROM / JOIN in a query, in order of appearance"""
+    return list(dict.fromkeys(re.findall(r"(?:FROM|JOIN)\s+([A-Za-z_][A-Za-z0-9_]*)", sql, flags=re.IGNORECASE)))
+
+
+def build_prompt(question, table_structure, relationships, examples=None, dialect=None):
+    """Assemble instructions, the pruned schema section, matching examples and the footer
+
+    ``examples`` are (question, sql) pairs, e.g. retrieved by few_shot; the
+    built-in FEW_SHOT_EXAMPLES are used when it is None. ``dialect`` ('sqlite'
+    or 'duckdb') adds that engine's hint from backends.DIALECT_HINTS.
+    """
+    schema = select_schema(question, table_structure, relationships)
+    lines = [INSTRUCTIONS]
+    if dialect:
+        lines.append(DIALECT_HINTS[dialect])
+        lines.append("")
+    for table, columns in schema.items():
+        lines.append(f"{table}: {', '.join(columns)}")
+        lines.append("")
+
+    summary_tables = [table for table in SUMMARY_TABLES if table in schema]
+    if summary_tables:
+        lines.append(SUMMARY_HINT)
+        lines.extend(f"{table}: {SUMMARY_TABLES[table][2]}" for table in summary_tables)
+        lines.append("")
+
+    edges = [
+        f"{rel['from_table']}.{rel['from_column']} → {rel['to_table']}.{rel['to_column']}"
+        for rel in relationships
+        if rel['from_table'] in schema and rel['to_table'] in schema
+    ]
+    if edges:
+        lines.append("Relationships:")
+        lines.extend(edges)
+        lines.append("")
+
+    # Keep only the examples whose tables are all part of the selected schema
+    examples = FEW_SHOT_EXAMPLES if examples is None else examples
+    if summary_tables:
+        rewrites = dict(SUMMARY_EXAMPLES)
+        examples = [(q, rewrites.get(q, a)) for q, a in examples]
+    examples = [(q, a) for q, a in examples if set(sql_tables(a)) <= set(schema)]
+    if examples:
+        lines.append("Examples:")
+        for q, a in examples:
+            lines.append(f"Q: {q}")
+            lines.append(f"A: {a}")
+            lines.append("")
+
+    lines.append(FOOTER)
+    return "\n".join(lines) + "\n"
+
+
+def refinement_schema(previous_sql, follow_up, table_structure, relationships):
+    """{table: [column names]} for a follow-up: the previous query's tables plus the ones the follow-up adds"""
+    tables = _user_tables(table_structure)
+    by_upper = {name.upper(): name for name in tables}
+    selected = list(dict.fromkeys(by_upper[t.upper()] for t in sql_tables(previous_sql) if t.upper() in by_upper))
+    if not selected:
+        return select_schema(follow_up, table_structure, relationships)
+
+    # Terms the selected tables already cover ("sorted by name") do not pull in other tables; a key
+    # column (DEPT_ID) only points at the table that has the details, so it covers nothing
+    terms = {term for term in _terms(follow_up)
+             if not any(_matches({term}, name) or any(_matches({term}, col[1]) for col in tables[name]['columns']
+                                                      if col[1] not in key_columns(tables[name]))
+                        for name in selected)}
+    graph = _fk_graph(relationships, tables)
+    for name, info in sorted(tables.items()):
+        # Summary tables only stay if the previous query already read them
+        if name in selected or name in SUMMARY_TABLES or not terms:
+            continue
+        if _matches(terms, name) or any(_matches(terms, col[1]) for col in info['columns']
+                                        if col[1] not in key_columns(info)):
+            selected.extend(hop for hop in reversed(_join_path(graph, selected[0], name) or [name])
+                            if hop not in selected)
+            # Link tables (ENROLLMENTS between STUDENT and COURSES) offer the other way to join it
+            selected.extend(link for link in sorted(graph[name])
+                            if link not in selected and link not in SUMMARY_TABLES
+                            and graph[link] & (set(selected) - {name}))
+    return {name: [col[1] for col in tables[name]['columns']][:MAX_COLUMNS_PER_TABLE] for name in selected}
+
+
+def build_refinement_prompt(previous_question, previous_sql, follow_up, table_structure, relationships,
+                            dialect=None):
+    """Prompt for rewriting ``previous_sql`` to satisfy ``follow_up`` (the question itself is appended by the caller)"""
+    schema = refinement_schema(previous_sql, follow_up, table_structure, relationships)
+    lines = [REFINE_INSTRUCTIONS]
+    if dialect:
+        lines.append(DIALECT_HINTS[dialect])
+        lines.append("")
+    for table, columns in schema.items():
+        lines.append(f"{table}: {', '.join(columns)}")
+    lines.append("")
+
+    edges = [
+        f"{rel['from_table']}.{rel['from_column']} → {rel['to_table']}.{rel['to_column']}"
+        for rel in relationships
+        if rel['from_table'] in schema and rel['to_table'] in schema
+    ]
+    if edges:
+        lines.append("Relationships:")
+        lines.extend(edges)
+        lines.append("")
+
+    lines.append(f"Previous question: {previous_question}")
+    lines.append(f"Previous SQL: {' '.join(previous_sql.split())}")
+    lines.append("")
+    lines.append(FOOTER)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,208 @@
+"""Background execution of generated queries, with progress and cancellation.
+
+The UI submits a statement and keeps the returned QueryJob in its session
+state, so a rerun finds the running job instead of starting the query again.
+Workers run it through results.read_sql_page (read_sql_arrow for
+``columnar`` jobs, whose page is an ArrowPage) with the job attached as
+monitor: SQLite reports VM steps through the progress handler, and
+``cancel()`` calls ``interrupt()`` on the connection running the statement.
+A job submitted with a ``repair`` request (generated SQL) that fails runs
+sql_repair.repair on the same worker, still cancellable, before it is done.
+
+Queries that touch a table of at least ``NL2SQL_HEAVY_TABLE_ROWS`` rows
+(by the catalog's row counts) run on a separate pool of
+``NL2SQL_MAX_HEAVY_QUERIES`` workers, so a few expensive queries queue
+behind each other instead of occupying every worker.
+"""
+import contextvars
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from results import RESULT_PAGE_SIZE, ArrowPage, ResultPage, as_arrow_page, read_sql_arrow, read_sql_page
+from schema_catalog import get_catalog
+from sql_guard import table_aliases
+from sql_repair import repair
+
+JOB_WORKERS = int(os.getenv("NL2SQL_JOB_WORKERS", "8"))
+MAX_HEAVY_QUERIES = int(os.getenv("NL2SQL_MAX_HEAVY_QUERIES", "2"))
+HEAVY_TABLE_ROWS = int(os.getenv("NL2SQL_HEAVY_TABLE_ROWS", "1000000"))
+
+CANCELLED_MESSAGE = "Query cancelled."
+
+
+def is_heavy(sql, db):
+    """True if the statement reads a table of at least HEAVY_TABLE_ROWS rows"""
+    try:
+        table_structure = get_catalog(db).table_structure()
+    except Exception:
+        return False
+    tables = set(table_aliases(sql, table_structure).values())
+    return any(table_structure[table]['row_count'] >= HEAVY_TABLE_ROWS for table in tables)
+
+
+class QueryJob:
+    """Handle to one submitted query: state, progress, cancel() and the resulting page
+
+    ``state`` moves from 'queued' to 'running' (then 'repairing' if the
+    statement failed and a repair was requested) to 'done', 'failed' or
+    'cancelled'. ``repair_result`` is the sql_repair.RepairResult once a
+    repair ran; ``page`` is then its page. The attach/detach/step methods
+    are the monitor interface sql_guard calls while a statement runs.
+    """
+
+    def __init__(self, sql, db, offset=0, limit=RESULT_PAGE_SIZE, heavy=False, columnar=False, repair=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.sql = sql
+        self.db = db
+        self.offset = offset
+        self.limit = limit
+        self.heavy = heavy
+        self.columnar = columnar
+        self.repair = repair
+        self.state = "queued"
+        self.page = None
+        self.repair_result = None
+        self.steps = 0
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+    def attach(self, conn):
+        with self._lock:
+            self._conn = conn
+        if self._cancel.is_set():
+            conn.interrupt()
+
+    def detach(self):
+        # Under the lock, so cancel() never interrupts a connection already back in the pool
+        with self._lock:
+            self._conn = None
+
+    def step(self, steps):
+        self.steps = steps
+        return self._cancel.is_set()
+
+    def cancel(self):
+        """Request cancellation; a running statement is interrupted, a queued one never starts"""
+        self._cancel.set()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.interrupt()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block up to ``timeout`` seconds; True once the job has finished"""
+        return self._done.wait(timeout)
+
+    def progress(self):
+        """{'state', 'waited_s', 'elapsed_s', 'steps'} for display"""
+        now = time.monotonic()
+        started = self.started_at or now
+        return {
+            'state': self.state,
+            'waited_s': started - self.submitted_at,
+            'elapsed_s': (self.finished_at or now) - started if self.started_at else 0.0,
+            'steps': self.steps,
+        }
+
+    def _failed(self, message):
+        return ArrowPage(None, False, message) if self.columnar else ResultPage([], [], False, message)
+
+    def _run(self):
+        if self.cancelled:
+            self._finish(self._failed(CANCELLED_MESSAGE))
+            return
+        self.started_at = time.monotonic()
+        self.state = "running"
+        read = read_sql_arrow if self.columnar else read_sql_page
+        try:
+            page = read(self.sql, self.db, offset=self.offset, limit=self.limit, monitor=self)
+        except Exception as e:
+            page = self._failed(str(e))
+        if page.error and self.repair is not None and not self.cancelled:
+            self.state = "repairing"
+            try:
+                self.repair_result = repair(self.repair.question, self.repair.sql, page, self.db,
+                                            prompt=self.repair.prompt, limit=self.limit, monitor=self)
+                page = self.repair_result.page
+            except Exception:
+                # A repair that breaks leaves the original error in place
+                pass
+            if self.columnar:
+                page = as_arrow_page(page)
+        if self.cancelled and page.error:
+            page = page._replace(error=CANCELLED_MESSAGE)
+        self._finish(page)
+
+    def _finish(self, page):
+        self.page = page
+        self.finished_at = time.monotonic()
+        if self.cancelled and page.error:
+            self.state = "cancelled"
+        else:
+            self.state = "failed" if page.error else "done"
+        self._done.set()
+
+
+class QueryJobQueue:
+    """Worker pools for query jobs: one for ordinary queries, a smaller one for heavy ones"""
+
+    def __init__(self, workers=JOB_WORKERS, max_heavy=MAX_HEAVY_QUERIES):
+        self._light = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query-job")
+        self._heavy = ThreadPoolExecutor(max_workers=max_heavy, thread_name_prefix="query-job-heavy")
+        self._jobs = set()
+        self._lock = threading.Lock()
+
+    def submit(self, sql, db, offset=0, limit=RESULT_PAGE_SIZE, columnar=False, repair=None):
+        """Queue ``sql`` and return its QueryJob immediately (its page is an ArrowPage if ``columnar``)
+
+        ``repair`` (a sql_repair.RepairRequest) has a failing statement repaired by the job.
+        """
+        job = QueryJob(sql, db, offset, limit, heavy=is_heavy(sql, db), columnar=columnar, repair=repair)
+        with self._lock:
+            self._jobs.add(job)
+        # The caller's trace id carries over, so the execute span joins the question's trace
+        context = contextvars.copy_context()
+        future = (self._heavy if job.heavy else self._light).submit(context.run, job._run)
+        future.add_done_callback(lambda _: self._forget(job))
+        return job
+
+    def _forget(self, job):
+        with self._lock:
+            self._jobs.discard(job)
+
+    def stats(self):
+        """{'queued', 'running', 'heavy'} over the jobs not yet finished"""
+        with self._lock:
+            jobs = list(self._jobs)
+        return {
+            'queued': sum(job.state == "queued" for job in jobs),
+            'running': sum(job.state in ("running", "repairing") for job in jobs),
+            'heavy': sum(job.heavy for job in jobs),
+        }
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Process-wide job queue (module state survives Streamlit reruns)"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = QueryJobQueue()
+        return _queue
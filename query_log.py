@@ -0,0 +1,101 @@
+"""Workload log of executed generated queries.
+
+Every statement that passes sql_guard is recorded with its query plan,
+latency and outcome in a small SQLite file next to the app. Pages served
+from the result cache are recorded too, marked ``cached`` (no plan, lookup
+latency), so a query answered from memory still counts as demand. The
+index advisor reads it back to see which predicates and join columns the
+generated workload actually uses.
+"""
+import json
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_LOG_PATH = Path(__file__).parent / "query_log.db"
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\b\d+(?:\.\d+)?\b")
+
+
+def normalize_sql(sql):
+    """Collapse whitespace and replace literals with ? so identical query shapes group together"""
+    sql = _LITERAL_RE.sub("?", sql.strip().rstrip(";"))
+    return " ".join(sql.split())
+
+
+class QueryLog:
+    """Append-only execution log backed by a SQLite file"""
+
+    def __init__(self, path=DEFAULT_LOG_PATH):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS executions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                executed_at REAL NOT NULL,
+                db_path TEXT NOT NULL,
+                sql TEXT NOT NULL,
+                shape TEXT NOT NULL,
+                plan TEXT NOT NULL,
+                latency_ms REAL NOT NULL,
+                error TEXT,
+                cached INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(executions);")}
+        if "cached" not in columns:
+            self._conn.execute("ALTER TABLE executions ADD COLUMN cached INTEGER NOT NULL DEFAULT 0;")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_executions_db ON executions (db_path, shape);")
+        self._conn.commit()
+
+    def record(self, db_path, sql, plan, latency_ms, error=None, cached=False):
+        """Append one execution (or result-cache hit); logging is best effort and never fails the query"""
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT INTO executions (executed_at, db_path, sql, shape, plan, latency_ms, error, cached) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?);",
+                    (time.time(), str(Path(db_path).resolve()), sql, normalize_sql(sql),
+                     json.dumps([list(row) for row in plan]), latency_ms, error, int(cached)),
+                )
+                self._conn.commit()
+            except sqlite3.Error:
+                pass
+
+    def workload(self, db_path, since=0):
+        """Successful query shapes for ``db_path``: [{shape, sql, plan, count, cache_hits, avg_ms, max_ms}]
+
+        ``count`` includes the result-cache hits; the latencies and the plan
+        come from real executions only (None if a shape was only served from
+        the cache since ``since``).
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT shape, MAX(sql), MAX(CASE WHEN cached = 0 THEN plan END), COUNT(*), SUM(cached), "
+                "AVG(CASE WHEN cached = 0 THEN latency_ms END), MAX(CASE WHEN cached = 0 THEN latency_ms END) "
+                "FROM executions WHERE db_path = ? AND executed_at >= ? AND error IS NULL "
+                "GROUP BY shape ORDER BY COUNT(*) DESC;",
+                (str(Path(db_path).resolve()), since),
+            ).fetchall()
+        return [
+            {'shape': shape, 'sql': sql, 'plan': json.loads(plan or "[]"), 'count': count,
+             'cache_hits': cache_hits, 'avg_ms': avg_ms, 'max_ms': max_ms}
+            for shape, sql, plan, count, cache_hits, avg_ms, max_ms in rows
+        ]
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_query_log(path=DEFAULT_LOG_PATH):
+    """Process-wide log instance (module state survives Streamlit reruns)"""
+    global _log
+    with _log_lock:
+        if _log is None:
+            _log = QueryLog(path)
+        return _log
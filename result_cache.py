@@ -0,0 +1,288 @@
+"""In-process cache of result pages for generated SQL.
+
+Popular questions map to the same SQL, so the first page of their result
+is kept in memory and served until the database changes. Each entry is
+keyed on the database file, the SQL text (whitespace outside string
+literals collapsed) and the page window. It is stamped with a database
+version made of the catalog's ``PRAGMA schema_version`` / ``data_version``
+plus the file's identity and mtime. Any commit, from this process or
+another one, makes older entries stale.
+
+Memory use is accounted per entry and bounded (LRU). Pages bigger than the
+spill threshold are written to Parquet files in a spill directory with
+their own disk budget, instead of pushing many small entries out of memory.
+
+Pages are kept as row tuples (``get``/``put``, for the API and batch
+callers) or as Arrow tables (``get_table``/``put_table``, for the viewer);
+the two are keyed apart and share the budgets. Arrow pages are accounted at
+their buffer size and spilled as they are.
+A memory budget of 0 (``NL2SQL_RESULT_CACHE_MB=0``) disables the cache.
+"""
+import atexit
+import os
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+from schema_catalog import get_catalog
+from sql_guard import strip_markdown
+from telemetry import value_bytes
+
+MEMORY_BUDGET_BYTES = int(float(os.getenv("NL2SQL_RESULT_CACHE_MB", "64")) * 1024 * 1024)
+SPILL_THRESHOLD_BYTES = int(float(os.getenv("NL2SQL_RESULT_SPILL_MB", "4")) * 1024 * 1024)
+DISK_BUDGET_BYTES = int(float(os.getenv("NL2SQL_RESULT_DISK_MB", "512")) * 1024 * 1024)
+DEFAULT_SPILL_DIR = Path(tempfile.gettempdir()) / "nl2sql_result_cache"
+
+# Rough CPython overhead of a row tuple and of each value slot in it
+ROW_OVERHEAD_BYTES = 56
+VALUE_OVERHEAD_BYTES = 24
+
+_SQL_TOKEN_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\s+|[^'\"\s]+")
+
+
+def normalize_sql(sql):
+    """Collapse whitespace outside string literals and drop the trailing semicolon"""
+    parts = []
+    for token in _SQL_TOKEN_RE.findall(strip_markdown(sql)):
+        parts.append(" " if token.isspace() else token)
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def database_version(db_path):
+    """Token that changes whenever the database's schema or data does"""
+    schema_version, data_version = get_catalog(db_path).refresh()
+    path = Path(db_path)
+    stat = path.stat()
+    wal = path.with_name(path.name + "-wal")
+    wal_mtime = wal.stat().st_mtime_ns if wal.exists() else 0
+    return (schema_version, data_version, stat.st_ino, stat.st_size, stat.st_mtime_ns, wal_mtime)
+
+
+def page_bytes(columns, rows):
+    """Approximate resident size of a result page"""
+    width = max(len(columns), 1)
+    return value_bytes(rows) + len(rows) * (ROW_OVERHEAD_BYTES + width * VALUE_OVERHEAD_BYTES)
+
+
+class _Entry:
+    __slots__ = ("version", "columns", "data", "has_more", "size", "path")
+
+    def __init__(self, version, columns, data, has_more, size, path=None):
+        self.version = version
+        self.columns = columns
+        self.data = data  # row tuples or an Arrow table; None when the page lives in a spill file
+        self.has_more = has_more
+        self.size = size
+        self.path = path
+
+
+class ResultCache:
+    """Bounded LRU of result pages in memory, with large pages spilled to Parquet"""
+
+    def __init__(self, memory_budget=MEMORY_BUDGET_BYTES, spill_threshold=SPILL_THRESHOLD_BYTES,
+                 disk_budget=DISK_BUDGET_BYTES, spill_dir=DEFAULT_SPILL_DIR):
+        self.memory_budget = memory_budget
+        self.enabled = memory_budget > 0
+        self.spill_threshold = spill_threshold
+        self.disk_budget = disk_budget
+        self.spill_dir = Path(spill_dir) / uuid.uuid4().hex[:8]  # one directory per process
+        self._memory = OrderedDict()
+        self._disk = OrderedDict()
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'spilled': 0, 'evicted': 0}
+
+    @staticmethod
+    def key(db_path, sql, offset, limit, columnar=False):
+        key = (str(Path(db_path).resolve()), normalize_sql(sql), offset, limit)
+        return key + ("arrow",) if columnar else key
+
+    def _lookup(self, key, version):
+        """The current entry for ``key``, counted as a hit, else None (stale entries are dropped)"""
+        with self._lock:
+            tier = self._memory if key in self._memory else self._disk if key in self._disk else None
+            if tier is None:
+                self.stats['misses'] += 1
+                return None
+            entry = tier[key]
+            if entry.version != version:
+                self._drop(key)
+                self.stats['stale'] += 1
+                self.stats['misses'] += 1
+                return None
+            tier.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry
+
+    def _read(self, key, entry, read_spill):
+        if entry.data is not None:
+            return entry.data
+        try:
+            return read_spill(entry.path)
+        except OSError:
+            with self._lock:
+                self._drop(key)
+            return None
+
+    def get(self, db_path, sql, offset, limit, version=None):
+        """(columns, rows, has_more) for a cached page that is still current, else None"""
+        if not self.enabled:
+            return None
+        key = self.key(db_path, sql, offset, limit)
+        entry = self._lookup(key, version or database_version(db_path))
+        rows = None if entry is None else self._read(key, entry, self._read_spill)
+        return None if rows is None else (entry.columns, list(rows), entry.has_more)
+
+    def get_table(self, db_path, sql, offset, limit, version=None):
+        """(Arrow table, has_more) for a cached columnar page that is still current, else None"""
+        if not self.enabled:
+            return None
+        key = self.key(db_path, sql, offset, limit, columnar=True)
+        entry = self._lookup(key, version or database_version(db_path))
+        table = None if entry is None else self._read(key, entry, self._read_table_spill)
+        return None if table is None else (table, entry.has_more)
+
+    def put(self, db_path, sql, offset, limit, columns, rows, has_more, version=None):
+        """Store a page computed at ``version`` (taken now when omitted); returns where it went"""
+        if not self.enabled:
+            return None
+        return self._store(self.key(db_path, sql, offset, limit), version or database_version(db_path),
+                           columns, tuple(rows), has_more, page_bytes(columns, rows),
+                           lambda: self._write_spill(columns, rows))
+
+    def put_table(self, db_path, sql, offset, limit, table, has_more, version=None):
+        """Store a columnar page (an Arrow table, kept as is); returns where it went"""
+        if not self.enabled:
+            return None
+        return self._store(self.key(db_path, sql, offset, limit, columnar=True),
+                           version or database_version(db_path), table.column_names, table, has_more,
+                           table.nbytes, lambda: self._write_table_spill(table))
+
+    def _store(self, key, version, columns, data, has_more, size, write_spill):
+        if size <= self.spill_threshold and size <= self.memory_budget:
+            with self._lock:
+                self._drop(key)
+                self._memory[key] = _Entry(version, columns, data, has_more, size)
+                self.memory_bytes += size
+                self._evict(self._memory, 'memory_bytes', self.memory_budget)
+            return 'memory'
+        if not len(data) or size > self.disk_budget:
+            return None
+        try:
+            path, file_size = write_spill()
+        except (OSError, ImportError, ValueError, TypeError):
+            return None
+        with self._lock:
+            self._drop(key)
+            self._disk[key] = _Entry(version, columns, None, has_more, file_size, path)
+            self.disk_bytes += file_size
+            self.stats['spilled'] += 1
+            self._evict(self._disk, 'disk_bytes', self.disk_budget)
+        return 'disk'
+
+    def _evict(self, tier, counter, budget):
+        while getattr(self, counter) > budget and tier:
+            key = next(iter(tier))
+            self._drop(key)
+            self.stats['evicted'] += 1
+
+    def _drop(self, key):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self.memory_bytes -= entry.size
+        entry = self._disk.pop(key, None)
+        if entry is not None:
+            self.disk_bytes -= entry.size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _write_spill(self, columns, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        names, arrays = [], []
+        for i, values in enumerate(zip(*rows)):
+            types = sorted({type(value) for value in values if value is not None}, key=lambda t: t.__name__)
+            if len(types) <= 1:
+                names.append(f"c{i}")
+                arrays.append(pa.array(values))
+                continue
+            # SQLite columns can mix types (NUMERIC affinity stores 95.0 as 95); one child column per
+            # type keeps every value's exact Python type through the round trip
+            for value_type in types:
+                names.append(f"c{i}.{value_type.__name__}")
+                arrays.append(pa.array([value if type(value) is value_type else None for value in values]))
+        path = self.spill_dir / f"{uuid.uuid4().hex}.parquet"
+        pq.write_table(pa.Table.from_arrays(arrays, names=names), path, compression="zstd")
+        return path, path.stat().st_size
+
+    def _write_table_spill(self, table):
+        import pyarrow.parquet as pq
+
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        path = self.spill_dir / f"{uuid.uuid4().hex}.parquet"
+        pq.write_table(table, path, compression="zstd")
+        return path, path.stat().st_size
+
+    @staticmethod
+    def _read_table_spill(path):
+        import pyarrow.parquet as pq
+
+        return pq.read_table(path)
+
+    @staticmethod
+    def _read_spill(path):
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path)
+        children = OrderedDict()
+        for name, column in zip(table.column_names, table.columns):
+            children.setdefault(name.split(".")[0], []).append(column.to_pylist())
+        columns = []
+        for parts in children.values():
+            if len(parts) == 1:
+                columns.append(parts[0])
+            else:
+                columns.append([next((v for v in values if v is not None), None) for values in zip(*parts)])
+        return list(zip(*columns))
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._memory) + list(self._disk):
+                self._drop(key)
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def summary(self):
+        with self._lock:
+            return dict(self.stats, memory_entries=len(self._memory), disk_entries=len(self._disk),
+                        memory_bytes=self.memory_bytes, disk_bytes=self.disk_bytes)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Process-wide result cache (module state survives Streamlit reruns)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+            atexit.register(_cache.clear)  # spill files are only valid for this process
+        return _cache
+
+
+def set_result_cache(cache):
+    """Replace the process-wide result cache (benchmarks turn it off); returns the old one"""
+    global _cache
+    with _cache_lock:
+        previous, _cache = _cache, cache
+        return previous
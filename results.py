@@ -0,0 +1,396 @@
+"""Streaming result access for generated queries.
+
+Rows are pulled from the cursor with ``fetchmany`` so neither the page
+shown in the UI nor a full-result download ever materializes the whole
+result set. Column names come from ``cursor.description``.
+
+``read_sql_arrow`` and ``iter_arrow_batches`` turn each fetched batch into
+typed Arrow column arrays straight away (DuckDB hands over Arrow record
+batches itself), so large results never exist as one list of row tuples;
+``arrow_table`` does the same for a page of rows. The viewer reads every
+page this way (its query jobs included), keeps the tables and renders them
+without going through pandas. Both readers serve pages from the result
+cache, each in its own format: row pages for the API and batch callers,
+Arrow pages for the viewer.
+"""
+import csv
+import io
+import os
+import sqlite3
+import tempfile
+import time
+from collections import namedtuple
+
+from db_engine import get_engine
+from query_log import get_query_log
+from result_cache import database_version, get_result_cache
+from schema_catalog import get_catalog
+from sql_guard import EXPORT_TIMEOUT_SECONDS, guarded_cursor
+from telemetry import span, value_bytes
+
+FETCH_BATCH_SIZE = 500
+ARROW_BATCH_SIZE = 10000
+RESULT_PAGE_SIZE = int(os.getenv("NL2SQL_PAGE_SIZE", "1000"))
+RESULT_ROW_CAP = int(os.getenv("NL2SQL_MAX_ROWS", "10000"))
+SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+ResultPage = namedtuple("ResultPage", ["columns", "rows", "has_more", "error"])
+ArrowPage = namedtuple("ArrowPage", ["table", "has_more", "error"])
+
+
+def _columns(cursor):
+    """Column names from the cursor, suffixed where a join repeats a name (STUDENT_ID, STUDENT_ID_2)"""
+    names, seen = [], {}
+    for col in cursor.description or []:
+        count = seen[col[0]] = seen.get(col[0], 0) + 1
+        names.append(col[0] if count == 1 else f"{col[0]}_{count}")
+    return names
+
+
+def iter_batches(cursor, batch_size=FETCH_BATCH_SIZE):
+    """Yield lists of rows from an open cursor until it is exhausted"""
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            return
+        yield batch
+
+
+def _record_cache_hit(db, sql, started):
+    # The workload log sees executions through sql_guard; hits are demand for the query all the same
+    get_query_log().record(db, sql, [], (time.perf_counter() - started) * 1000, cached=True)
+
+
+def read_sql_page(sql, db, offset=0, limit=RESULT_PAGE_SIZE, batch_size=FETCH_BATCH_SIZE, monitor=None):
+    """Fetch rows [offset, offset + limit) of a query, plus whether more rows follow
+
+    Pages are served from the result cache while the database is unchanged
+    (and logged to the workload as cached). ``monitor`` is passed to the
+    guard (see query_jobs).
+    """
+    started = time.perf_counter()
+    with span("execute", offset=offset) as attributes:
+        cache = get_result_cache()
+        version, cached = None, None
+        if cache.enabled:
+            try:
+                # Taken before running the query, so a concurrent commit can only make the entry stale
+                version = database_version(db)
+                cached = cache.get(db, sql, offset, limit, version)
+            except (OSError, sqlite3.Error):
+                pass
+        if cached:
+            page = ResultPage(*cached, None)
+            attributes['outcome'] = 'cache_hit'
+            _record_cache_hit(db, sql, started)
+        else:
+            page = _read_page(sql, db, offset, limit, batch_size, monitor)
+            attributes['outcome'] = 'executed'
+            if version and not page.error:
+                attributes['cached_in'] = cache.put(db, sql, offset, limit, page.columns, page.rows,
+                                                    page.has_more, version)
+        attributes.update(rows=len(page.rows), bytes=value_bytes(page.rows), has_more=page.has_more)
+        if page.error:
+            attributes['error'] = page.error
+        return page
+
+
+def _read_page(sql, db, offset, limit, batch_size, monitor=None):
+    try:
+        with guarded_cursor(get_engine(db), sql, monitor=monitor) as cur:
+            columns = _columns(cur)
+            # Skip earlier pages batch by batch instead of holding them
+            skipped = 0
+            while skipped < offset:
+                batch = cur.fetchmany(min(batch_size, offset - skipped))
+                if not batch:
+                    return ResultPage(columns, [], False, None)
+                skipped += len(batch)
+            rows = []
+            while len(rows) < limit:
+                batch = cur.fetchmany(min(batch_size, limit - len(rows)))
+                if not batch:
+                    return ResultPage(columns, rows, False, None)
+                rows.extend(batch)
+            has_more = cur.fetchone() is not None
+            return ResultPage(columns, rows, has_more, None)
+    except Exception as e:
+        return ResultPage([], [], False, str(e))
+
+
+def _column_array(values):
+    """Typed Arrow array of one column's values (a column mixing types becomes text)"""
+    import pyarrow as pa
+
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OverflowError):
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+def _common_type(types):
+    import pyarrow as pa
+
+    types = {t for t in types if not pa.types.is_null(t)}
+    if len(types) <= 1:
+        return types.pop() if types else pa.null()
+    # NUMERIC affinity stores 95.0 as 95, so a column can arrive as int64 in one batch and double in the next
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in types):
+        return pa.float64()
+    return pa.string()
+
+
+def _chunked_column(chunks):
+    import pyarrow as pa
+
+    target = _common_type(chunk.type for chunk in chunks)
+    converted = []
+    for chunk in chunks:
+        if chunk.type != target:
+            try:
+                chunk = chunk.cast(target)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                chunk = pa.array([None if v is None else str(v) for v in chunk.to_pylist()], type=target)
+        converted.append(chunk)
+    return pa.chunked_array(converted, type=target)
+
+
+def _table(columns, chunks):
+    """Table from per-column lists of array chunks, unifying each column's type"""
+    import pyarrow as pa
+
+    return pa.Table.from_arrays([_chunked_column(column_chunks) for column_chunks in chunks], names=columns)
+
+
+def arrow_table(columns, rows):
+    """Arrow table of a page of row tuples, built column by column"""
+    import pyarrow as pa
+
+    if not rows:
+        return pa.table({name: pa.array([], type=pa.null()) for name in columns}) if columns else pa.table({})
+    return _table(columns, [[_column_array(values)] for values in zip(*rows)])
+
+
+def concat_arrow(tables):
+    """Append tables with the same columns (whose types may differ, as in arrow_table) without copying"""
+    tables = [table for table in tables if table is not None]
+    columns = tables[0].column_names
+    return _table(columns, [[chunk for table in tables for chunk in table.column(i).chunks]
+                            for i in range(len(columns))])
+
+
+def iter_arrow_batches(cursor, limit=None, batch_size=ARROW_BATCH_SIZE, offset=0):
+    """Yield one list of typed column arrays per fetched batch, for up to ``limit`` rows after ``offset``
+
+    Only one batch of row tuples exists at a time. DuckDB cursors are read
+    as Arrow record batches without building tuples at all.
+    """
+    if hasattr(cursor, "fetch_record_batch"):
+        # fetchmany would buffer a whole DuckDB chunk, so the offset is skipped in the record batches too
+        reader = cursor.fetch_record_batch(batch_size)
+        fetched = 0
+        for batch in reader:
+            if offset:
+                skip = min(offset, batch.num_rows)
+                offset -= skip
+                batch = batch.slice(skip)
+            if limit is not None and fetched + batch.num_rows > limit:
+                batch = batch.slice(0, limit - fetched)
+            fetched += batch.num_rows
+            if batch.num_rows:
+                yield list(batch.columns)
+            if limit is not None and fetched >= limit:
+                return
+        return
+    while offset > 0:
+        skipped = len(cursor.fetchmany(min(batch_size, offset)))
+        if not skipped:
+            return
+        offset -= skipped
+    fetched = 0
+    while limit is None or fetched < limit:
+        batch = cursor.fetchmany(batch_size if limit is None else min(batch_size, limit - fetched))
+        if not batch:
+            return
+        fetched += len(batch)
+        yield [_column_array(values) for values in zip(*batch)]
+
+
+def read_sql_arrow(sql, db, offset=0, limit=RESULT_PAGE_SIZE, batch_size=ARROW_BATCH_SIZE, monitor=None):
+    """Like read_sql_page, but the rows come back as an Arrow table (ArrowPage)"""
+    started = time.perf_counter()
+    with span("execute", offset=offset, columnar=True) as attributes:
+        cache = get_result_cache()
+        version, cached = None, None
+        if cache.enabled:
+            try:
+                version = database_version(db)
+                cached = cache.get_table(db, sql, offset, limit, version)
+            except (OSError, sqlite3.Error):
+                pass
+        if cached:
+            page = ArrowPage(*cached, None)
+            attributes['outcome'] = 'cache_hit'
+            _record_cache_hit(db, sql, started)
+        else:
+            page = _read_arrow(sql, db, offset, limit, batch_size, monitor)
+            attributes['outcome'] = 'executed'
+            if version and not page.error:
+                attributes['cached_in'] = cache.put_table(db, sql, offset, limit, page.table, page.has_more,
+                                                          version)
+        if page.error:
+            attributes['error'] = page.error
+        else:
+            attributes.update(rows=page.table.num_rows, bytes=page.table.nbytes, has_more=page.has_more)
+        return page
+
+
+def as_arrow_page(page):
+    """ArrowPage of a ResultPage (pages that went through approximate.finish or sql_repair)"""
+    if isinstance(page, ArrowPage):
+        return page
+    return ArrowPage(None if page.error else arrow_table(page.columns, page.rows), page.has_more, page.error)
+
+
+def _read_arrow(sql, db, offset, limit, batch_size, monitor=None):
+    try:
+        with guarded_cursor(get_engine(db), sql, monitor=monitor) as cur:
+            columns = _columns(cur)
+            chunks = [[] for _ in columns]
+            fetched = 0
+            for arrays in iter_arrow_batches(cur, limit + 1, batch_size, offset):
+                for column_chunks, array in zip(chunks, arrays):
+                    column_chunks.append(array)
+                fetched += len(arrays[0])
+            table = arrow_table(columns, []) if not fetched else _table(columns, chunks)
+            # One row past the limit was read to learn whether more follow
+            return ArrowPage(table.slice(0, limit), fetched > limit, None)
+    except Exception as e:
+        return ArrowPage(None, False, str(e))
+
+
+def export_csv(sql, db, batch_size=FETCH_BATCH_SIZE):
+    """Stream the full result into a spooled temporary CSV file (rewound, binary)"""
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    with span("export", format="csv") as attributes, \
+            guarded_cursor(get_engine(db), sql, timeout=EXPORT_TIMEOUT_SECONDS) as cur:
+        writer.writerow(_columns(cur))
+        rows = 0
+        for batch in iter_batches(cur, batch_size):
+            writer.writerows(batch)
+            rows += len(batch)
+        text.flush()
+        attributes.update(rows=rows, bytes=out.tell())
+    text.detach()
+    out.seek(0)
+    return out
+
+
+def _arrow_column(name, values, arrow_type=None):
+    import pyarrow as pa
+
+    try:
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+        # SQLite columns are dynamically typed; mixed columns become text
+        if arrow_type is None or pa.types.is_string(arrow_type):
+            return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+        raise ValueError(f"Column {name} mixes value types; download it as CSV instead")
+
+
+class _Widen(Exception):
+    """A column the Parquet schema typed as integer turned out to hold reals"""
+
+    def __init__(self, column):
+        super().__init__(column)
+        self.column = column
+
+
+def _numeric_affinity_columns(db):
+    """Upper-cased names of catalog columns with NUMERIC affinity (DECIMAL(10,2), NUMERIC...)
+
+    SQLite stores the whole values of such columns as integers and the rest
+    as reals, so one batch of GPA can be all int64 and the next double.
+    """
+    if get_engine(db).backend != "sqlite":
+        return set()
+    names = set()
+    for info in get_catalog(db).table_structure().values():
+        for col in info['columns']:
+            declared = (col[2] or "").upper()
+            if declared and not any(marker in declared for marker in
+                                    ("INT", "CHAR", "CLOB", "TEXT", "BLOB", "REAL", "FLOA", "DOUB")):
+                names.add(col[1].upper())
+    return names
+
+
+def _conform(array, field):
+    """``array`` as the type the Parquet schema fixed for its column"""
+    import pyarrow as pa
+
+    if array.type == field.type:
+        return array
+    if pa.types.is_integer(field.type) and pa.types.is_floating(array.type):
+        raise _Widen(field.name)
+    try:
+        return array.cast(field.type)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return _arrow_column(field.name, array.to_pylist(), field.type)
+
+
+def export_parquet(sql, db, batch_size=FETCH_BATCH_SIZE * 20):
+    """Stream the full result into a spooled temporary Parquet file, one row group per batch
+
+    The first batch fixes the column types. Integer columns are widened to
+    float64 as in the viewer (``_common_type``): up front for columns the
+    catalog declares NUMERIC, and by restarting the export for any other
+    column that turns out to mix integers and reals.
+    """
+    widened = _numeric_affinity_columns(db)
+    with span("export", format="parquet") as attributes:
+        while True:
+            try:
+                out, rows = _write_parquet(sql, db, batch_size, widened)
+                break
+            except _Widen as e:
+                widened.add(e.column.upper())
+                attributes['restarts'] = attributes.get('restarts', 0) + 1
+        attributes.update(rows=rows, bytes=out.tell())
+    out.seek(0)
+    return out
+
+
+def _write_parquet(sql, db, batch_size, widened):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    writer = None
+    try:
+        with guarded_cursor(get_engine(db), sql, timeout=EXPORT_TIMEOUT_SECONDS) as cur:
+            columns = _columns(cur)
+            rows = 0
+            for arrays in iter_arrow_batches(cur, batch_size=batch_size):
+                rows += len(arrays[0])
+                if writer is None:
+                    types = [pa.float64() if name.upper() in widened and (
+                                 pa.types.is_integer(arr.type) or pa.types.is_null(arr.type))
+                             # All-NULL columns in the first batch carry no type; store them as text
+                             else pa.string() if pa.types.is_null(arr.type) else arr.type
+                             for name, arr in zip(columns, arrays)]
+                    schema = pa.schema([pa.field(name, arrow_type) for name, arrow_type in zip(columns, types)])
+                    writer = pq.ParquetWriter(out, schema)
+                arrays = [_conform(arr, field) for arr, field in zip(arrays, schema)]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            if writer is None:
+                schema = pa.schema([pa.field(name, pa.string()) for name in columns])
+                writer = pq.ParquetWriter(out, schema)
+            writer.close()
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        out.close()
+        raise
+    return out, rows
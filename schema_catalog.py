@@ -0,0 +1,136 @@
+"""Process-wide schema catalog.
+
+Table metadata (columns, foreign keys, indexes, row counts) is introspected
+in a single pass and reused until SQLite reports a change:
+
+- ``PRAGMA schema_version`` changes -> everything is re-introspected
+- ``PRAGMA data_version`` changes   -> only row counts are refreshed
+
+Row counts come from ``sqlite_stat1`` (written by ANALYZE) when it covers
+a table, so large tables are not scanned with COUNT(*) on page load.
+
+DuckDB files get a DuckDBCatalog (duckdb_backend.py) with the same
+interface and table_structure shape.
+"""
+import sqlite3
+import threading
+from pathlib import Path
+
+from backends import backend_for
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SchemaCatalog:
+    """Cached metadata for one SQLite database file"""
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self._uri = f"file:{Path(self.db_path).resolve().as_posix()}?mode=ro"
+        self._lock = threading.Lock()
+        self._conn = None
+        self._schema_version = None
+        self._data_version = None
+        self._tables = {}
+        self._relationships = []
+
+    def _connection(self):
+        if self._conn is None:
+            # data_version is only comparable on the same connection, so the catalog keeps its own
+            self._conn = sqlite3.connect(self._uri, uri=True, check_same_thread=False)
+        return self._conn
+
+    def _load_schema(self, conn):
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table';")]
+        structure = {}
+        relationships = []
+        for table in tables:
+            quoted = _quote(table)
+            foreign_keys = conn.execute(f"PRAGMA foreign_key_list({quoted});").fetchall()
+            structure[table] = {
+                'columns': conn.execute(f"PRAGMA table_info({quoted});").fetchall(),
+                'foreign_keys': foreign_keys,
+                'indexes': conn.execute(f"PRAGMA index_list({quoted});").fetchall(),
+                'row_count': 0,
+                'row_count_exact': True
+            }
+            for fk in foreign_keys:
+                relationships.append({
+                    'from_table': table,
+                    'from_column': fk[3],
+                    'to_table': fk[2],
+                    'to_column': fk[4]
+                })
+        self._tables = structure
+        self._relationships = relationships
+
+    def _load_row_counts(self, conn):
+        estimates = {}
+        has_stats = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='sqlite_stat1';"
+        ).fetchone()
+        if has_stats:
+            for tbl, stat in conn.execute("SELECT tbl, stat FROM sqlite_stat1;"):
+                try:
+                    rows = int(str(stat).split()[0])
+                except (ValueError, IndexError):
+                    continue
+                estimates[tbl] = max(rows, estimates.get(tbl, 0))
+        for table, info in self._tables.items():
+            if table in estimates:
+                info['row_count'] = estimates[table]
+                info['row_count_exact'] = False
+            else:
+                info['row_count'] = conn.execute(f"SELECT COUNT(*) FROM {_quote(table)};").fetchone()[0]
+                info['row_count_exact'] = True
+
+    def refresh(self):
+        """Re-introspect whatever changed since the last call; returns (schema_version, data_version)"""
+        with self._lock:
+            conn = self._connection()
+            schema_version = conn.execute("PRAGMA schema_version;").fetchone()[0]
+            data_version = conn.execute("PRAGMA data_version;").fetchone()[0]
+            if schema_version != self._schema_version:
+                self._load_schema(conn)
+                self._load_row_counts(conn)
+            elif data_version != self._data_version:
+                self._load_row_counts(conn)
+            self._schema_version = schema_version
+            self._data_version = data_version
+            return schema_version, data_version
+
+    def table_structure(self):
+        """Same shape as app.get_table_structure: {table: {columns, foreign_keys, indexes, row_count}}"""
+        self.refresh()
+        return self._tables
+
+    def relationships(self):
+        """Foreign key edges as dicts with from_table/from_column/to_table/to_column"""
+        self.refresh()
+        return self._relationships
+
+    @property
+    def version(self):
+        """(schema_version, data_version) as of the last refresh"""
+        return self._schema_version, self._data_version
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(db_path="student.db"):
+    """Process-wide catalog for ``db_path`` (module state survives Streamlit reruns)"""
+    key = str(Path(db_path).resolve())
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            if backend_for(db_path) == "duckdb":
+                from duckdb_backend import DuckDBCatalog
+
+                catalog = _catalogs[key] = DuckDBCatalog(db_path)
+            else:
+                catalog = _catalogs[key] = SchemaCatalog(db_path)
+        return catalog
@@ -1,19 +1,49 @@
+"""Creates the STUDENT database and fills it with sample records.
 
+    python sql.py                                            # the 15-student sample database
+    python sql.py --students 5_000_000 --courses 20_000 --seed 7 --db big.db
+    python sql.py --duckdb student.duckdb                     # plus a DuckDB copy
+    python sql.py --no-summaries                              # without the aggregate tables
+    python sql.py --no-samples                                # without the approximate-mode samples
 
+The hand-written rows below always come first, so the few-shot examples keep
+working; --students / --courses / --instructors add generated rows after them.
+Rows are generated with numpy in batches and streamed into SQLite with
+``executemany``, one transaction per table, with journaling and fsync turned
+off for the load (the file is rebuilt from scratch, so a crash only means
+running it again). Secondary indexes are built after the data is in place,
+then the summary tables and triggers from summaries.py and the random
+samples of large tables from approximate.py.
+"""
+import argparse
 import sqlite3
-from datetime import datetime, timedelta
-import random
+import time
+
+import numpy as np
+
+import approximate
+import summaries
+
+BATCH_SIZE = 100_000
+COURSES_PER_STUDENT = (3, 5)
 
-## Connect to SQLite
-connection = sqlite3.connect("student.db")
-cursor = connection.cursor()
+LOAD_PRAGMAS = (
+    "PRAGMA journal_mode=OFF;",
+    "PRAGMA synchronous=OFF;",
+    "PRAGMA locking_mode=EXCLUSIVE;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA cache_size=-262144;",  # 256 MiB, mostly for the index builds
+)
 
-## Drop existing tables if they exist (for fresh start)
-cursor.execute("DROP TABLE IF EXISTS ENROLLMENTS")
-cursor.execute("DROP TABLE IF EXISTS COURSES")
-cursor.execute("DROP TABLE IF EXISTS INSTRUCTORS")
-cursor.execute("DROP TABLE IF EXISTS DEPARTMENTS")
-cursor.execute("DROP TABLE IF EXISTS STUDENT")
+## Foreign-key columns, indexed once the tables are loaded
+INDEXES = (
+    ("INSTRUCTORS", "DEPT_ID"),
+    ("COURSES", "DEPT_ID"),
+    ("COURSES", "INSTRUCTOR_ID"),
+    ("STUDENT", "DEPT_ID"),
+    ("ENROLLMENTS", "STUDENT_ID"),
+    ("ENROLLMENTS", "COURSE_ID"),
+)
 
 ## Create DEPARTMENTS table
 departments_table = """
@@ -25,7 +55,6 @@ CREATE TABLE IF NOT EXISTS DEPARTMENTS (
     BUDGET DECIMAL(10,2)
 );
 """
-cursor.execute(departments_table)
 
 ## Create INSTRUCTORS table
 instructors_table = """
@@ -40,7 +69,6 @@ CREATE TABLE IF NOT EXISTS INSTRUCTORS (
     FOREIGN KEY (DEPT_ID) REFERENCES DEPARTMENTS(DEPT_ID)
 );
 """
-cursor.execute(instructors_table)
 
 ## Create COURSES table
 courses_table = """
@@ -58,7 +86,6 @@ CREATE TABLE IF NOT EXISTS COURSES (
     FOREIGN KEY (INSTRUCTOR_ID) REFERENCES INSTRUCTORS(INSTRUCTOR_ID)
 );
 """
-cursor.execute(courses_table)
 
 ## Create STUDENT table (enhanced)
 student_table = """
@@ -79,7 +106,6 @@ CREATE TABLE IF NOT EXISTS STUDENT (
     FOREIGN KEY (DEPT_ID) REFERENCES DEPARTMENTS(DEPT_ID)
 );
 """
-cursor.execute(student_table)
 
 ## Create ENROLLMENTS table (many-to-many relationship)
 enrollments_table = """
@@ -96,9 +122,8 @@ CREATE TABLE IF NOT EXISTS ENROLLMENTS (
     FOREIGN KEY (COURSE_ID) REFERENCES COURSES(COURSE_ID)
 );
 """
-cursor.execute(enrollments_table)
 
-## Insert sample data into DEPARTMENTS
+## Hand-written sample rows (DEPARTMENTS)
 departments_data = [
     ('Computer Science', 'Dr. Sarah Johnson', 'Tech Building', 500000.00),
     ('Data Science', 'Dr. Michael Chen', 'Analytics Center', 450000.00),
@@ -108,10 +133,8 @@ departments_data = [
     ('Web Development', 'Dr. Lisa Brown', 'Innovation Hub', 300000.00)
 ]
 
-cursor.executemany('''INSERT INTO DEPARTMENTS (DEPT_NAME, DEPT_HEAD, BUILDING, BUDGET) 
-                     VALUES (?, ?, ?, ?)''', departments_data)
 
-## Insert sample data into INSTRUCTORS
+## Hand-written sample rows (INSTRUCTORS)
 instructors_data = [
     ('Dr. Sarah Johnson', 1, 'sarah.johnson@university.edu', '+1-555-0101', '2020-01-15', 95000.00),
     ('Dr. Michael Chen', 2, 'michael.chen@university.edu', '+1-555-0102', '2019-08-20', 98000.00),
@@ -125,10 +148,8 @@ instructors_data = [
     ('Prof. Anna Rodriguez', 4, 'anna.rodriguez@university.edu', '+1-555-0110', '2019-12-03', 88000.00)
 ]
 
-cursor.executemany('''INSERT INTO INSTRUCTORS (INSTRUCTOR_NAME, DEPT_ID, EMAIL, PHONE, HIRE_DATE, SALARY) 
-                     VALUES (?, ?, ?, ?, ?, ?)''', instructors_data)
 
-## Insert sample data into COURSES
+## Hand-written sample rows (COURSES)
 courses_data = [
     ('Python Programming', 'CS101', 3, 1, 1, 'Fall', 2024, 30),
     ('Machine Learning Fundamentals', 'DS201', 4, 2, 2, 'Spring', 2024, 25),
@@ -147,10 +168,8 @@ courses_data = [
     ('Big Data Analytics', 'DS301', 4, 2, 2, 'Fall', 2024, 20)
 ]
 
-cursor.executemany('''INSERT INTO COURSES (COURSE_NAME, COURSE_CODE, CREDITS, DEPT_ID, INSTRUCTOR_ID, SEMESTER, YEAR, MAX_STUDENTS) 
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', courses_data)
 
-## Insert sample data into STUDENT
+## Hand-written sample rows (STUDENT)
 students_data = [
     ('Krish Naik', 'krish.naik@student.edu', '+1-555-1001', '123 Main St, City, State', '2001-05-15', '2023-08-20', 'Data Science', 'A', 3, 3.8, 2, 'Active'),
     ('Sudhanshu Kumar', 'sudhanshu@student.edu', '+1-555-1002', '456 Oak Ave, City, State', '2000-12-10', '2023-08-20', 'Data Science', 'B', 3, 3.9, 2, 'Active'),
@@ -169,111 +188,296 @@ students_data = [
     ('Kevin Brown', 'kevin.b@student.edu', '+1-555-1015', '753 Dogwood Rd, City, State', '2000-11-16', '2023-08-20', 'Web Development', 'A', 2, 3.2, 6, 'Active')
 ]
 
-cursor.executemany('''INSERT INTO STUDENT (NAME, EMAIL, PHONE, ADDRESS, DATE_OF_BIRTH, ADMISSION_DATE, CLASS, SECTION, SEMESTER, GPA, DEPT_ID, STATUS) 
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', students_data)
-
-## Insert sample data into ENROLLMENTS
-enrollments_data = []
-# Generate realistic enrollments for each student
-for student_id in range(1, 16):  # 15 students
-    # Each student enrolls in 3-5 courses
-    num_courses = random.randint(3, 5)
-    enrolled_courses = random.sample(range(1, 16), num_courses)  # 15 courses available
-    
-    for course_id in enrolled_courses:
-        enrollment_date = '2024-01-15'
-        marks = random.randint(35, 100)
-        # Convert marks to letter grade
-        if marks >= 90:
-            grade = 'A'
-        elif marks >= 80:
-            grade = 'B'
-        elif marks >= 70:
-            grade = 'C'
-        elif marks >= 60:
-            grade = 'D'
-        else:
-            grade = 'F'
-        
-        attendance = round(random.uniform(65.0, 98.0), 2)
-        status = 'Completed' if random.random() > 0.1 else 'Enrolled'
-        
-        enrollments_data.append((student_id, course_id, enrollment_date, grade, marks, attendance, status))
-
-cursor.executemany('''INSERT INTO ENROLLMENTS (STUDENT_ID, COURSE_ID, ENROLLMENT_DATE, GRADE, MARKS, ATTENDANCE_PERCENTAGE, STATUS) 
-                     VALUES (?, ?, ?, ?, ?, ?, ?)''', enrollments_data)
-
-## Display all tables and their data
-print("=== DATABASE CREATED SUCCESSFULLY ===\n")
-
-print("DEPARTMENTS:")
-cursor.execute("SELECT * FROM DEPARTMENTS LIMIT 5")
-for row in cursor.fetchall():
-    print(row)
-
-print("\nINSTRUCTORS:")
-cursor.execute("SELECT * FROM INSTRUCTORS LIMIT 5")
-for row in cursor.fetchall():
-    print(row)
-
-print("\nCOURSES:")
-cursor.execute("SELECT * FROM COURSES LIMIT 5")
-for row in cursor.fetchall():
-    print(row)
-
-print("\nSTUDENTS:")
-cursor.execute("SELECT * FROM STUDENT LIMIT 5")
-for row in cursor.fetchall():
-    print(row)
-
-print("\nENROLLMENTS:")
-cursor.execute("SELECT * FROM ENROLLMENTS LIMIT 5")
-for row in cursor.fetchall():
-    print(row)
-
-print("\n=== SAMPLE COMPLEX QUERIES ===")
-
-print("\n1. Students with their department names:")
-cursor.execute('''
-    SELECT s.NAME, s.CLASS, d.DEPT_NAME, s.GPA 
-    FROM STUDENT s 
-    JOIN DEPARTMENTS d ON s.DEPT_ID = d.DEPT_ID 
-    LIMIT 5
-''')
-for row in cursor.fetchall():
-    print(row)
-
-print("\n2. Course enrollments with student and instructor info:")
-cursor.execute('''
-    SELECT s.NAME as Student, c.COURSE_NAME, i.INSTRUCTOR_NAME, e.MARKS, e.GRADE
-    FROM ENROLLMENTS e
-    JOIN STUDENT s ON e.STUDENT_ID = s.STUDENT_ID
-    JOIN COURSES c ON e.COURSE_ID = c.COURSE_ID
-    JOIN INSTRUCTORS i ON c.INSTRUCTOR_ID = i.INSTRUCTOR_ID
-    LIMIT 5
-''')
-for row in cursor.fetchall():
-    print(row)
-
-print("\n3. Average marks by department:")
-cursor.execute('''
-    SELECT d.DEPT_NAME, AVG(e.MARKS) as Avg_Marks, COUNT(e.MARKS) as Total_Enrollments
-    FROM DEPARTMENTS d
-    JOIN STUDENT s ON d.DEPT_ID = s.DEPT_ID
-    JOIN ENROLLMENTS e ON s.STUDENT_ID = e.STUDENT_ID
-    GROUP BY d.DEPT_NAME
-    ORDER BY Avg_Marks DESC
-''')
-for row in cursor.fetchall():
-    print(row)
-
-## Commit changes and close connection
-connection.commit()
-connection.close()
-
-print("\n✅ Complex database created with:")
-print("• 5 interconnected tables")
-print("• Realistic foreign key relationships")
-print("• 15+ students, 15+ courses, 10+ instructors")
-print("• Sample enrollments with grades and attendance")
-print("• Ready for complex NL2SQL queries!")
\ No newline at end of file
+
+## Vocabulary for generated rows
+FIRST_NAMES = np.array([
+    'Aarav', 'Aisha', 'Ben', 'Chloe', 'Daniel', 'Elena', 'Farhan', 'Grace', 'Hiro', 'Isla',
+    'Jamal', 'Kavya', 'Liam', 'Mei', 'Noah', 'Olivia', 'Priya', 'Quinn', 'Rahul', 'Sofia',
+    'Tariq', 'Uma', 'Victor', 'Wen', 'Xavier', 'Yara', 'Zane', 'Ananya', 'Lucas', 'Nadia',
+])
+LAST_NAMES = np.array([
+    'Anderson', 'Bose', 'Castillo', 'Dubois', 'Evans', 'Fischer', 'Gupta', 'Hughes', 'Ito', 'Jensen',
+    'Khan', 'Lopez', 'Martin', 'Nguyen', 'Okafor', 'Petrov', 'Quinn', 'Rossi', 'Singh', 'Tanaka',
+    'Usman', 'Varga', 'Walsh', 'Xu', 'Yilmaz', 'Zhou', 'Mehta', 'Novak', 'Silva', 'Turner',
+])
+STREETS = np.array(['Main St', 'Oak Ave', 'Pine Rd', 'Elm St', 'Maple Ave', 'Cedar Ln', 'Birch St', 'Willow Rd'])
+DEPT_NAMES = np.array([row[0] for row in departments_data])
+COURSE_PREFIXES = np.array(['CS', 'DS', 'DO', 'CY', 'AI', 'WD'])  # by DEPT_ID
+COURSE_TOPICS = np.array([row[0] for row in courses_data])
+
+
+def _digits(values, width):
+    return np.char.zfill(values.astype(str), width)
+
+
+def _dates(rng, start, days, size):
+    return (np.datetime64(start) + rng.integers(0, days, size=size)).astype(str)
+
+
+def _rows(*columns):
+    """Turn equally long numpy columns into a list of plain Python tuples for executemany"""
+    return list(zip(*(column.tolist() for column in columns)))
+
+
+def generate_instructors(rng, first_id, count):
+    """Instructor rows for INSTRUCTOR_ID first_id .. first_id + count - 1"""
+    first = FIRST_NAMES[rng.integers(0, len(FIRST_NAMES), count)]
+    last = LAST_NAMES[rng.integers(0, len(LAST_NAMES), count)]
+    ids = np.arange(first_id, first_id + count).astype(str)
+    title = np.where(rng.random(count) < 0.5, 'Dr. ', 'Prof. ')
+    name = np.char.add(np.char.add(np.char.add(title, first), ' '), last)
+    email = np.char.add(np.char.add(np.char.add(np.char.add(
+        np.char.lower(first), '.'), np.char.lower(last)), ids), '@university.edu')
+    phone = np.char.add('+1-555-', _digits(rng.integers(0, 10000, count), 4))
+    salary = np.round(rng.uniform(60000, 120000, count), 2)
+    return _rows(name, rng.integers(1, len(departments_data) + 1, count), email, phone,
+                 _dates(rng, '2010-01-01', 15 * 365, count), salary)
+
+
+def generate_courses(rng, first_id, count, instructors):
+    """Course rows for COURSE_ID first_id .. first_id + count - 1 (COURSE_CODE stays unique)"""
+    dept = rng.integers(1, len(departments_data) + 1, count)
+    topic = COURSE_TOPICS[rng.integers(0, len(COURSE_TOPICS), count)]
+    ids = np.arange(first_id, first_id + count)
+    name = np.char.add(np.char.add(topic, ' '), ids.astype(str))
+    code = np.char.add(COURSE_PREFIXES[dept - 1], _digits(ids, 5))
+    semester = np.where(rng.random(count) < 0.5, 'Fall', 'Spring')
+    return _rows(name, code, rng.integers(3, 5, count), dept, rng.integers(1, instructors + 1, count),
+                 semester, rng.integers(2022, 2025, count), rng.integers(15, 41, count))
+
+
+def generate_students(rng, first_id, count):
+    """Student rows for STUDENT_ID first_id .. first_id + count - 1"""
+    first = FIRST_NAMES[rng.integers(0, len(FIRST_NAMES), count)]
+    last = LAST_NAMES[rng.integers(0, len(LAST_NAMES), count)]
+    ids = np.arange(first_id, first_id + count).astype(str)
+    dept = rng.integers(1, len(departments_data) + 1, count)
+    name = np.char.add(np.char.add(first, ' '), last)
+    email = np.char.add(np.char.add(np.char.add(np.char.add(
+        np.char.lower(first), '.'), np.char.lower(last)), ids), '@student.edu')
+    phone = np.char.add('+1-555-', _digits(rng.integers(0, 10000, count), 4))
+    address = np.char.add(np.char.add(np.char.add(
+        rng.integers(1, 1000, count).astype(str), ' '), STREETS[rng.integers(0, len(STREETS), count)]),
+        ', City, State')
+    admission = np.char.add(rng.integers(2020, 2025, count).astype(str), '-08-20')
+    section = np.array(['A', 'B', 'C'])[rng.integers(0, 3, count)]
+    gpa = np.round(rng.uniform(2.0, 4.0, count), 1)
+    status = np.where(rng.random(count) < 0.95, 'Active', 'Inactive')
+    return _rows(name, email, phone, address, _dates(rng, '1998-01-01', 6 * 365, count), admission,
+                 DEPT_NAMES[dept - 1], section, rng.integers(1, 9, count), gpa, dept, status)
+
+
+def generate_enrollments(rng, first_student, count, courses):
+    """Enrollment rows for STUDENT_ID first_student .. first_student + count - 1
+
+    Each student takes COURSES_PER_STUDENT distinct courses; rows whose draw
+    repeats a course are simply redrawn until every row is distinct.
+    """
+    low, high = COURSES_PER_STUDENT
+    width = min(high, courses)
+    picks = rng.integers(1, courses + 1, size=(count, width))
+    while width > 1:
+        ordered = np.sort(picks, axis=1)
+        repeated = (ordered[:, 1:] == ordered[:, :-1]).any(axis=1)
+        if not repeated.any():
+            break
+        picks[repeated] = rng.integers(1, courses + 1, size=(int(repeated.sum()), width))
+    taken = rng.integers(min(low, width), width + 1, count)
+    chosen = np.arange(width) < taken[:, None]
+
+    total = int(taken.sum())
+    student = np.repeat(np.arange(first_student, first_student + count), taken)
+    marks = rng.integers(35, 101, total)
+    grade = np.select([marks >= 90, marks >= 80, marks >= 70, marks >= 60], ['A', 'B', 'C', 'D'], 'F')
+    enrolled = np.array(['2023-08-20', '2024-01-15', '2024-08-20'])[rng.integers(0, 3, total)]
+    attendance = np.round(rng.uniform(65.0, 98.0, total), 2)
+    status = np.where(rng.random(total) > 0.1, 'Completed', 'Enrolled')
+    return _rows(student, picks[chosen], enrolled, grade, marks, attendance, status)
+
+
+def _batched(total, batch_size):
+    """(offset, count) pairs covering range(total) in batch_size steps"""
+    for offset in range(0, total, batch_size):
+        yield offset, min(batch_size, total - offset)
+
+
+def load_table(connection, insert, sample_rows, generate, total, batch_size):
+    """Insert the sample rows, then generated rows up to ``total``, in a single transaction"""
+    connection.execute("BEGIN;")
+    if sample_rows:
+        connection.executemany(insert, sample_rows[:total])
+    for offset, count in _batched(max(total - len(sample_rows), 0), batch_size):
+        connection.executemany(insert, generate(len(sample_rows) + offset + 1, count))
+    connection.execute("COMMIT;")
+
+
+def build_database(db_path="student.db", students=None, courses=None, instructors=None,
+                   seed=None, batch_size=BATCH_SIZE):
+    """Recreate ``db_path`` with the sample rows plus generated ones; returns per-stage seconds"""
+    students = max(students or len(students_data), 1)
+    courses = max(courses or len(courses_data), 1)
+    instructors = max(instructors or max(len(instructors_data), courses // 3), 1)
+    rng = np.random.default_rng(seed)
+    timings = {}
+
+    # Autocommit mode: transactions are opened explicitly per table
+    connection = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        for pragma in LOAD_PRAGMAS:
+            connection.execute(pragma)
+
+        ## Drop existing tables if they exist (for fresh start)
+        approximate.drop(connection)
+        for table in tuple(summaries.SUMMARY_TABLES) + ("ENROLLMENTS", "COURSES", "INSTRUCTORS", "DEPARTMENTS", "STUDENT"):
+            connection.execute(f"DROP TABLE IF EXISTS {table}")
+        for ddl in (departments_table, instructors_table, courses_table, student_table, enrollments_table):
+            connection.execute(ddl)
+
+        stages = (
+            ("DEPARTMENTS", '''INSERT INTO DEPARTMENTS (DEPT_NAME, DEPT_HEAD, BUILDING, BUDGET)
+                     VALUES (?, ?, ?, ?)''', departments_data, None, len(departments_data)),
+            ("INSTRUCTORS", '''INSERT INTO INSTRUCTORS (INSTRUCTOR_NAME, DEPT_ID, EMAIL, PHONE, HIRE_DATE, SALARY)
+                     VALUES (?, ?, ?, ?, ?, ?)''', instructors_data,
+             lambda first, count: generate_instructors(rng, first, count), instructors),
+            ("COURSES", '''INSERT INTO COURSES (COURSE_NAME, COURSE_CODE, CREDITS, DEPT_ID, INSTRUCTOR_ID, SEMESTER, YEAR, MAX_STUDENTS)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+             # Sample courses point at the first ten instructors
+             [row for row in courses_data if row[4] <= instructors],
+             lambda first, count: generate_courses(rng, first, count, instructors), courses),
+            ("STUDENT", '''INSERT INTO STUDENT (NAME, EMAIL, PHONE, ADDRESS, DATE_OF_BIRTH, ADMISSION_DATE, CLASS, SECTION, SEMESTER, GPA, DEPT_ID, STATUS)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', students_data,
+             lambda first, count: generate_students(rng, first, count), students),
+        )
+        for table, insert, sample_rows, generate, total in stages:
+            started = time.perf_counter()
+            load_table(connection, insert, sample_rows, generate, total, batch_size)
+            timings[table] = time.perf_counter() - started
+
+        # Enrollments are generated for every student, sample ones included
+        started = time.perf_counter()
+        load_table(connection, '''INSERT INTO ENROLLMENTS (STUDENT_ID, COURSE_ID, ENROLLMENT_DATE, GRADE, MARKS, ATTENDANCE_PERCENTAGE, STATUS)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)''', [],
+                   lambda first, count: generate_enrollments(rng, first, count, courses),
+                   students, max(batch_size // COURSES_PER_STUDENT[1], 1))
+        timings["ENROLLMENTS"] = time.perf_counter() - started
+
+        ## Build indexes after the load, then collect planner statistics
+        started = time.perf_counter()
+        for table, column in INDEXES:
+            name = f"idx_{table}_{column}".lower()
+            connection.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ("{column}")')
+        connection.execute("ANALYZE;")
+        timings["indexes"] = time.perf_counter() - started
+
+        # Back to a normal rollback journal for everyone who opens the file later
+        connection.execute("PRAGMA journal_mode=DELETE;")
+    finally:
+        connection.close()
+    return timings
+
+
+def print_summary(db_path):
+    """Show a few rows of every table and the sample join queries"""
+    connection = sqlite3.connect(db_path)
+    cursor = connection.cursor()
+
+    ## Display all tables and their data
+    print("=== DATABASE CREATED SUCCESSFULLY ===\n")
+
+    for table, label in (("DEPARTMENTS", "DEPARTMENTS"), ("INSTRUCTORS", "INSTRUCTORS"),
+                         ("COURSES", "COURSES"), ("STUDENT", "STUDENTS"), ("ENROLLMENTS", "ENROLLMENTS")):
+        print(f"{label}:" if table == "DEPARTMENTS" else f"\n{label}:")
+        cursor.execute(f"SELECT * FROM {table} LIMIT 5")
+        for row in cursor.fetchall():
+            print(row)
+
+    print("\n=== SAMPLE COMPLEX QUERIES ===")
+
+    print("\n1. Students with their department names:")
+    cursor.execute('''
+        SELECT s.NAME, s.CLASS, d.DEPT_NAME, s.GPA
+        FROM STUDENT s
+        JOIN DEPARTMENTS d ON s.DEPT_ID = d.DEPT_ID
+        LIMIT 5
+    ''')
+    for row in cursor.fetchall():
+        print(row)
+
+    print("\n2. Course enrollments with student and instructor info:")
+    cursor.execute('''
+        SELECT s.NAME as Student, c.COURSE_NAME, i.INSTRUCTOR_NAME, e.MARKS, e.GRADE
+        FROM ENROLLMENTS e
+        JOIN STUDENT s ON e.STUDENT_ID = s.STUDENT_ID
+        JOIN COURSES c ON e.COURSE_ID = c.COURSE_ID
+        JOIN INSTRUCTORS i ON c.INSTRUCTOR_ID = i.INSTRUCTOR_ID
+        LIMIT 5
+    ''')
+    for row in cursor.fetchall():
+        print(row)
+
+    print("\n3. Average marks by department:")
+    cursor.execute('''
+        SELECT d.DEPT_NAME, AVG(e.MARKS) as Avg_Marks, COUNT(e.MARKS) as Total_Enrollments
+        FROM DEPARTMENTS d
+        JOIN STUDENT s ON d.DEPT_ID = s.DEPT_ID
+        JOIN ENROLLMENTS e ON s.STUDENT_ID = e.STUDENT_ID
+        GROUP BY d.DEPT_NAME
+        ORDER BY Avg_Marks DESC
+    ''')
+    for row in cursor.fetchall():
+        print(row)
+
+    counts = {table: cursor.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+              for table in ("DEPARTMENTS", "INSTRUCTORS", "COURSES", "STUDENT", "ENROLLMENTS")}
+    connection.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create the STUDENT database with sample or generated records")
+    parser.add_argument("--db", default="student.db")
+    parser.add_argument("--students", type=int, help=f"total students (default {len(students_data)})")
+    parser.add_argument("--courses", type=int, help=f"total courses (default {len(courses_data)})")
+    parser.add_argument("--instructors", type=int, help="total instructors (default max(10, courses / 3))")
+    parser.add_argument("--seed", type=int, help="random seed; the same seed and sizes rebuild the same data")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="rows per executemany batch")
+    parser.add_argument("--duckdb", metavar="PATH", help="also copy the database to a DuckDB file")
+    parser.add_argument("--no-summaries", action="store_true",
+                        help="skip the per-department/course/instructor aggregate tables")
+    parser.add_argument("--no-samples", action="store_true",
+                        help=f"skip the random samples of tables over {approximate.SAMPLE_ROWS:,} rows")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    timings = build_database(args.db, args.students, args.courses, args.instructors,
+                             args.seed, args.batch_size)
+    if not args.no_summaries:
+        timings["summaries"] = summaries.build(args.db)
+    if not args.no_samples:
+        samples_started = time.perf_counter()
+        samples = approximate.build(args.db)
+        timings["samples"] = time.perf_counter() - samples_started
+    counts = print_summary(args.db)
+
+    print("\n✅ Complex database created with:")
+    print("• 5 interconnected tables" + ("" if args.no_summaries else " plus 3 trigger-maintained summary tables"))
+    print("• Realistic foreign key relationships")
+    print(f"• {counts['STUDENT']:,} students, {counts['COURSES']:,} courses, "
+          f"{counts['INSTRUCTORS']:,} instructors")
+    print(f"• {counts['ENROLLMENTS']:,} enrollments with grades and attendance")
+    if not args.no_samples and samples:
+        print("• Samples for approximate answers: " + ", ".join(
+            f"{table} {sampled:,} rows ({rate:.1%})" for table, (sampled, rate) in samples.items()))
+    print("• Load time: " + ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in timings.items())
+          + f" (total {time.perf_counter() - started:.1f}s)")
+
+    if args.duckdb:
+        from duckdb_backend import copy_from_sqlite
+
+        copy_started = time.perf_counter()
+        copy_from_sqlite(args.db, args.duckdb, args.batch_size)
+        print(f"• DuckDB copy: {args.duckdb} ({time.perf_counter() - copy_started:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""Pre-execution checks and run-time budgets for generated SQL.
+
+Before a generated statement runs it must:
+
+1. be a single read statement (SELECT / WITH / VALUES), which is enforced
+   both lexically and by an authorizer that denies every write action
+   while SQLite compiles it;
+2. have an ``EXPLAIN QUERY PLAN`` whose full scans and nested-loop products
+   (cartesian joins, missing join predicates) stay under configurable row
+   limits, estimated from the schema catalog's row counts.
+
+While it runs, a progress handler enforces a wall-clock and VM-step budget,
+so a runaway query is interrupted instead of pinning a server thread. An
+optional monitor (a query_jobs.QueryJob) sees the connection and the step
+count, so it can report progress and cancel the statement.
+"""
+import os
+import re
+import sqlite3
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from query_log import get_query_log
+from schema_catalog import get_catalog
+
+MAX_SCAN_ROWS = int(os.getenv("NL2SQL_MAX_SCAN_ROWS", "20000000"))
+MAX_JOIN_ROWS = int(os.getenv("NL2SQL_MAX_JOIN_ROWS", "100000000"))
+QUERY_TIMEOUT_SECONDS = float(os.getenv("NL2SQL_QUERY_TIMEOUT", "10"))
+EXPORT_TIMEOUT_SECONDS = float(os.getenv("NL2SQL_EXPORT_TIMEOUT", "120"))
+MAX_VM_STEPS = int(os.getenv("NL2SQL_MAX_VM_STEPS", "0"))  # 0 = no step limit
+PROGRESS_INTERVAL = 10000  # VM instructions between budget checks
+
+READ_KEYWORDS = {"SELECT", "WITH", "VALUES"}
+WRITE_KEYWORDS = {
+    "INSERT", "UPDATE", "DELETE", "UPSERT", "CREATE", "DROP", "ALTER",
+    "ATTACH", "DETACH", "PRAGMA", "VACUUM", "REINDEX", "ANALYZE", "BEGIN", "COMMIT",
+    "ROLLBACK", "SAVEPOINT", "RELEASE",
+}
+ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION,
+                   sqlite3.SQLITE_RECURSIVE}
+
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+# One pass over literals and comments, so '--' inside a string is not taken for a comment (or vice versa)
+_LITERAL_OR_COMMENT_RE = re.compile(r"'(?:[^']|'')*'|--[^\n]*|/\*.*?\*/", re.DOTALL)
+_FENCE_RE = re.compile(r"^\s*```[A-Za-z]*\s*|\s*```\s*$")
+# Words that can follow a table name and must not be taken for its alias
+_CLAUSE_WORDS = (
+    "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "NATURAL", "OUTER", "ON", "USING", "WHERE",
+    "GROUP", "ORDER", "HAVING", "LIMIT", "WINDOW", "UNION", "EXCEPT", "INTERSECT", "INDEXED", "NOT",
+)
+_ALIAS_RE = re.compile(
+    r'(?:\bFROM|\bJOIN|,)\s*([A-Za-z_]\w*|"[^"]+")'
+    r'(?:\s+(?:AS\s+)?(?!(?:' + "|".join(_CLAUSE_WORDS) + r')\b)([A-Za-z_]\w*|"[^"]+"))?',
+    re.IGNORECASE,
+)
+_PLAN_RE = re.compile(r"^SCAN (.+?)(?: USING .*)?$")
+
+
+class QueryRejected(Exception):
+    """The statement failed a pre-execution check"""
+
+
+class QueryCancelled(QueryRejected):
+    """The statement ran past its time or VM-step budget and was interrupted"""
+
+
+def strip_markdown(sql):
+    """Remove ``` fences the model sometimes wraps around its answer"""
+    return _FENCE_RE.sub("", sql.strip()).strip()
+
+
+def check_statement(sql):
+    """Return the single read statement in ``sql`` or raise QueryRejected"""
+    sql = strip_markdown(sql)
+    # Cut at the first complete statement; anything but comments after it is a second statement
+    for match in re.finditer(";", sql):
+        if sqlite3.complete_statement(sql[:match.end()]):
+            rest = sql[match.end():]
+            if _COMMENT_RE.sub("", rest).strip():
+                raise QueryRejected("Only a single SQL statement is allowed.")
+            sql = sql[:match.end()]
+            break
+
+    code = _LITERAL_OR_COMMENT_RE.sub(lambda m: "''" if m.group(0).startswith("'") else " ", sql)
+    words = re.findall(r"[A-Za-z_]+", code)
+    if not words or words[0].upper() not in READ_KEYWORDS:
+        raise QueryRejected("Only read-only queries (SELECT / WITH) are allowed.")
+    writes = WRITE_KEYWORDS & {word.upper() for word in words}
+    if writes:
+        raise QueryRejected(f"Write statements are not allowed ({', '.join(sorted(writes))}).")
+    return sql
+
+
+def _authorizer(action, *args):
+    return sqlite3.SQLITE_OK if action in ALLOWED_ACTIONS else sqlite3.SQLITE_DENY
+
+
+def table_aliases(sql, tables):
+    """Map every FROM/JOIN alias (and bare table name) to the table it refers to"""
+    by_upper = {name.upper(): name for name in tables}
+    aliases = {}
+    for match in _ALIAS_RE.finditer(sql):
+        table = by_upper.get(match.group(1).strip('"').upper())
+        if table:
+            aliases[table.upper()] = table
+            if match.group(2):
+                aliases[match.group(2).strip('"').upper()] = table
+    return aliases
+
+
+def scan_rows(plan, sql, table_structure):
+    """[(parent, rows)] for every full scan in a query plan, sized from the catalog's row counts"""
+    aliases = table_aliases(sql, table_structure)
+    scans = []
+    for _, parent, _, detail in plan:
+        match = _PLAN_RE.match(detail)
+        if not match or detail.startswith("SCAN CONSTANT ROW"):
+            continue
+        table = aliases.get(match.group(1).strip('"').upper())
+        scans.append((parent, table_structure[table]['row_count'] if table else 1))
+    return scans
+
+
+def estimate_plan(conn, sql, table_structure):
+    """Return (plan rows, largest full scan, largest nested-loop product) for a statement"""
+    plan = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+    loops = defaultdict(list)
+    for parent, rows in scan_rows(plan, sql, table_structure):
+        loops[parent].append(rows)
+    largest_scan = max((rows for scans in loops.values() for rows in scans), default=0)
+    # Full scans nested in one loop level multiply: that is what a cartesian join looks like
+    largest_product = 0
+    for scans in loops.values():
+        product = 1
+        for rows in scans:
+            product *= max(rows, 1)
+        if len(scans) > 1:
+            largest_product = max(largest_product, product)
+    return plan, largest_scan, largest_product
+
+
+def check_costs(largest_scan, largest_product, max_scan_rows=None, max_join_rows=None):
+    """Raise QueryRejected if a plan's largest full scan or nested-loop product is over its limit"""
+    max_scan_rows = max_scan_rows or MAX_SCAN_ROWS
+    max_join_rows = max_join_rows or MAX_JOIN_ROWS
+    if largest_scan > max_scan_rows:
+        raise QueryRejected(
+            f"Query would scan about {largest_scan:,} rows (limit {max_scan_rows:,}). Add a filter."
+        )
+    if largest_product > max_join_rows:
+        raise QueryRejected(
+            f"Query joins tables without a usable join condition (about {largest_product:,} row "
+            f"combinations, limit {max_join_rows:,}). Check the JOIN ... ON predicates."
+        )
+
+
+def check_plan(conn, sql, table_structure, max_scan_rows=None, max_join_rows=None):
+    """Return the query plan, or raise QueryRejected if it scans or joins more rows than allowed"""
+    try:
+        plan, largest_scan, largest_product = estimate_plan(conn, sql, table_structure)
+    except sqlite3.DatabaseError as e:
+        if "not authorized" in str(e):
+            raise QueryRejected("Only read-only queries are allowed.") from e
+        raise
+    check_costs(largest_scan, largest_product, max_scan_rows, max_join_rows)
+    return plan
+
+
+@contextmanager
+def execution_budget(conn, timeout=QUERY_TIMEOUT_SECONDS, max_steps=MAX_VM_STEPS, monitor=None):
+    """Interrupt statements on ``conn`` that run longer than ``timeout`` s or ``max_steps`` VM steps
+
+    ``monitor.step(steps)`` is called at every check; a true return value
+    (cancel requested) interrupts the statement too.
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    steps = [0]
+
+    def progress():
+        steps[0] += PROGRESS_INTERVAL
+        if monitor is not None and monitor.step(steps[0]):
+            return 1
+        if deadline is not None and time.monotonic() > deadline:
+            return 1
+        return 1 if max_steps and steps[0] > max_steps else 0
+
+    conn.set_progress_handler(progress, PROGRESS_INTERVAL)
+    try:
+        yield
+    except sqlite3.OperationalError as e:
+        if "interrupted" in str(e):
+            raise QueryCancelled(
+                f"Query exceeded its budget ({timeout:g}s / {max_steps or 'unlimited'} VM steps) and was cancelled."
+            ) from e
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+@contextmanager
+def guarded_cursor(engine, sql, timeout=QUERY_TIMEOUT_SECONDS, max_steps=MAX_VM_STEPS, monitor=None):
+    """Validate ``sql`` and yield an open cursor running it under the execution budget
+
+    Statements that pass validation are recorded in the workload log with
+    their plan and latency (time until the caller is done with the cursor).
+    ``monitor`` is attached to the connection while the statement runs.
+    Engines of other backends apply their own guard (``engine.guarded_cursor``).
+    """
+    if engine.backend != "sqlite":
+        with engine.guarded_cursor(sql, timeout=timeout, max_steps=max_steps, monitor=monitor) as cur:
+            yield cur
+        return
+    sql = check_statement(sql)
+    table_structure = get_catalog(engine.db_path).table_structure()
+    with engine.pool.connection() as conn:
+        conn.set_authorizer(_authorizer)
+        if monitor is not None:
+            monitor.attach(conn)
+        try:
+            plan = check_plan(conn, sql, table_structure)
+            started = time.perf_counter()
+            error = None
+            try:
+                with execution_budget(conn, timeout, max_steps, monitor):
+                    cur = conn.execute(sql)
+                    try:
+                        yield cur
+                    finally:
+                        cur.close()
+            except Exception as e:
+                error = str(e)
+                raise
+            finally:
+                latency_ms = (time.perf_counter() - started) * 1000
+                get_query_log().record(engine.db_path, sql, plan, latency_ms, error)
+        finally:
+            if monitor is not None:
+                monitor.detach()
+            conn.set_authorizer(None)
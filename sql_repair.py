@@ -0,0 +1,293 @@
+"""Automatic repair of generated SQL that fails to run.
+
+When a statement errors, cheap local fixes are tried first, each one
+checked by running the result:
+
+* ``markdown``: cut the answer down to its first statement (code fences,
+  a leading "sql" / "SQL:" label, trailing commentary);
+* ``quotes``: typographic quotes, backslash-escaped quotes, and double-quoted
+  values that the engine reports as unknown columns;
+* ``table_name`` / ``column_name``: fuzzy-match an unknown identifier from the
+  error message (SQLite's or DuckDB's wording) against the catalog (plural/singular forms, close
+  spellings, table-prefixed names like STUDENT_NAME -> NAME, or a column
+  that exists under another alias of the query).
+
+Only if none of those work is the failing SQL and its error sent back to
+the model, at most ``NL2SQL_REPAIR_LLM_ATTEMPTS`` times and within
+``NL2SQL_REPAIR_TIMEOUT`` seconds (skipped when the shared rate limiter
+could not grant a request in that time). Every attempt is counted per fix
+so the sidebar and the metrics show which repairs pay off.
+"""
+import difflib
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+from backends import backend_for
+from llm_client import get_client
+from nl2sql import StatementStream
+from prompt_builder import build_prompt, stem
+from results import RESULT_PAGE_SIZE, read_sql_page
+from schema_catalog import get_catalog
+from sql_guard import table_aliases
+from telemetry import approx_tokens, span
+
+MAX_LOCAL_FIXES = 3  # local fixes applied in sequence (a query can have several bad names)
+LLM_ATTEMPTS = int(os.getenv("NL2SQL_REPAIR_LLM_ATTEMPTS", "1"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("NL2SQL_REPAIR_TIMEOUT", "8"))
+FUZZY_CUTOFF = 0.8
+
+# Errors a rewrite cannot fix: budgets and policy rejections
+NOT_REPAIRABLE = ("was cancelled", "would scan about", "Write statements are not allowed")
+
+REPAIR_INSTRUCTIONS = """
+The SQL query below was generated for the question but failed with the error shown.
+Return only the corrected SQL query, without markdown or explanations.
+"""
+
+RepairResult = namedtuple("RepairResult", ["sql", "page", "fixes"])
+# What a query job needs to repair its statement: the question and the generated SQL (a sampled
+# approximate query is repaired as the exact one), plus the prompt that produced it
+RepairRequest = namedtuple("RepairRequest", ["question", "sql", "prompt"])
+
+_NO_SUCH_COLUMN_RE = re.compile(r"no such column: (?:([\w\"]+)\.)?\"?([^\"\s]+)\"?")
+_NO_SUCH_TABLE_RE = re.compile(r"no such table: (?:\w+\.)?\"?([^\"\s]+)\"?")
+# DuckDB's wording of the same errors
+_DUCKDB_COLUMN_RE = re.compile(r'Table "([^"]+)" does not have a column named "([^"]+)"')
+_DUCKDB_BARE_COLUMN_RE = re.compile(r'Referenced column "([^"]+)" not found')
+_DUCKDB_TABLE_RE = re.compile(r'Table with name "?([^"\s!]+)"? does not exist')
+_LABEL_RE = re.compile(r"^\s*(?:sql\s*:?\s*\n|sql\s*:\s*|sql\s+(?=(?:select|with|values)\b))", re.IGNORECASE)
+_SINGLE_QUOTED_RE = re.compile(r"'(?:[^']|'')*'")
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _count(fix, fixed):
+    with _stats_lock:
+        entry = _stats.setdefault(fix, {'attempts': 0, 'fixed': 0})
+        entry['attempts'] += 1
+        entry['fixed'] += int(fixed)
+
+
+def repair_stats():
+    """{fix: {'attempts', 'fixed'}} since the process started"""
+    with _stats_lock:
+        return {fix: dict(entry) for fix, entry in _stats.items()}
+
+
+def _replace_outside_literals(sql, pattern, replacement):
+    """re.sub on the parts of ``sql`` that are not single-quoted string literals"""
+    parts, last = [], 0
+    for literal in _SINGLE_QUOTED_RE.finditer(sql):
+        parts.append(re.sub(pattern, replacement, sql[last:literal.start()]))
+        parts.append(literal.group(0))
+        last = literal.end()
+    parts.append(re.sub(pattern, replacement, sql[last:]))
+    return "".join(parts)
+
+
+def _unknown_column(error):
+    """(qualifier or None, column) named by an unknown-column error of either backend"""
+    error = error or ""
+    for pattern in (_NO_SUCH_COLUMN_RE, _DUCKDB_COLUMN_RE):
+        match = pattern.search(error)
+        if match:
+            return match.group(1), match.group(2)
+    match = _DUCKDB_BARE_COLUMN_RE.search(error)
+    return (None, match.group(1)) if match else None
+
+
+def _unknown_table(error):
+    match = _NO_SUCH_TABLE_RE.search(error or "") or _DUCKDB_TABLE_RE.search(error or "")
+    return match.group(1) if match else None
+
+
+def fix_markdown(sql, error, table_structure):
+    statement = StatementStream()
+    statement.feed(_LABEL_RE.sub("", sql.strip(), count=1))
+    fixed = statement.result()
+    return fixed if fixed and fixed != sql.strip() else None
+
+
+def fix_quotes(sql, error, table_structure):
+    fixed = (sql.replace("‘", "'").replace("’", "'")
+             .replace("“", '"').replace("”", '"').replace("\\'", "''"))
+    unknown = _unknown_column(error)
+    if unknown and not unknown[0]:
+        # SQLite and DuckDB read "Data Science" as an identifier first; a value was meant
+        value = unknown[1]
+        quoted = '"' + value + '"'
+        if quoted in fixed:
+            fixed = fixed.replace(quoted, "'" + value.replace("'", "''") + "'")
+    return fixed if fixed != sql else None
+
+
+def _closest(name, candidates, tables=()):
+    """Best catalog spelling for an unknown identifier, or None if nothing is convincing
+
+    With ``tables`` (the tables the candidates belong to), a table prefix may
+    be added or dropped: STUDENT_NAME -> NAME on STUDENT, NAME ->
+    INSTRUCTOR_NAME on INSTRUCTORS, but not DEPT_NAME -> NAME on STUDENT.
+    """
+    upper = {candidate.upper(): candidate for candidate in candidates}
+    name_upper = name.upper()
+    same_stem = [c for u, c in upper.items() if stem(u) == stem(name_upper)]
+    if len(same_stem) == 1:
+        return same_stem[0]
+    table_stems = {stem(table) for table in tables}
+    affixed = []
+    for u, c in upper.items():
+        longer, shorter = (name_upper, u) if len(name_upper) > len(u) else (u, name_upper)
+        prefix = longer[:-len(shorter) - 1]
+        # A bare ID is too often a join column of another table (s.STUDENT_ID = e.ID) to guess
+        if shorter != "ID" and longer.endswith("_" + shorter) and stem(prefix) in table_stems:
+            affixed.append(c)
+    if len(affixed) == 1:
+        return affixed[0]
+    close = difflib.get_close_matches(name_upper, list(upper), n=2, cutoff=FUZZY_CUTOFF)
+    if len(close) == 1 or (len(close) == 2 and difflib.SequenceMatcher(None, name_upper, close[0]).ratio() >
+                           difflib.SequenceMatcher(None, name_upper, close[1]).ratio()):
+        return upper[close[0]]
+    return None
+
+
+def fix_table_name(sql, error, table_structure):
+    unknown = _unknown_table(error)
+    if not unknown:
+        return None
+    tables = [name for name in table_structure if not name.startswith("sqlite_")]
+    table = _closest(unknown, tables)
+    if not table:
+        return None
+    pattern = r'(?i)(\b(?:FROM|JOIN)\s+)"?' + re.escape(unknown) + r'"?(?=[\s,;)]|$)'
+    fixed = _replace_outside_literals(sql, pattern, lambda m: m.group(1) + table)
+    return fixed if fixed != sql else None
+
+
+def fix_column_name(sql, error, table_structure):
+    unknown = _unknown_column(error)
+    if not unknown:
+        return None
+    qualifier, column = unknown
+    aliases = table_aliases(sql, table_structure)
+    columns = {table: [col[1] for col in table_structure[table]['columns']] for table in set(aliases.values())}
+    if qualifier:
+        qualifier = qualifier.strip('"')
+        table = aliases.get(qualifier.upper())
+        if not table:
+            return None
+        # s.DEPT_NAME where DEPT_NAME exists, as spelled, on exactly one other table of the query
+        owners = [t for t, cols in columns.items() if column.upper() in {c.upper() for c in cols}]
+        if len(owners) == 1:
+            names = [alias for alias, t in aliases.items() if t == owners[0] and alias != t.upper()]
+            new_qualifier = owners[0]
+            if len(names) == 1:
+                # table_aliases upper-cases aliases; keep the spelling used in the query
+                new_qualifier = re.search(r"(?i)\b" + re.escape(names[0]) + r"\b", sql).group(0)
+            replacement = next(c for c in columns[owners[0]] if c.upper() == column.upper())
+        else:
+            new_qualifier = qualifier
+            replacement = _closest(column, columns[table], [table])
+            if not replacement:
+                return None
+        pattern = r'(?i)(?<![\w.])"?' + re.escape(qualifier) + r'"?\s*\.\s*"?' + re.escape(column) + r'"?(?!\w)'
+        fixed = _replace_outside_literals(sql, pattern, lambda m: f"{new_qualifier}.{replacement}")
+    else:
+        candidates = sorted({c for cols in columns.values() for c in cols})
+        replacement = _closest(column, candidates, columns)
+        if not replacement:
+            return None
+        pattern = r'(?i)(?<![\w.])"?' + re.escape(column) + r'"?(?![\w.])'
+        fixed = _replace_outside_literals(sql, pattern, lambda m: replacement)
+    return fixed if fixed != sql else None
+
+
+LOCAL_FIXES = (
+    ("markdown", fix_markdown),
+    ("quotes", fix_quotes),
+    ("table_name", fix_table_name),
+    ("column_name", fix_column_name),
+)
+
+
+def _llm_fix(question, prompt, sql, error, deadline):
+    """Corrected SQL from the model, or None when the budget does not allow a call or the call fails"""
+    remaining = deadline - time.monotonic()
+    client = get_client()
+    if remaining <= 0 or client.limiter.wait_time() > remaining:
+        return None
+    full_prompt = (prompt + REPAIR_INSTRUCTIONS + f"\nQuestion: {question}\nSQL: {sql}\nError: {error}\n")
+    with span("repair_generate", prompt_tokens=approx_tokens(full_prompt)) as attributes:
+        try:
+            text = client.generate(full_prompt, timeout=remaining)
+        except Exception as e:
+            attributes['error'] = type(e).__name__
+            return None
+        attributes['response_tokens'] = approx_tokens(text)
+    statement = StatementStream()
+    statement.feed(text)
+    return statement.result()
+
+
+def repair(question, sql, page, db, prompt=None, limit=RESULT_PAGE_SIZE, monitor=None):
+    """Try to turn a query whose result ``page`` has an error into one that runs; returns RepairResult
+
+    ``fixes`` names the repairs applied in order. If nothing worked it is
+    empty and the original SQL and page are returned. ``monitor`` (a
+    query_jobs.QueryJob) watches every candidate statement; once it is
+    cancelled no further attempt is made.
+    """
+    original = RepairResult(sql, page, [])
+    error = page.error
+    table_structure = get_catalog(db).table_structure()
+    fixes = []
+
+    def cancelled():
+        return monitor is not None and monitor.cancelled
+
+    for _ in range(MAX_LOCAL_FIXES):
+        for name, fix in LOCAL_FIXES:
+            candidate = fix(sql, error, table_structure)
+            if candidate:
+                break
+        else:
+            break
+        with span("repair", fix=name) as attributes:
+            page = read_sql_page(candidate, db, limit=limit, monitor=monitor)
+            attributes['outcome'] = f"{name}:{'failed' if page.error else 'fixed'}"
+        if cancelled():
+            return original
+        _count(name, not page.error)
+        # Partial progress counts: the next round starts from the improved statement
+        sql, error = candidate, page.error
+        fixes.append(name)
+        if not page.error:
+            return RepairResult(sql, page, fixes)
+
+    if cancelled() or any(marker in (error or "") for marker in NOT_REPAIRABLE):
+        return original
+    if prompt is None:
+        catalog = get_catalog(db)
+        prompt = build_prompt(question, table_structure, catalog.relationships(), dialect=backend_for(db))
+    deadline = time.monotonic() + LLM_TIMEOUT_SECONDS
+    for _ in range(LLM_ATTEMPTS):
+        candidate = _llm_fix(question, prompt, sql, error, deadline)
+        if cancelled():
+            return original
+        if not candidate:
+            _count("llm", False)
+            break
+        with span("repair", fix="llm") as attributes:
+            page = read_sql_page(candidate, db, limit=limit, monitor=monitor)
+            attributes['outcome'] = f"llm:{'failed' if page.error else 'fixed'}"
+        if cancelled():
+            return original
+        _count("llm", not page.error)
+        sql, error = candidate, page.error
+        fixes.append("llm")
+        if not page.error:
+            return RepairResult(sql, page, fixes)
+    return original
@@ -0,0 +1,242 @@
+"""Materialized per-department, per-course and per-instructor aggregates.
+
+    python summaries.py --db student.db          # (re)build the tables and triggers
+    python summaries.py --db student.db --drop   # remove them
+
+Dashboard-style questions ("Average marks by department", "Which instructor
+teaches the most courses?") otherwise join and aggregate all of ENROLLMENTS
+every time. Each summary table keeps, per key, the number of enrollments
+and the count, sum and average of MARKS and ATTENDANCE_PERCENTAGE:
+
+* DEPARTMENT_SUMMARY: by the student's department, plus STUDENTS;
+* COURSE_SUMMARY: by course;
+* INSTRUCTOR_SUMMARY: by the course's instructor, plus COURSES.
+
+The tables are filled once from the base tables, then kept current by
+triggers on ENROLLMENTS, STUDENT and COURSES that add and subtract each
+changed row's contribution. Averages are stored columns (not generated
+ones) so the tables copy to DuckDB like any other; the DuckDB copy is a
+snapshot, since DuckDB has no triggers. The prompt builder describes the
+tables that exist in a database and swaps in the examples below for the
+questions they answer.
+"""
+import argparse
+import sqlite3
+import time
+
+# name -> (key column, parent table, description for the prompt)
+SUMMARY_TABLES = {
+    "DEPARTMENT_SUMMARY": ("DEPT_ID", "DEPARTMENTS",
+                           "one row per department (students' DEPT_ID): STUDENTS, ENROLLMENTS and "
+                           "the count/sum/average of their MARKS and ATTENDANCE_PERCENTAGE"),
+    "COURSE_SUMMARY": ("COURSE_ID", "COURSES",
+                       "one row per course: ENROLLMENTS and the count/sum/average of MARKS and "
+                       "ATTENDANCE_PERCENTAGE"),
+    "INSTRUCTOR_SUMMARY": ("INSTRUCTOR_ID", "INSTRUCTORS",
+                           "one row per instructor: COURSES taught, ENROLLMENTS in them and the "
+                           "count/sum/average of MARKS and ATTENDANCE_PERCENTAGE"),
+}
+
+# Replace the join-and-aggregate examples for the same questions when the tables exist
+SUMMARY_EXAMPLES = [
+    ("Average marks by department",
+     "SELECT d.DEPT_NAME, ds.AVG_MARKS FROM DEPARTMENT_SUMMARY ds "
+     "JOIN DEPARTMENTS d ON ds.DEPT_ID = d.DEPT_ID;"),
+    ("Which instructor teaches the most courses?",
+     "SELECT i.INSTRUCTOR_NAME, isum.COURSES AS course_count FROM INSTRUCTOR_SUMMARY isum "
+     "JOIN INSTRUCTORS i ON isum.INSTRUCTOR_ID = i.INSTRUCTOR_ID "
+     "ORDER BY isum.COURSES DESC LIMIT 1;"),
+]
+
+MEASURES = ("ENROLLMENTS", "MARKS_COUNT", "MARKS_SUM", "ATTENDANCE_COUNT", "ATTENDANCE_SUM")
+# Extra counter of parent rows (students per department, courses per instructor)
+PARENT_COUNTS = {"DEPARTMENT_SUMMARY": "STUDENTS", "INSTRUCTOR_SUMMARY": "COURSES"}
+
+# Summary key of an enrollment row (alias R = NEW or OLD)
+ENROLLMENT_KEYS = {
+    "DEPARTMENT_SUMMARY": "(SELECT DEPT_ID FROM STUDENT WHERE STUDENT_ID = {r}.STUDENT_ID)",
+    "COURSE_SUMMARY": "{r}.COURSE_ID",
+    "INSTRUCTOR_SUMMARY": "(SELECT INSTRUCTOR_ID FROM COURSES WHERE COURSE_ID = {r}.COURSE_ID)",
+}
+# Parent rows whose key change moves all their enrollments: (summary, table, key, enrollment column)
+PARENTS = (
+    ("DEPARTMENT_SUMMARY", "STUDENT", "DEPT_ID", "STUDENT_ID"),
+    ("INSTRUCTOR_SUMMARY", "COURSES", "INSTRUCTOR_ID", "COURSE_ID"),
+)
+
+
+def _table_ddl(name):
+    key, parent, _ = SUMMARY_TABLES[name]
+    counters = ([PARENT_COUNTS[name]] if name in PARENT_COUNTS else []) + list(MEASURES)
+    columns = [f"{key} INTEGER PRIMARY KEY"]
+    columns += [f"{column} {'REAL' if column == 'ATTENDANCE_SUM' else 'INTEGER'} NOT NULL DEFAULT 0"
+                for column in counters]
+    columns += ["AVG_MARKS REAL", "AVG_ATTENDANCE REAL",
+                f"FOREIGN KEY ({key}) REFERENCES {parent}({key})"]
+    return f"CREATE TABLE {name} (\n    " + ",\n    ".join(columns) + "\n);"
+
+
+def _averages():
+    """AVG_MARKS / AVG_ATTENDANCE expressions over the sum and count columns"""
+    return ("MARKS_SUM * 1.0 / NULLIF(MARKS_COUNT, 0)",
+            "ATTENDANCE_SUM * 1.0 / NULLIF(ATTENDANCE_COUNT, 0)")
+
+
+def _upsert(name, select_sql, columns):
+    """INSERT ... SELECT adding ``columns`` (key first) onto a summary row, creating it if needed"""
+    key = columns[0]
+    added = [f"{column} = {column} + excluded.{column}" for column in columns[1:]]
+    # UPDATE's SET reads the old row, so the averages use old + added totals
+    avg_marks, avg_attendance = (
+        "(MARKS_SUM + excluded.MARKS_SUM) * 1.0 / NULLIF(MARKS_COUNT + excluded.MARKS_COUNT, 0)",
+        "(ATTENDANCE_SUM + excluded.ATTENDANCE_SUM) * 1.0 / NULLIF(ATTENDANCE_COUNT + excluded.ATTENDANCE_COUNT, 0)",
+    )
+    return (f"INSERT INTO {name} ({', '.join(columns)}, AVG_MARKS, AVG_ATTENDANCE)\n"
+            f"        SELECT *, {', '.join(_averages())} FROM ({select_sql}) WHERE {key} IS NOT NULL\n"
+            f"        ON CONFLICT ({key}) DO UPDATE SET {', '.join(added)}, "
+            f"AVG_MARKS = {avg_marks}, AVG_ATTENDANCE = {avg_attendance};")
+
+
+def _row_delta(name, row, sign):
+    """Upsert adding (sign=1) or removing (sign=-1) one enrollment row's contribution"""
+    key = SUMMARY_TABLES[name][0]
+    select_sql = (
+        f"SELECT {ENROLLMENT_KEYS[name].format(r=row)} AS {key}, {sign} AS ENROLLMENTS, "
+        f"{sign} * ({row}.MARKS IS NOT NULL) AS MARKS_COUNT, {sign} * COALESCE({row}.MARKS, 0) AS MARKS_SUM, "
+        f"{sign} * ({row}.ATTENDANCE_PERCENTAGE IS NOT NULL) AS ATTENDANCE_COUNT, "
+        f"{sign} * COALESCE({row}.ATTENDANCE_PERCENTAGE, 0) AS ATTENDANCE_SUM"
+    )
+    return _upsert(name, select_sql, [key] + list(MEASURES))
+
+
+def _parent_delta(name, row, sign, key, enrollment_column):
+    """Upsert adding or removing a parent row (student / course) with all of its enrollments"""
+    counter = PARENT_COUNTS[name]
+    select_sql = (
+        f"SELECT {row}.{key} AS {key}, {sign} AS {counter}, {sign} * COUNT(*) AS ENROLLMENTS, "
+        f"{sign} * COUNT(MARKS) AS MARKS_COUNT, {sign} * COALESCE(SUM(MARKS), 0) AS MARKS_SUM, "
+        f"{sign} * COUNT(ATTENDANCE_PERCENTAGE) AS ATTENDANCE_COUNT, "
+        f"{sign} * COALESCE(SUM(ATTENDANCE_PERCENTAGE), 0) AS ATTENDANCE_SUM "
+        f"FROM ENROLLMENTS WHERE {enrollment_column} = {row}.{enrollment_column}"
+    )
+    return _upsert(name, select_sql, [key, counter] + list(MEASURES))
+
+
+def _trigger(name, event, table, statements):
+    body = "\n    ".join(statements)
+    return f"CREATE TRIGGER {name} AFTER {event} ON {table}\nBEGIN\n    {body}\nEND;"
+
+
+def trigger_ddl():
+    """CREATE TRIGGER statements keeping every summary table current"""
+    names = list(SUMMARY_TABLES)
+    triggers = [
+        _trigger("summary_enrollment_insert", "INSERT", "ENROLLMENTS",
+                 [_row_delta(name, "NEW", 1) for name in names]),
+        _trigger("summary_enrollment_delete", "DELETE", "ENROLLMENTS",
+                 [_row_delta(name, "OLD", -1) for name in names]),
+        _trigger("summary_enrollment_update",
+                 "UPDATE OF STUDENT_ID, COURSE_ID, MARKS, ATTENDANCE_PERCENTAGE", "ENROLLMENTS",
+                 [_row_delta(name, "OLD", -1) for name in names] + [_row_delta(name, "NEW", 1) for name in names]),
+    ]
+    for name, table, key, enrollment_column in PARENTS:
+        prefix = f"summary_{table.lower()}"
+        triggers += [
+            _trigger(f"{prefix}_insert", "INSERT", table,
+                     [_parent_delta(name, "NEW", 1, key, enrollment_column)]),
+            _trigger(f"{prefix}_delete", "DELETE", table,
+                     [_parent_delta(name, "OLD", -1, key, enrollment_column)]),
+            _trigger(f"{prefix}_update", f"UPDATE OF {key}, {enrollment_column}", table,
+                     [_parent_delta(name, "OLD", -1, key, enrollment_column),
+                      _parent_delta(name, "NEW", 1, key, enrollment_column)]),
+        ]
+    return triggers
+
+
+def _fill_sql(name):
+    """Statements computing one summary table from scratch: INSERT ... SELECT, then the averages"""
+    key = SUMMARY_TABLES[name][0]
+    measures = ("COUNT(*), COUNT(e.MARKS), COALESCE(SUM(e.MARKS), 0), "
+                "COUNT(e.ATTENDANCE_PERCENTAGE), COALESCE(SUM(e.ATTENDANCE_PERCENTAGE), 0)")
+    if name == "COURSE_SUMMARY":
+        source = (f"SELECT e.COURSE_ID, {measures} FROM ENROLLMENTS e "
+                  "WHERE e.COURSE_ID IS NOT NULL GROUP BY e.COURSE_ID")
+        columns = [key] + list(MEASURES)
+    else:
+        _, table, _, enrollment_column = next(parent for parent in PARENTS if parent[0] == name)
+        # Parents without enrollments still count (a department with students but no marks yet)
+        source = (
+            f"SELECT p.{key}, COUNT(DISTINCT p.{enrollment_column}), "
+            f"COUNT(e.{enrollment_column}), COUNT(e.MARKS), COALESCE(SUM(e.MARKS), 0), "
+            f"COUNT(e.ATTENDANCE_PERCENTAGE), COALESCE(SUM(e.ATTENDANCE_PERCENTAGE), 0) "
+            f"FROM {table} p LEFT JOIN ENROLLMENTS e ON e.{enrollment_column} = p.{enrollment_column} "
+            f"WHERE p.{key} IS NOT NULL GROUP BY p.{key}"
+        )
+        columns = [key, PARENT_COUNTS[name]] + list(MEASURES)
+    avg_marks, avg_attendance = _averages()
+    return [f"INSERT INTO {name} ({', '.join(columns)}) {source};",
+            f"UPDATE {name} SET AVG_MARKS = {avg_marks}, AVG_ATTENDANCE = {avg_attendance};"]
+
+
+def installed(conn):
+    """Names of the summary tables present in the database"""
+    rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table';").fetchall()
+    return [name for (name,) in rows if name in SUMMARY_TABLES]
+
+
+def drop(conn):
+    """Remove the summary tables and their triggers (inside the caller's transaction)"""
+    for (trigger,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'summary\\_%' ESCAPE '\\';"
+    ).fetchall():
+        conn.execute(f'DROP TRIGGER IF EXISTS "{trigger}";')
+    for name in SUMMARY_TABLES:
+        conn.execute(f"DROP TABLE IF EXISTS {name};")
+
+
+def build(db_path):
+    """(Re)create the summary tables from the base tables and install the triggers; returns seconds taken"""
+    started = time.perf_counter()
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    try:
+        conn.execute("BEGIN IMMEDIATE;")
+        try:
+            drop(conn)
+            for name in SUMMARY_TABLES:
+                conn.execute(_table_ddl(name))
+                for statement in _fill_sql(name):
+                    conn.execute(statement)
+            for trigger in trigger_ddl():
+                conn.execute(trigger)
+            conn.execute("COMMIT;")
+        except BaseException:
+            conn.execute("ROLLBACK;")
+            raise
+        # Row counts for the planner and the schema catalog
+        conn.execute("ANALYZE;")
+    finally:
+        conn.close()
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the materialized aggregate tables and their triggers")
+    parser.add_argument("--db", default="student.db")
+    parser.add_argument("--drop", action="store_true", help="remove the summary tables and triggers instead")
+    args = parser.parse_args(argv)
+    if args.drop:
+        conn = sqlite3.connect(args.db, isolation_level=None, timeout=30)
+        try:
+            conn.execute("BEGIN IMMEDIATE;")
+            drop(conn)
+            conn.execute("COMMIT;")
+        finally:
+            conn.close()
+        print(f"Removed summary tables from {args.db}")
+        return
+    seconds = build(args.db)
+    print(f"Built {', '.join(SUMMARY_TABLES)} in {args.db} ({seconds:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
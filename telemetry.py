@@ -0,0 +1,260 @@
+"""Per-stage timing spans and metrics for the NL→SQL pipeline.
+
+Code paths wrap their work in ``span(stage)``; each span records its
+duration into a per-stage latency histogram, adds counted attributes
+(tokens, rows, bytes) to running totals, and keeps the span in a ring
+buffer of recent spans. The data can be read three ways:
+
+* ``prometheus_text()`` in the Prometheus text format, served over HTTP
+  when ``NL2SQL_METRICS_PORT`` is set (``GET /metrics``), on localhost
+  unless ``NL2SQL_METRICS_HOST`` names another interface;
+* a JSONL trace, one span per line, appended to ``NL2SQL_TRACE_FILE`` and
+  downloadable from the sidebar (``export_jsonl()``);
+* ``histograms()`` for the sidebar latency chart.
+
+Spans opened inside ``trace()`` share a trace id, so one question's
+schema, prompt, generation and execution spans can be tied together.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds in milliseconds (Prometheus-style, cumulative on export)
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+COUNTED_ATTRIBUTES = ("prompt_tokens", "response_tokens", "rows", "bytes")
+RECENT_SPANS = 1000
+
+_trace_id = contextvars.ContextVar("nl2sql_trace_id", default=None)
+
+
+def approx_tokens(text):
+    """Rough token count (about four characters per token for English and SQL)"""
+    return (len(text) + 3) // 4 if text else 0
+
+
+def value_bytes(rows):
+    """Approximate payload size of fetched rows (text/blob length, 8 bytes per number)"""
+    total = 0
+    for row in rows:
+        for value in row:
+            if isinstance(value, (str, bytes)):
+                total += len(value)
+            elif value is not None:
+                total += 8
+    return total
+
+
+class Histogram:
+    """Fixed-bucket latency histogram"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (None when empty)"""
+        if not self.count:
+            return None
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= q * self.count:
+                return bound
+        return float("inf")
+
+
+class Telemetry:
+    """Thread-safe collector of spans, histograms and counters"""
+
+    def __init__(self, trace_path=None, buckets=LATENCY_BUCKETS_MS, keep=RECENT_SPANS):
+        self.trace_path = trace_path
+        self.buckets = buckets
+        self._histograms = {}
+        self._counters = {}
+        self._recent = deque(maxlen=keep)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @contextmanager
+    def trace(self):
+        """Group the spans opened inside this block under one trace id"""
+        token = _trace_id.set(uuid.uuid4().hex[:16])
+        try:
+            yield _trace_id.get()
+        finally:
+            _trace_id.reset(token)
+
+    @contextmanager
+    def span(self, stage, **attributes):
+        """Time a block; the yielded dict takes extra attributes (rows=..., error=True, ...)"""
+        started = time.perf_counter()
+        try:
+            yield attributes
+        except Exception as e:
+            attributes['error'] = type(e).__name__
+            raise
+        finally:
+            self.record(stage, (time.perf_counter() - started) * 1000, attributes)
+
+    def record(self, stage, duration_ms, attributes=None):
+        attributes = attributes or {}
+        status = "error" if attributes.get('error') else "ok"
+        entry = {
+            'ts': round(time.time(), 3),
+            'trace_id': _trace_id.get(),
+            'stage': stage,
+            'duration_ms': round(duration_ms, 3),
+            'status': status,
+            **attributes,
+        }
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(self.buckets)
+            histogram.observe(duration_ms)
+            self._add(("nl2sql_stage_total", (("stage", stage), ("status", status))), 1)
+            for name in COUNTED_ATTRIBUTES:
+                if attributes.get(name):
+                    self._add((f"nl2sql_{name}_total", (("stage", stage),)), attributes[name])
+            if attributes.get('outcome'):
+                self._add(("nl2sql_outcomes_total", (("stage", stage), ("outcome", str(attributes['outcome'])))), 1)
+            self._recent.append(entry)
+            if self.trace_path:
+                try:
+                    with open(self.trace_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(entry, default=str) + "\n")
+                except OSError:
+                    # Tracing is best effort; an unwritable file must not fail the request
+                    pass
+
+    def _add(self, key, value):
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def histograms(self):
+        """{stage: Histogram} snapshot"""
+        with self._lock:
+            snapshot = {}
+            for stage, histogram in self._histograms.items():
+                copy = Histogram(histogram.buckets)
+                copy.counts, copy.sum, copy.count = list(histogram.counts), histogram.sum, histogram.count
+                snapshot[stage] = copy
+            return snapshot
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def recent_spans(self):
+        with self._lock:
+            return list(self._recent)
+
+    def export_jsonl(self):
+        """Recent spans as JSONL bytes (for a download button)"""
+        return "".join(json.dumps(span, default=str) + "\n" for span in self.recent_spans()).encode("utf-8")
+
+    def prometheus_text(self):
+        """All histograms and counters in the Prometheus text exposition format"""
+        lines = [
+            "# HELP nl2sql_stage_duration_seconds Time spent per pipeline stage.",
+            "# TYPE nl2sql_stage_duration_seconds histogram",
+        ]
+        for stage, histogram in sorted(self.histograms().items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound / 1000:g}"
+                lines.append(f'nl2sql_stage_duration_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'nl2sql_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.sum / 1000:.6f}')
+            lines.append(f'nl2sql_stage_duration_seconds_count{{stage="{stage}"}} {histogram.count}')
+        declared = set()
+        for (name, labels), value in sorted(self.counters().items()):
+            if name not in declared:
+                lines.append(f"# TYPE {name} counter")
+                declared.add(name)
+            label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+            lines.append(f"{name}{{{label_text}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def start_server(self, port, host="127.0.0.1"):
+        """Serve /metrics (Prometheus) and /trace.jsonl from a daemon thread; idempotent
+
+        The trace holds users' questions and SQL, so only local clients are
+        served unless ``host`` is widened explicitly.
+        """
+        with self._lock:
+            if self._server is not None:
+                return self._server
+            telemetry = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.startswith("/metrics"):
+                        body = telemetry.prometheus_text().encode("utf-8")
+                        content_type = "text/plain; version=0.0.4; charset=utf-8"
+                    elif self.path.startswith("/trace.jsonl"):
+                        body = telemetry.export_jsonl()
+                        content_type = "application/x-ndjson"
+                    else:
+                        self.send_response(404)
+                        self.end_headers()
+                        return
+                    self.send_response(200)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+            self._server = ThreadingHTTPServer((host, port), Handler)
+            threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+            return self._server
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry():
+    """Process-wide collector (module state survives Streamlit reruns)"""
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            _telemetry = Telemetry(trace_path=os.getenv("NL2SQL_TRACE_FILE"))
+            port = os.getenv("NL2SQL_METRICS_PORT")
+            if port:
+                try:
+                    _telemetry.start_server(int(port), os.getenv("NL2SQL_METRICS_HOST", "127.0.0.1"))
+                except OSError:
+                    # Another process (e.g. a second Streamlit server) already owns the port
+                    pass
+        return _telemetry
+
+
+def span(stage, **attributes):
+    """Shortcut for ``get_telemetry().span(...)``"""
+    return get_telemetry().span(stage, **attributes)
+
+
+def trace():
+    """Shortcut for ``get_telemetry().trace()``"""
+    return get_telemetry().trace()
@@ -0,0 +1,25 @@
+import pytest
+
+import few_shot
+import nl_cache
+import query_log
+import result_cache
+import sql as datagen
+
+
+@pytest.fixture(scope="session")
+def student_db(tmp_path_factory):
+    """The sample database sql.py builds (hand-written rows only), shared by the session"""
+    path = tmp_path_factory.mktemp("db") / "student.db"
+    datagen.build_database(str(path), seed=7)
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def private_stores(tmp_path, monkeypatch):
+    """Give each test its own query log, NL cache, example stores and result cache, all under tmp_path"""
+    monkeypatch.setattr(query_log, "_log", query_log.QueryLog(tmp_path / "query_log.db"))
+    monkeypatch.setattr(nl_cache, "_cache", nl_cache.NLCache(tmp_path / "nl_cache.db"))
+    monkeypatch.setattr(few_shot, "DEFAULT_STORE_PATH", tmp_path / "few_shot.db")
+    monkeypatch.setattr(few_shot, "_stores", {})
+    monkeypatch.setattr(result_cache, "_cache", result_cache.ResultCache(spill_dir=tmp_path / "spill"))
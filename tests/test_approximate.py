@@ -0,0 +1,84 @@
+import random
+import sqlite3
+
+import pytest
+
+import approximate
+from results import read_sql_page
+
+ROWS = 20000
+SAMPLE = 2000
+TRIALS = 60
+QUERY = "SELECT G, COUNT(*), SUM(V) AS total, AVG(V) FROM T GROUP BY G ORDER BY G;"
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "big.db")
+    rng = random.Random(7)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE G (G INTEGER PRIMARY KEY, NAME TEXT);")
+    conn.executemany("INSERT INTO G VALUES (?, ?);", [(g, f"group {g}") for g in range(4)])
+    conn.execute("CREATE TABLE T (ID INTEGER PRIMARY KEY, G INTEGER REFERENCES G (G), V REAL);")
+    # Skewed groups and values, so the intervals differ in width
+    conn.executemany("INSERT INTO T (G, V) VALUES (?, ?);",
+                     [(min(int(rng.expovariate(1.0)), 3), rng.lognormvariate(3, 1)) for _ in range(ROWS)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def exact(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {g: (count, total, mean) for g, count, total, mean in conn.execute(QUERY)}
+    finally:
+        conn.close()
+
+
+def test_rewrite_reads_the_sample_and_keeps_labels(db):
+    approximate.build(db, rows=SAMPLE)
+    query = approximate.rewrite(QUERY, db)
+    assert query.table == "T" and query.sample_table == "T_SAMPLE" and query.rate == pytest.approx(0.1)
+    assert '"T_SAMPLE"' in query.sql
+    page = approximate.finish(query, read_sql_page(query.sql, db))
+    assert page.columns == ["G", "COUNT(*)", "COUNT(*) ±95%", "total", "total ±95%", "AVG(V)", "AVG(V) ±95%",
+                            "SAMPLE_ROWS"]
+    assert sum(row[-1] for row in page.rows) == pytest.approx(SAMPLE, rel=0.2)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT MIN(V) FROM T;",
+    "SELECT COUNT(DISTINCT G) FROM T;",
+    "SELECT G, COUNT(*) FROM T GROUP BY G HAVING COUNT(*) > 100;",
+    "SELECT * FROM T WHERE V > (SELECT AVG(V) FROM T);",
+    "SELECT V FROM T;",
+    "SELECT COUNT(*) FROM G;",
+])
+def test_queries_the_sample_cannot_answer_run_exactly(db, sql):
+    approximate.build(db, rows=SAMPLE)
+    assert approximate.rewrite(sql, db) is None
+
+
+def test_joined_dimension_tables_stay_whole(db):
+    approximate.build(db, rows=SAMPLE)
+    query = approximate.rewrite("SELECT g.NAME, COUNT(*) FROM T t JOIN G g ON g.G = t.G GROUP BY g.NAME;", db)
+    assert '"T_SAMPLE" t' in query.sql and "JOIN G g" in query.sql
+
+
+def test_confidence_intervals_cover_the_exact_answer(db):
+    truth = exact(db)
+    covered = {"count": 0, "sum": 0, "avg": 0}
+    for _ in range(TRIALS):
+        approximate.build(db, rows=SAMPLE)
+        query = approximate.rewrite(QUERY, db)
+        page = approximate.finish(query, read_sql_page(query.sql, db))
+        assert not page.error
+        for g, count, count_half, total, total_half, mean, mean_half, _ in page.rows:
+            exact_count, exact_total, exact_mean = truth[g]
+            covered["count"] += abs(count - exact_count) <= count_half
+            covered["sum"] += abs(total - exact_total) <= total_half
+            covered["avg"] += abs(mean - exact_mean) <= mean_half
+    # 95% nominal; with 240 intervals per measure, under 85% would be far outside sampling noise
+    for measure, hits in covered.items():
+        assert hits / (TRIALS * len(truth)) >= 0.85, (measure, hits)
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+import batch
+from fake_llm import FakeModel
+from llm_client import LLMClient, RateLimitError, TokenBucket, set_client
+
+QUESTIONS = [
+    {"id": "count", "question": "How many students are there?"},
+    {"id": "avg", "question": "What is the average mark in each department?"},
+    {"id": "top", "question": "Which instructor teaches the most courses?"},
+]
+
+
+class FlakyModel(FakeModel):
+    """FakeModel that answers 429 while ``failing`` is set"""
+
+    failing = False
+
+    def generate(self, prompt):
+        if self.failing:
+            raise RateLimitError("429 quota exceeded")
+        return super().generate(prompt)
+
+
+@pytest.fixture
+def model():
+    model = FlakyModel()
+    previous = set_client(LLMClient(model, limiter=TokenBucket(6000), max_retries=0))
+    yield model
+    set_client(previous).close()
+
+
+@pytest.fixture
+def questions(tmp_path):
+    path = tmp_path / "questions.jsonl"
+    path.write_text("".join(json.dumps(q) + "\n" for q in QUESTIONS), encoding="utf-8")
+    return path
+
+
+def read_results(path):
+    results = {}
+    for line in path.read_text(encoding="utf-8").splitlines():
+        record = json.loads(line)
+        results[record["id"]] = record  # the last line for an id is its current result
+    return results
+
+
+def test_resume_retries_questions_whose_generation_failed(student_db, model, questions, tmp_path):
+    out = tmp_path / "results.jsonl"
+    model.failing = True
+    assert batch.run_batch(questions, out, student_db) == (3, 0, 1)
+    results = read_results(out)
+    assert results["count"]["error"] is None and results["count"]["rows"] == [[15]]
+    assert results["avg"]["retry"] and results["avg"]["error"].startswith("❌ Rate limit")
+    assert batch.completed_ids(out) == {"count"}
+
+    model.failing = False
+    assert batch.run_batch(questions, out, student_db) == (2, 1, 0)
+    results = read_results(out)
+    assert all(record["error"] is None and not record.get("retry") for record in results.values())
+    assert batch.completed_ids(out) == {"count", "avg", "top"}
+    assert batch.run_batch(questions, out, student_db) == (0, 3, 0)
+
+
+def test_an_exception_while_executing_still_writes_a_record(student_db, model, questions, tmp_path, monkeypatch):
+    class BrokenStore:
+        def search(self, question):
+            return []
+
+        def add(self, question, sql):
+            raise RuntimeError("example store is read-only")
+
+    monkeypatch.setattr(batch, "get_example_store", lambda db: BrokenStore())
+    out = tmp_path / "results.jsonl"
+    batch.run_batch(questions, out, student_db)
+    results = read_results(out)
+    assert set(results) == {"count", "avg", "top"}
+    assert results["count"]["error"] is None  # fast-path answers are not added to the store
+    assert results["avg"]["error"] == "❌ Error: RuntimeError: example store is read-only"
+    assert results["avg"]["retry"] and batch.completed_ids(out) == {"count"}
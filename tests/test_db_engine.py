@@ -0,0 +1,23 @@
+import sqlite3
+
+from db_engine import ExecutionEngine, journal_mode
+
+
+def test_engine_reads_without_touching_the_file(tmp_path):
+    path = tmp_path / "plain.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE T (N INTEGER)")
+    conn.execute("INSERT INTO T VALUES (1)")
+    conn.commit()
+    conn.close()
+    before = path.read_bytes(), path.stat().st_mtime_ns
+
+    engine = ExecutionEngine(path)
+    try:
+        assert engine.execute("SELECT N FROM T") == [(1,)]
+        assert not engine.wal_enabled
+    finally:
+        engine.close()
+    assert (path.read_bytes(), path.stat().st_mtime_ns) == before
+    assert journal_mode(path) == "delete"
+    assert not (tmp_path / "plain.db-wal").exists()
@@ -0,0 +1,42 @@
+import pytest
+
+from db_engine import get_engine
+from prompt_builder import FEW_SHOT_EXAMPLES
+from sql_guard import QueryRejected, guarded_cursor
+
+pytest.importorskip("duckdb")
+
+
+@pytest.fixture(scope="module")
+def duck_db(student_db, tmp_path_factory):
+    from duckdb_backend import copy_from_sqlite
+
+    path = str(tmp_path_factory.mktemp("duck") / "student.duckdb")
+    copy_from_sqlite(student_db, path)
+    return path
+
+
+@pytest.mark.parametrize("db", ["student_db", "duck_db"])
+def test_built_in_examples_run_on_every_backend(db, request):
+    engine = get_engine(request.getfixturevalue(db))
+    for question, sql in FEW_SHOT_EXAMPLES:
+        with guarded_cursor(engine, sql) as cur:
+            assert cur.fetchall(), question
+
+
+def test_duckdb_guard_applies_the_scan_and_join_limits(duck_db, monkeypatch):
+    engine = get_engine(duck_db)
+    monkeypatch.setattr("sql_guard.MAX_JOIN_ROWS", 100)
+    with pytest.raises(QueryRejected, match="without a usable join condition"):
+        with guarded_cursor(engine, "SELECT * FROM STUDENT s, ENROLLMENTS e;"):
+            pass
+    with pytest.raises(QueryRejected, match="without a usable join condition"):
+        with guarded_cursor(engine, "SELECT COUNT(*) FROM ENROLLMENTS a JOIN ENROLLMENTS b ON a.MARKS < b.MARKS;"):
+            pass
+    with guarded_cursor(engine, "SELECT COUNT(*) FROM STUDENT s JOIN ENROLLMENTS e ON s.STUDENT_ID = e.STUDENT_ID;") as cur:
+        assert cur.fetchall()[0][0] > 0
+
+    monkeypatch.setattr("sql_guard.MAX_SCAN_ROWS", 5)
+    with pytest.raises(QueryRejected, match="scan about"):
+        with guarded_cursor(engine, "SELECT NAME FROM STUDENT WHERE GPA > 3.5;"):
+            pass
@@ -0,0 +1,71 @@
+import pytest
+
+from fast_path import match_question
+
+
+def test_value_lookup_through_a_foreign_key(student_db):
+    match = match_question("Show all students in Data Science department", student_db)
+    assert match.sql == ("SELECT s.* FROM STUDENT s JOIN DEPARTMENTS d ON s.DEPT_ID = d.DEPT_ID "
+                         "WHERE d.DEPT_NAME = 'Data Science';")
+
+
+def test_or_between_values_of_one_column_is_in(student_db):
+    match = match_question("Students in Data Science or Computer Science", student_db)
+    assert match.sql.endswith("WHERE d.DEPT_NAME IN ('Data Science', 'Computer Science');")
+    count = match_question("How many students are in Data Science or Web Development", student_db)
+    assert count.intent == "count" and "IN ('Data Science', 'Web Development')" in count.sql
+
+
+@pytest.mark.parametrize("question", [
+    "Show students in Data Science and Web Development departments",
+    "Students in Data Science Computer Science",
+    "Students with GPA over 3.5 or in Data Science",
+    "Students in Data Science nor Computer Science",
+])
+def test_conjunctions_without_a_template_go_to_the_llm(student_db, question):
+    assert match_question(question, student_db) is None
+
+
+@pytest.mark.parametrize("question", [
+    "List students not in Data Science department",
+    "Show students without GPA greater than 3.5",
+    "Students except Data Science department",
+])
+def test_negation_goes_to_the_llm(student_db, question):
+    assert match_question(question, student_db) is None
+
+
+def test_numeric_filters(student_db):
+    assert match_question("Show students with GPA greater than or equal to 3.5", student_db).sql == \
+        "SELECT NAME, GPA FROM STUDENT WHERE GPA >= 3.5;"
+    assert match_question("Students with GPA over 3.5 and semester above 2", student_db).sql == \
+        "SELECT NAME, GPA, SEMESTER FROM STUDENT WHERE GPA > 3.5 AND SEMESTER > 2;"
+
+
+
+@pytest.mark.parametrize("question, predicate", [
+    ("Show students with GPA > 3.5", "GPA > 3.5"),
+    ("Students with GPA < 3", "GPA < 3"),
+    ("Students with GPA >= 3.5", "GPA >= 3.5"),
+    ("Students with GPA <= 2.5", "GPA <= 2.5"),
+    ("Students with GPA != 3.8", "GPA != 3.8"),
+    ("Students with GPA <> 3.8", "GPA != 3.8"),
+    ("Students with GPA = 3.8", "GPA = 3.8"),
+    ("Students with GPA>3.5", "GPA > 3.5"),
+    ("Students with GPA greater than -1", "GPA > -1"),
+    ("Students with GPA > -1", "GPA > -1"),
+])
+def test_comparison_symbols_and_signs(student_db, question, predicate):
+    assert match_question(question, student_db).sql == f"SELECT NAME, GPA FROM STUDENT WHERE {predicate};"
+
+
+@pytest.mark.parametrize("question", [
+    "Students with GPA => 3.5",
+    "Students with GPA > = 3.5",
+    "Students with GPA 3 - 4",
+    "Students with GPA 3-4",
+    "Students > 3.5",
+    "Students in Data Science with GPA >",
+])
+def test_unexplained_symbols_go_to_the_llm(student_db, question):
+    assert match_question(question, student_db) is None
@@ -0,0 +1,72 @@
+import shutil
+import sqlite3
+
+import few_shot
+from few_shot import ExampleStore
+
+SEEDS = [("How many students are there?", "SELECT COUNT(*) FROM STUDENT;")]
+
+
+def test_replaced_questions_do_not_pile_up_in_the_index(student_db, tmp_path):
+    store = ExampleStore(student_db, path=tmp_path / "examples.db", seeds=SEEDS)
+    for n in range(3 * few_shot.MAX_STALE_POSITIONS):
+        store.add("Show students with GPA greater than 3.5", f"SELECT NAME FROM STUDENT WHERE GPA > 3.5 LIMIT {n};")
+        examples = store.search("students with GPA greater than 3.5", k=1)
+        assert examples == [("Show students with GPA greater than 3.5",
+                             f"SELECT NAME FROM STUDENT WHERE GPA > 3.5 LIMIT {n};")]
+    assert store._index.size <= len(SEEDS) + 1 + few_shot.MAX_STALE_POSITIONS
+
+
+def test_least_recently_retrieved_examples_are_evicted(student_db, tmp_path):
+    store = ExampleStore(student_db, path=tmp_path / "examples.db", seeds=SEEDS, max_entries=10)
+    for n in range(10):
+        store.add(f"Show students in section {chr(65 + n)}", f"SELECT NAME FROM STUDENT WHERE SECTION = '{chr(65 + n)}';")
+    store.search("Show students in section A", k=1)
+    store.add("Show courses with more than 4 credits", "SELECT COURSE_NAME FROM COURSES WHERE CREDITS > 4;")
+
+    assert store.size() == 9
+    assert store.search("Show students in section A", k=1)[0][1].endswith("'A';")
+    assert store.search("Show students in section B", k=1)[0][1] != "SELECT NAME FROM STUDENT WHERE SECTION = 'B';"
+    # Another process sees the eviction and drops the rows from its index too
+    other = ExampleStore(student_db, path=tmp_path / "examples.db", seeds=SEEDS, max_entries=10)
+    assert len(other.search("Show students in section", k=20, min_similarity=0)) == 9 + len(SEEDS)
+
+
+def test_examples_are_not_offered_after_the_schema_changes(student_db, tmp_path):
+    db = str(tmp_path / "student.db")
+    shutil.copy(student_db, db)
+    store = ExampleStore(db, path=tmp_path / "examples.db", seeds=SEEDS)
+    sql = "SELECT NAME, NICKNAME FROM STUDENT WHERE NICKNAME IS NOT NULL;"
+    store.add("Students with a nickname", sql)
+    assert store.search("Students with a nickname", k=1) == [("Students with a nickname", sql)]
+
+    conn = sqlite3.connect(db)
+    conn.execute("ALTER TABLE STUDENT RENAME COLUMN NAME TO FULL_NAME;")
+    conn.commit()
+    conn.close()
+    assert store.search("Students with a nickname", k=1) == SEEDS
+
+
+def test_questions_differing_in_a_comparison_symbol_are_separate_examples(student_db, tmp_path):
+    store = ExampleStore(student_db, path=tmp_path / "examples.db", seeds=SEEDS)
+    store.add("Show students with GPA > 3.5", "SELECT NAME FROM STUDENT WHERE GPA > 3.5;")
+    store.add("Show students with GPA < 3.5", "SELECT NAME FROM STUDENT WHERE GPA < 3.5;")
+    assert store.size() == 2
+    assert store.search("students with GPA > 3.5", k=1)[0][1].endswith("GPA > 3.5;")
+    assert store.search("students with GPA < 3.5", k=1)[0][1].endswith("GPA < 3.5;")
+
+
+def test_rows_keyed_before_symbols_were_kept_are_rekeyed(student_db, tmp_path):
+    path = tmp_path / "examples.db"
+    store = ExampleStore(student_db, path=path, seeds=SEEDS)
+    store.add("Show students with GPA > 3.5", "SELECT NAME FROM STUDENT WHERE GPA > 3.5;")
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE examples SET question_key = 'show students with gpa 3.5';")
+    conn.execute("PRAGMA user_version = 0;")
+    conn.commit()
+    conn.close()
+
+    store = ExampleStore(student_db, path=path, seeds=SEEDS)
+    store.add("Show students with GPA < 3.5", "SELECT NAME FROM STUDENT WHERE GPA < 3.5;")
+    assert store.size() == 2
+    assert store.search("students with GPA > 3.5", k=1)[0][1].endswith("GPA > 3.5;")
@@ -0,0 +1,112 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from fake_llm import make_server
+from llm_client import HTTPModel, LLMClient, RateLimitError, SharedTokenBucket, TokenBucket
+
+PROMPT = "Schema...\n\nQuestion: How many students are there?"
+
+
+@pytest.fixture
+def fake_server():
+    """Start fake_llm servers on free ports: ``fake_server(**make_server options)`` -> (server, url)"""
+    servers = []
+
+    def start(**options):
+        server = make_server(port=0, **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def client_for(url, **options):
+    options.setdefault("limiter", TokenBucket(6000))
+    options.setdefault("backoff_base", 0.01)
+    return LLMClient(HTTPModel(url), **options)
+
+
+def test_duplicate_concurrent_prompts_make_one_upstream_call(fake_server):
+    server, url = fake_server(latency=0.3)
+    client = client_for(url)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        answers = list(pool.map(lambda _: client.generate(PROMPT), range(8)))
+    assert answers == ["SELECT COUNT(*) FROM STUDENT;"] * 8
+    assert server.requests == 1
+    assert client.stats['calls'] == 1 and client.stats['coalesced'] == 7
+    # Once answered, the prompt is no longer in flight: asking again calls the model again
+    client.generate(PROMPT)
+    assert server.requests == 2
+    client.close()
+
+
+def test_rate_limited_requests_are_retried_with_backoff(fake_server):
+    server, url = fake_server(fail_first=2)
+    client = client_for(url, max_retries=3)
+    assert client.generate(PROMPT) == "SELECT COUNT(*) FROM STUDENT;"
+    assert server.requests == 3 and client.stats['retries'] == 2
+
+    # Streams are retried the same way when the 429 comes before the first chunk
+    server, url = fake_server(fail_first=1)
+    client = client_for(url, max_retries=3)
+    assert "".join(client.stream(PROMPT)) == "SELECT COUNT(*) FROM STUDENT;"
+    assert server.requests == 2 and client.stats['retries'] == 1
+
+
+def test_retries_give_up_with_a_rate_limit_error(fake_server):
+    server, url = fake_server(fail_first=10)
+    client = client_for(url, max_retries=2)
+    with pytest.raises(RateLimitError):
+        client.generate(PROMPT)
+    assert server.requests == 3
+
+
+def test_backoff_is_jittered_and_capped():
+    client = LLMClient(None, backoff_base=1.0, backoff_max=5.0)
+    delays = [client._backoff(attempt) for attempt in range(6) for _ in range(50)]
+    assert all(0 <= delay <= 5.0 for delay in delays)
+    assert len(set(delays)) == len(delays)
+    assert max(client._backoff(0) for _ in range(50)) <= 1.0
+
+
+def test_the_bucket_throttles_upstream_calls(fake_server):
+    server, url = fake_server()
+    client = client_for(url, limiter=TokenBucket(rate_per_minute=1200, capacity=2))  # 20 per second
+    started = time.monotonic()
+    for n in range(6):
+        client.generate(f"{PROMPT} ({n})")
+    # Two calls from the burst, then one every 50 ms
+    assert time.monotonic() - started >= 4 / 20 * 0.9
+    assert server.requests == 6
+
+
+def take_tokens(path, start_at, seconds):
+    """Tokens one process takes from the shared bucket in ``seconds``, starting at wall-clock ``start_at``"""
+    bucket = SharedTokenBucket(path, rate_per_minute=1200, capacity=2)
+    time.sleep(max(start_at - time.time(), 0))
+    taken = 0
+    while time.time() < start_at + seconds:
+        if bucket.try_acquire():
+            taken += 1
+        else:
+            time.sleep(0.005)
+    return taken
+
+
+def test_the_shared_bucket_throttles_across_processes(tmp_path):
+    path = str(tmp_path / "rate_limit.db")
+    SharedTokenBucket(path).available()  # create the table before the workers race for it
+    start_at, seconds = time.time() + 1.5, 0.5
+    with multiprocessing.get_context("spawn").Pool(2) as pool:
+        taken = pool.starmap(take_tokens, [(path, start_at, seconds)] * 2)
+    # One quota for both: the burst plus 20 per second, not twice that
+    assert all(taken)
+    assert 2 + 20 * seconds * 0.6 <= sum(taken) <= 2 + 20 * seconds + 1
@@ -0,0 +1,58 @@
+import pytest
+
+from nl2sql import StatementStream
+
+
+def read(chunks):
+    statement = StatementStream()
+    for chunk in chunks:
+        if statement.feed(chunk):
+            break
+    return statement.result()
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("text, sql", [
+    ("SELECT NAME FROM STUDENT;", "SELECT NAME FROM STUDENT;"),
+    ("```sql\nSELECT NAME FROM STUDENT;\n```\nThis lists every student.", "SELECT NAME FROM STUDENT;"),
+    ("```\nSELECT NAME\nFROM STUDENT\n```", "SELECT NAME\nFROM STUDENT"),
+    ("```sql SELECT NAME FROM STUDENT;```", "SELECT NAME FROM STUDENT;"),
+    ("```SQL SELECT NAME FROM STUDENT```", "SELECT NAME FROM STUDENT"),
+    ("```SELECT 1```", "SELECT 1"),
+    ("`SELECT 1;`", "SELECT 1;"),
+    ("`SELECT 1`", "SELECT 1"),
+    ("  SELECT 1", "SELECT 1"),
+    ("SELECT `NAME` FROM STUDENT;", "SELECT `NAME` FROM STUDENT;"),
+])
+@pytest.mark.parametrize("size", [1, 3, 1000])
+def test_statement_in_fenced_and_single_line_output(text, sql, size):
+    assert read(chunked(text, size)) == sql
+
+
+@pytest.mark.parametrize("size", [1, 4, 1000])
+def test_semicolons_in_literals_and_comments_do_not_end_the_statement(size):
+    text = "SELECT NAME FROM STUDENT WHERE ADDRESS = 'Flat 2; Block B' -- one; two\nAND GPA > 3; SELECT 2;"
+    assert read(chunked(text, size)) == \
+        "SELECT NAME FROM STUDENT WHERE ADDRESS = 'Flat 2; Block B' -- one; two\nAND GPA > 3;"
+
+
+def test_reading_stops_at_the_end_of_the_statement():
+    statement = StatementStream()
+    assert not statement.feed("```sql\nSELECT NAME ")
+    assert statement.partial() == "SELECT NAME"
+    assert statement.feed("FROM STUDENT;\n")
+    assert statement.feed("```\nTrailing commentary")
+    assert statement.result() == "SELECT NAME FROM STUDENT;"
+
+
+def test_a_possible_fence_is_not_shown_as_sql():
+    statement = StatementStream()
+    statement.feed("``")
+    assert statement.partial() == ""
+    statement.feed("`sq")
+    assert statement.partial() == ""
+    statement.feed("l\n")
+    assert statement.partial() == ""
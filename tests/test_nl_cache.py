@@ -0,0 +1,103 @@
+import pytest
+
+from nl_cache import NLCache, same_meaning, normalize_question
+
+FP = "fp"
+
+
+UNRELATED = [
+    "How many courses are offered?",
+    "What is the average mark per department?",
+    "Which instructor teaches the most courses?",
+    "List every course and its credits",
+    "Show each instructor and their salary",
+    "Show the budget of every department",
+    "How many students are in each department?",
+    "List all enrollments",
+]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = NLCache(tmp_path / "cache.db")
+    # A realistic index: with other questions cached, shared words like "students" weigh less
+    for n, question in enumerate(UNRELATED):
+        cache.put(question, FP, f"SELECT {n};")
+    return cache
+
+
+def test_exact_and_paraphrase_hits(cache):
+    cache.put("Show students with GPA greater than 3.5", FP, "SELECT * FROM STUDENT WHERE GPA > 3.5;")
+    assert cache.get("show students with GPA greater than 3.5?", FP)[1] == 'exact'
+    assert cache.get("List students with GPA greater than 3.5", FP) == ("SELECT * FROM STUDENT WHERE GPA > 3.5;",
+                                                                       'similar')
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("Show students with GPA greater than 3.5", "Show students with GPA less than 3.5"),
+    ("List students in Data Science department", "List students not in Data Science department"),
+    ("Students in Data Science and Computer Science", "Students in Data Science or Computer Science"),
+    ("Show students with GPA greater than 3.5", "Show students with GPA greater than 3.0"),
+    ("Courses with more than 3 credits", "Courses without more than 3 credits"),
+])
+def test_paraphrase_that_changes_the_meaning_is_not_served(cache, cached, asked):
+    cache.put(cached, FP, "SELECT 1;")
+    assert cache.get(asked, FP) is None
+    assert cache.stats['rejected'] == 1
+    # Close enough that only the meaning check keeps it from being served; still offered for display
+    assert cache.suggest(asked, FP) == (normalize_question(cached), "SELECT 1;")
+
+
+def test_suggest_ignores_servable_and_unrelated_questions(cache):
+    cache.put("Show students with GPA greater than 3.5", FP, "SELECT 1;")
+    assert cache.suggest("List students with GPA greater than 3.5", FP) is None
+    assert cache.suggest("How many courses are offered?", FP) is None
+
+
+def test_entries_are_scoped_to_the_fingerprint(cache):
+    cache.put("How many students are there?", FP, "SELECT COUNT(*) FROM STUDENT;")
+    assert cache.get("How many students are there?", "other") is None
+
+
+def test_same_meaning():
+    assert same_meaning("students with gpa over 3", "list students having gpa over 3")
+    assert not same_meaning("students with gpa over 3", "students with gpa under 3")
+    assert not same_meaning("students except seniors", "students and seniors")
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("Show students with GPA > 3.5", "Show students with GPA < 3.5"),
+    ("Show students with GPA >= 3.5", "Show students with GPA != 3.5"),
+    ("Show students with GPA <= 3.5", "Show students with GPA <> 3.5"),
+    ("Courses with marks below -5", "Courses with marks below 5"),
+    ("Show students with GPA > 3.5", "Show students with GPA 3.5"),
+])
+def test_comparison_symbols_and_signs_are_part_of_the_key(cache, cached, asked):
+    assert normalize_question(cached) != normalize_question(asked)
+    cache.put(cached, FP, "SELECT 1;")
+    assert cache.get(asked, FP) is None
+    assert cache.get(cached.replace(" ", "  ") + "?", FP) == ("SELECT 1;", 'exact')
+
+
+def test_normalize_question_spells_out_symbols():
+    assert normalize_question("GPA>=3.5 and marks < -2, full-time") == "gpa ge 3.5 and marks lt neg 2 full time"
+    assert same_meaning(normalize_question("List students with GPA > 3"), normalize_question("students having GPA > 3"))
+    assert not same_meaning(normalize_question("GPA > 3"), normalize_question("GPA < 3"))
+
+
+def test_entries_keyed_before_symbols_were_kept_are_dropped(tmp_path):
+    import sqlite3
+
+    path = tmp_path / "old_cache.db"
+    NLCache(path).put("How many students are there?", FP, "SELECT COUNT(*) FROM STUDENT;")
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO nl_cache VALUES (?, 'show students with gpa 3.5', 'Show students with GPA > 3.5', "
+                 "'SELECT 1;', 1e12, 1e12, 0);", (FP,))
+    conn.execute("PRAGMA user_version = 0;")
+    conn.commit()
+    conn.close()
+
+    cache = NLCache(path)
+    assert cache.size() == 1
+    assert cache.get("Show students with GPA 3.5", FP) is None
+    assert cache.get("How many students are there?", FP)[1] == 'exact'
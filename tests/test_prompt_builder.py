@@ -0,0 +1,87 @@
+import pytest
+
+from prompt_builder import (FEW_SHOT_EXAMPLES, FULL_SCHEMA_MAX_TABLES, build_prompt, build_refinement_prompt,
+                            refinement_schema, select_schema)
+from schema_catalog import get_catalog
+
+
+def table(*columns, fks=()):
+    return {
+        'columns': [(i, name, "TEXT", 0, None, int(i == 0)) for i, name in enumerate(columns)],
+        'foreign_keys': [(n, 0, parent, column, column, "NO ACTION", "NO ACTION", "NONE")
+                         for n, (column, parent) in enumerate(fks)],
+        'indexes': [],
+        'row_count': 100,
+    }
+
+
+# A schema wider than FULL_SCHEMA_MAX_TABLES: the student tables plus unrelated ones
+WIDE = {
+    "DEPARTMENTS": table("DEPT_ID", "DEPT_NAME", "BUILDING"),
+    "STUDENT": table("STUDENT_ID", "NAME", "GPA", "DEPT_ID", fks=[("DEPT_ID", "DEPARTMENTS")]),
+    "COURSES": table("COURSE_ID", "COURSE_NAME", "CREDITS"),
+    "ENROLLMENTS": table("ENROLLMENT_ID", "STUDENT_ID", "COURSE_ID", "MARKS",
+                         fks=[("STUDENT_ID", "STUDENT"), ("COURSE_ID", "COURSES")]),
+    **{f"WAREHOUSE_{n}": table(f"ITEM_{n}_ID", f"STOCK_{n}", f"SHELF_{n}") for n in range(FULL_SCHEMA_MAX_TABLES)},
+}
+RELATIONSHIPS = [
+    {'from_table': name, 'from_column': fk[3], 'to_table': fk[2], 'to_column': fk[4]}
+    for name, info in WIDE.items() for fk in info['foreign_keys']
+]
+
+
+def test_small_schemas_are_sent_whole(student_db):
+    catalog = get_catalog(student_db)
+    schema = select_schema("How many students are there?", catalog.table_structure(), catalog.relationships())
+    assert {"STUDENT", "COURSES", "ENROLLMENTS", "DEPARTMENTS", "INSTRUCTORS"} <= set(schema)
+
+
+def test_wide_schemas_keep_matching_tables_and_their_join_path():
+    schema = select_schema("Average marks of students in each department", WIDE, RELATIONSHIPS)
+    assert {"STUDENT", "ENROLLMENTS", "DEPARTMENTS"} <= set(schema)
+    assert not any(name.startswith("WAREHOUSE") for name in schema)
+    # Matched tables keep their keys, so the joins can still be written
+    assert "STUDENT_ID" in schema["ENROLLMENTS"] and "MARKS" in schema["ENROLLMENTS"]
+
+    # COURSES is only reachable from DEPARTMENTS through STUDENT and ENROLLMENTS
+    schema = select_schema("Course names per department", WIDE, RELATIONSHIPS)
+    assert {"COURSES", "DEPARTMENTS", "STUDENT", "ENROLLMENTS"} <= set(schema)
+
+
+def test_examples_need_every_table_they_read():
+    prompt = build_prompt("Show warehouse 3 stock", WIDE, RELATIONSHIPS)
+    assert "WAREHOUSE_3:" in prompt and "STUDENT:" not in prompt
+    assert "Examples:" not in prompt
+
+    prompt = build_prompt("How many students are there?", WIDE, RELATIONSHIPS, dialect="duckdb")
+    assert "SELECT COUNT(*) FROM STUDENT;" in prompt and "DuckDB" in prompt
+    assert "Krish Naik" not in prompt  # that example also reads COURSES and ENROLLMENTS
+
+
+def test_summary_tables_replace_the_aggregate_examples(student_db, tmp_path):
+    import shutil
+
+    import summaries
+
+    path = str(tmp_path / "student.db")
+    shutil.copy(student_db, path)
+    summaries.build(path)
+    catalog = get_catalog(path)
+    prompt = build_prompt("Average marks by department", catalog.table_structure(), catalog.relationships(),
+                          examples=FEW_SHOT_EXAMPLES)
+    assert "DEPARTMENT_SUMMARY:" in prompt and "Precomputed aggregates" in prompt
+    assert "FROM DEPARTMENT_SUMMARY ds" in prompt
+    assert "AVG(e.MARKS)" not in prompt
+
+
+@pytest.mark.parametrize("follow_up, added", [
+    ("sorted by GPA", set()),
+    ("with their department name", {"DEPARTMENTS"}),
+    ("only those taking a course", {"COURSES", "ENROLLMENTS"}),
+])
+def test_refinements_send_the_previous_tables_and_what_the_follow_up_adds(follow_up, added):
+    previous = "SELECT NAME, GPA FROM STUDENT WHERE GPA > 3.5;"
+    schema = refinement_schema(previous, follow_up, WIDE, RELATIONSHIPS)
+    assert set(schema) == {"STUDENT"} | added
+    prompt = build_refinement_prompt("Students with GPA above 3.5", previous, follow_up, WIDE, RELATIONSHIPS)
+    assert f"Previous SQL: {previous}" in prompt and "Examples:" not in prompt
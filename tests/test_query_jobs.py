@@ -0,0 +1,34 @@
+from query_jobs import QueryJobQueue
+from results import ArrowPage
+from sql_repair import RepairRequest
+
+BROKEN = "SELECT NAMES FROM STUDENT;"
+
+
+def test_job_repairs_failed_generated_sql_on_its_worker(student_db):
+    queue = QueryJobQueue(workers=1, max_heavy=1)
+    job = queue.submit(BROKEN, student_db, columnar=True,
+                       repair=RepairRequest("Names of all students", BROKEN, None))
+    assert job.wait(10)
+    assert job.state == "done"
+    assert job.repair_result.fixes == ["column_name"]
+    assert job.repair_result.sql == "SELECT NAME FROM STUDENT;"
+    assert isinstance(job.page, ArrowPage) and job.page.table.column_names == ["NAME"]
+
+
+def test_job_without_a_repair_request_reports_the_error(student_db):
+    queue = QueryJobQueue(workers=1, max_heavy=1)
+    job = queue.submit(BROKEN, student_db, columnar=True)
+    assert job.wait(10)
+    assert job.state == "failed" and "NAMES" in job.page.error and job.repair_result is None
+
+
+def test_cancelled_job_is_not_repaired(student_db):
+    queue = QueryJobQueue(workers=1, max_heavy=1)
+    blocker = queue.submit("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) "
+                           "SELECT COUNT(*) FROM n;", student_db)
+    job = queue.submit(BROKEN, student_db, repair=RepairRequest("Names of all students", BROKEN, None))
+    job.cancel()
+    blocker.cancel()
+    assert job.wait(10) and blocker.wait(10)
+    assert job.state == "cancelled" and job.repair_result is None
@@ -0,0 +1,34 @@
+import sqlite3
+
+import pytest
+
+from query_log import QueryLog, get_query_log
+from results import read_sql_arrow, read_sql_page
+
+SQL = "SELECT NAME, GPA FROM STUDENT WHERE GPA > 3.5;"
+
+
+@pytest.mark.parametrize("read", [read_sql_page, read_sql_arrow])
+def test_result_cache_hits_count_in_the_workload(student_db, read):
+    for _ in range(3):
+        assert not read(SQL, student_db).error
+    (entry,) = get_query_log().workload(student_db)
+    assert entry['count'] == 3 and entry['cache_hits'] == 2
+    assert entry['plan'] and entry['avg_ms'] is not None
+
+
+def test_logs_written_before_cache_hits_were_recorded_are_migrated(tmp_path):
+    path = tmp_path / "old_log.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE executions (id INTEGER PRIMARY KEY AUTOINCREMENT, executed_at REAL NOT NULL, "
+                 "db_path TEXT NOT NULL, sql TEXT NOT NULL, shape TEXT NOT NULL, plan TEXT NOT NULL, "
+                 "latency_ms REAL NOT NULL, error TEXT);")
+    conn.execute("INSERT INTO executions (executed_at, db_path, sql, shape, plan, latency_ms) "
+                 "VALUES (1, ?, 'SELECT 1', 'SELECT ?', '[]', 5);", (str(tmp_path / "x.db"),))
+    conn.commit()
+    conn.close()
+
+    log = QueryLog(path)
+    log.record(tmp_path / "x.db", "SELECT 2", [], 0.1, cached=True)
+    (entry,) = log.workload(tmp_path / "x.db")
+    assert (entry['count'], entry['cache_hits'], entry['avg_ms']) == (2, 1, 5)
@@ -0,0 +1,81 @@
+import sqlite3
+
+import pyarrow as pa
+import pytest
+
+from query_jobs import QueryJobQueue
+from result_cache import ResultCache, set_result_cache
+from results import ArrowPage, read_sql_arrow, read_sql_page
+
+SQL = "SELECT N, X FROM T ORDER BY N"
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "cache.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE T (N INTEGER, X NUMERIC)")
+    conn.executemany("INSERT INTO T VALUES (?, ?)", [(n, n if n % 2 else n + 0.5) for n in range(100)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResultCache(spill_dir=tmp_path / "spill")
+    previous = set_result_cache(cache)
+    yield cache
+    set_result_cache(previous)
+    cache.clear()
+
+
+def test_row_pages_round_trip_through_memory_and_spill(db, tmp_path):
+    rows = [(n, n if n % 2 else n + 0.5) for n in range(10)]
+    for cache in (ResultCache(spill_dir=tmp_path), ResultCache(spill_threshold=0, spill_dir=tmp_path)):
+        assert cache.put(db, SQL, 0, 10, ["N", "X"], rows, True) in ('memory', 'disk')
+        assert cache.get(db, SQL, 0, 10) == (["N", "X"], rows, True)
+        cache.clear()
+
+
+def test_arrow_pages_are_kept_apart_from_row_pages(db, tmp_path):
+    table = pa.table({"N": [1, 2], "X": [1.5, 2.0]})
+    for where, cache in (('memory', ResultCache(spill_dir=tmp_path)),
+                         ('disk', ResultCache(spill_threshold=0, spill_dir=tmp_path))):
+        assert cache.put_table(db, SQL, 0, 2, table, False) == where
+        assert cache.get(db, SQL, 0, 2) is None
+        cached, has_more = cache.get_table(db, SQL, 0, 2)
+        assert cached.equals(table) and not has_more
+        cache.clear()
+
+
+def test_read_sql_arrow_serves_repeats_from_the_cache_until_the_data_changes(db, cache):
+    first = read_sql_arrow(SQL, db, limit=10)
+    assert cache.stats['misses'] == 1
+    again = read_sql_arrow(SQL, db, limit=10)
+    assert cache.stats['hits'] == 1 and again.table.equals(first.table)
+
+    conn = sqlite3.connect(db)
+    conn.execute("DELETE FROM T WHERE N = 0")
+    conn.commit()
+    conn.close()
+    changed = read_sql_arrow(SQL, db, limit=10)
+    assert cache.stats['stale'] == 1
+    assert changed.table.column("N")[0].as_py() == 1
+
+
+def test_read_sql_page_and_arrow_agree(db, cache):
+    page = read_sql_page(SQL, db, offset=5, limit=20)
+    arrow = read_sql_arrow(SQL, db, offset=5, limit=20)
+    assert [tuple(row.values()) for row in arrow.table.to_pylist()] == [
+        (n, float(x)) for n, x in page.rows]
+    assert arrow.has_more == page.has_more
+
+
+def test_columnar_job_returns_an_arrow_page(db, cache):
+    queue = QueryJobQueue(workers=1, max_heavy=1)
+    job = queue.submit(SQL, db, limit=5, columnar=True)
+    assert job.wait(10)
+    assert isinstance(job.page, ArrowPage) and job.page.table.num_rows == 5 and job.state == "done"
+    failed = queue.submit("SELECT nope FROM T", db, columnar=True)
+    assert failed.wait(10) and failed.state == "failed" and failed.page.table is None
@@ -0,0 +1,58 @@
+import sqlite3
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from results import arrow_table, concat_arrow, export_parquet, read_sql_arrow
+
+ROWS = 25000  # more than one export batch (10000 rows)
+
+
+@pytest.fixture
+def mixed_db(tmp_path):
+    """GPA is DECIMAL (NUMERIC affinity): whole values are stored as integers, the rest as reals"""
+    path = str(tmp_path / "mixed.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE T (ID INTEGER PRIMARY KEY, GPA DECIMAL(3,2), N INTEGER, NAME TEXT)")
+    conn.executemany("INSERT INTO T (GPA, N, NAME) VALUES (?, ?, ?)",
+                     [(3.0 if n < 15000 else 3.5, n, f"s{n}") for n in range(ROWS)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_export_parquet_widens_a_numeric_column_whose_first_batch_is_whole(mixed_db):
+    table = pq.read_table(export_parquet("SELECT GPA, N FROM T", mixed_db))
+    assert table.schema.field("GPA").type == pa.float64()
+    assert table.schema.field("N").type == pa.int64()
+    assert table.num_rows == ROWS
+    assert table.column("GPA").to_pylist()[-1] == 3.5
+
+
+def test_export_parquet_widens_an_expression_that_turns_real(mixed_db):
+    sql = "SELECT N, CASE WHEN N < 20000 THEN N ELSE N + 0.5 END AS X FROM T"
+    table = pq.read_table(export_parquet(sql, mixed_db))
+    assert table.schema.field("X").type == pa.float64()
+    assert table.column("X").to_pylist()[-1] == ROWS - 1 + 0.5
+
+
+def test_export_parquet_rejects_text_in_an_integer_column(mixed_db):
+    with pytest.raises(ValueError, match="mixes value types"):
+        export_parquet("SELECT CASE WHEN N < 20000 THEN N ELSE NAME END AS Y FROM T", mixed_db)
+
+
+def test_arrow_table_unifies_types_across_pages():
+    first = arrow_table(["x", "y"], [(1, None), (2, None)])
+    second = arrow_table(["x", "y"], [(2.5, "a")])
+    table = concat_arrow([first, second])
+    assert table.schema.types == [pa.float64(), pa.string()]
+    assert table.column("x").to_pylist() == [1.0, 2.0, 2.5]
+
+
+def test_read_sql_arrow_pages(mixed_db):
+    page = read_sql_arrow("SELECT N FROM T ORDER BY N", mixed_db, offset=ROWS - 3, limit=2)
+    assert page.table.column("N").to_pylist() == [ROWS - 3, ROWS - 2]
+    assert page.has_more
+    last = read_sql_arrow("SELECT N FROM T ORDER BY N", mixed_db, offset=ROWS - 1, limit=2)
+    assert last.table.num_rows == 1 and not last.has_more
@@ -0,0 +1,82 @@
+import sqlite3
+
+import pytest
+
+from db_engine import get_engine
+from schema_catalog import get_catalog
+from sql_guard import (QueryCancelled, QueryRejected, check_plan, check_statement, execution_budget,
+                       guarded_cursor)
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT * FROM STUDENT;", "SELECT * FROM STUDENT;"),
+    ("```sql\nSELECT 1;\n```", "SELECT 1;"),
+    ("WITH t AS (SELECT 1 AS x) SELECT x FROM t", "WITH t AS (SELECT 1 AS x) SELECT x FROM t"),
+    ("SELECT 1; -- trailing comment", "SELECT 1;"),
+    ("SELECT 'DROP TABLE STUDENT; --' AS note;", "SELECT 'DROP TABLE STUDENT; --' AS note;"),
+    ("SELECT NAME -- the student's name\nFROM STUDENT;", "SELECT NAME -- the student's name\nFROM STUDENT;"),
+])
+def test_check_statement_accepts_single_reads(sql, expected):
+    assert check_statement(sql) == expected
+
+
+@pytest.mark.parametrize("sql, message", [
+    ("SELECT 1; SELECT 2;", "single SQL statement"),
+    ("SELECT 1; DROP TABLE STUDENT;", "single SQL statement"),
+    ("DELETE FROM STUDENT;", "read-only"),
+    ("PRAGMA writable_schema=ON;", "read-only"),
+    ("ATTACH DATABASE 'x.db' AS x;", "read-only"),
+    ("WITH t AS (SELECT 1) INSERT INTO STUDENT (NAME) SELECT * FROM t;", "INSERT"),
+    ("", "read-only"),
+])
+def test_check_statement_rejects_writes_and_batches(sql, message):
+    with pytest.raises(QueryRejected, match=message):
+        check_statement(sql)
+
+
+@pytest.fixture
+def conn(student_db):
+    conn = sqlite3.connect(f"file:{student_db}?mode=ro", uri=True)
+    yield conn
+    conn.close()
+
+
+def test_check_plan_rejects_large_scans_and_cartesian_joins(student_db, conn):
+    tables = get_catalog(student_db).table_structure()
+    students = tables['STUDENT']['row_count']
+    assert check_plan(conn, "SELECT NAME FROM STUDENT WHERE STUDENT_ID = 1;", tables, max_scan_rows=1)
+    with pytest.raises(QueryRejected, match=f"scan about {students:,} rows"):
+        check_plan(conn, "SELECT NAME FROM STUDENT WHERE GPA > 3.5;", tables, max_scan_rows=students - 1)
+
+    cross = "SELECT * FROM STUDENT s, COURSES c;"
+    product = students * tables['COURSES']['row_count']
+    with pytest.raises(QueryRejected, match="without a usable join condition"):
+        check_plan(conn, cross, tables, max_join_rows=product - 1)
+    assert check_plan(conn, cross, tables, max_join_rows=product)
+    # With the join predicate, the inner table is searched by key instead of scanned
+    check_plan(conn, "SELECT * FROM STUDENT s JOIN ENROLLMENTS e ON e.STUDENT_ID = s.STUDENT_ID;", tables,
+               max_join_rows=tables['ENROLLMENTS']['row_count'])
+
+
+def test_execution_budget_interrupts_runaway_queries(conn):
+    endless = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n;"
+    with pytest.raises(QueryCancelled, match="budget"):
+        with execution_budget(conn, timeout=0.2):
+            conn.execute(endless).fetchall()
+    with pytest.raises(QueryCancelled, match="100000 VM steps"):
+        with execution_budget(conn, timeout=0, max_steps=100000):
+            conn.execute(endless).fetchall()
+    assert conn.execute("SELECT 1;").fetchone() == (1,)
+
+
+def test_guarded_cursor_runs_reads_and_refuses_writes(student_db, monkeypatch):
+    engine = get_engine(student_db)
+    with guarded_cursor(engine, "SELECT COUNT(*) FROM STUDENT;") as cur:
+        assert cur.fetchone()[0] > 0
+    with pytest.raises(QueryRejected):
+        with guarded_cursor(engine, "UPDATE STUDENT SET GPA = 4;"):
+            pass
+    monkeypatch.setattr("sql_guard.MAX_SCAN_ROWS", 1)
+    with pytest.raises(QueryRejected, match="Add a filter"):
+        with guarded_cursor(engine, "SELECT * FROM ENROLLMENTS;"):
+            pass
@@ -0,0 +1,68 @@
+import shutil
+import sqlite3
+
+import pytest
+
+import summaries
+
+
+@pytest.fixture
+def db(student_db, tmp_path):
+    path = str(tmp_path / "student.db")
+    shutil.copy(student_db, path)
+    summaries.build(path)
+    return path
+
+
+def snapshot(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {name: sorted(conn.execute(f"SELECT * FROM {name};").fetchall()) for name in summaries.SUMMARY_TABLES}
+    finally:
+        conn.close()
+
+
+def assert_matches_recompute(path):
+    maintained = snapshot(path)
+    summaries.build(path)
+    recomputed = snapshot(path)
+    for name in summaries.SUMMARY_TABLES:
+        assert [key for key, *_ in maintained[name]] == [key for key, *_ in recomputed[name]], name
+        for kept, fresh in zip(maintained[name], recomputed[name]):
+            assert kept == pytest.approx(fresh), name
+
+
+WRITES = [
+    # New enrollments, one without marks or attendance
+    "INSERT INTO ENROLLMENTS (STUDENT_ID, COURSE_ID, ENROLLMENT_DATE, GRADE, MARKS, ATTENDANCE_PERCENTAGE, STATUS) "
+    "VALUES (1, 2, '2024-01-10', 'A', 91, 97.5, 'Active'), (2, 3, '2024-01-11', NULL, NULL, NULL, 'Active');",
+    "UPDATE ENROLLMENTS SET MARKS = NULL WHERE ENROLLMENT_ID = (SELECT MIN(ENROLLMENT_ID) FROM ENROLLMENTS);",
+    "UPDATE ENROLLMENTS SET MARKS = MARKS + 5, ATTENDANCE_PERCENTAGE = 60 WHERE STUDENT_ID = 3;",
+    # An enrollment moved to another student (another department) and another course
+    "UPDATE ENROLLMENTS SET STUDENT_ID = 4, COURSE_ID = 1 WHERE ENROLLMENT_ID = (SELECT MAX(ENROLLMENT_ID) FROM ENROLLMENTS);",
+    "DELETE FROM ENROLLMENTS WHERE STUDENT_ID = 5;",
+    # A student changing department carries their enrollments along
+    "UPDATE STUDENT SET DEPT_ID = (SELECT MAX(DEPT_ID) FROM DEPARTMENTS) WHERE STUDENT_ID = 6;",
+    # A course handed to another instructor
+    "UPDATE COURSES SET INSTRUCTOR_ID = (SELECT MAX(INSTRUCTOR_ID) FROM INSTRUCTORS) WHERE COURSE_ID = 2;",
+    "INSERT INTO STUDENT (NAME, EMAIL, DEPT_ID, GPA, STATUS) VALUES ('New Student', 'new@student.edu', 1, 3.1, 'Active');",
+    "DELETE FROM ENROLLMENTS WHERE STUDENT_ID = 7; DELETE FROM STUDENT WHERE STUDENT_ID = 7;",
+]
+
+
+@pytest.mark.parametrize("write", WRITES)
+def test_triggers_match_a_full_recompute(db, write):
+    conn = sqlite3.connect(db)
+    conn.executescript(write)
+    conn.commit()
+    conn.close()
+    assert_matches_recompute(db)
+
+
+def test_triggers_match_a_full_recompute_after_many_writes(db):
+    conn = sqlite3.connect(db)
+    for write in WRITES:
+        conn.executescript(write)
+    conn.commit()
+    conn.close()
+    assert_matches_recompute(db)